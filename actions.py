@@ -1,76 +1,116 @@
-from typing import Literal
-from playwright.sync_api import Page, TimeoutError as PlaywrightTimeoutError
-import time
-import re
+import logging
+from typing import Callable, List, Literal
+from playwright.sync_api import ElementHandle, Page, TimeoutError as PlaywrightTimeoutError
 
-from browser_state import get_browser_state
+from browser_state import expand_subtree, snapshot_page
+import prefetch
+from refs import parse_ref
+from resolver import resolve
+from settle import wait_for_settle
+from snapshot_tracker import get_tracker, render_state
+import tracing
+
+logger = logging.getLogger(__name__)
+
+STEP_ACTIONS = ("click", "type", "select", "press")
+# Settle quiet window between the steps of run_actions
+STEP_QUIET_MS = 50
+# The element is resolved, visible and enabled by then, so this only covers
+# Playwright's own actionability checks (an animation, an overlay)
+INTERACT_TIMEOUT_MS = 2000
 
 
 def _get_browser_state(
-    page: Page, wait: bool = False, max_attempts: int = 5, delay: float = 0.2
+    page: Page, wait: bool = False, max_attempts: int = 5, delay: float = 0.2, action: str = ""
 ) -> dict:
     if wait:
-        page.wait_for_timeout(1000)
+        # The page is snapshotted while it settles, see prefetch.py
+        wait_for_settle(page, action, speculate=prefetch.PREFETCH_SNAPSHOTS)
 
     last_exc = None
     for _ in range(max_attempts):
         try:
-            return {
-                "snapshot": get_browser_state(page),
-                "url": page.url,
-                "title": page.title(),
-            }
+            with tracing.span("snapshot"):
+                # Taken while the page settled, or the last one, if the page didn't change since
+                snapshot = prefetch.take_warm(page)
+                tracing.annotate(warm=snapshot is not None)
+                if snapshot is None:
+                    snapshot = snapshot_page(page)
+            return render_state(page, snapshot)
         except Exception as e:
             last_exc = e
-            time.sleep(delay)
+            tracing.increment("snapshot_retries")
+            # Usually a navigation destroyed the execution context, wait for the
+            # new document rather than sleeping a fixed delay
+            try:
+                page.wait_for_load_state("domcontentloaded", timeout=delay * 1000)
+            except PlaywrightTimeoutError:
+                pass
     raise RuntimeError(
         f"Failed to get browser state after {max_attempts} attempts: {last_exc}"
     )
 
 
-def _ref_to_selector(ref: str) -> str:
+def _resolve_element(page: Page, selector: str, field: bool = False) -> ElementHandle:
     """
-    Converts a [ref=...] string to a CSS attribute selector.
-    E.g. [ref=e8] -> [ref="e8"]
+    Resolves a ref, role and name, text or CSS selector without waiting (see
+    resolver.py). Fails with the closest matches if nothing matches well.
     """
-    # If already a valid CSS selector, return as is
-    if ref.startswith("[ref="):
-        # Extract the value inside [ref=...]
-        m = re.match(r"\[ref=['\"]?([^\]'\"]+)['\"]?\]", ref)
-        if m:
-            value = m.group(1)
-            return f'[ref="{value}"]'
-        return ref
-    # If not a [ref=...] string, treat as a CSS selector and add brackets if needed
-    # If the selector looks like a bare word (e.g. e16), treat as [ref="e16"]
-    if re.match(r"^[a-zA-Z0-9_\-]+$", ref):
-        return f'[ref="{ref}"]'
-    return ref
+    with tracing.span("resolve"):
+        element, match = resolve(page, selector, field=field)
+        tracing.annotate(by=match["by"], confidence=match["score"])
+    if match["by"] not in ("ref", "css"):
+        logger.info(f"Resolved '{selector}' to {match['ref']} by {match['by']} ({match['score']:.2f})")
+    return element
 
 
 def go_to(page: Page, url: str) -> dict:
     page.goto(url, wait_until="domcontentloaded")
-    return _get_browser_state(page, wait=True)
+    return _get_browser_state(page, wait=True, action="go_to")
 
 
 def go_back(page: Page) -> dict:
     page.go_back(wait_until="domcontentloaded")
-    return _get_browser_state(page, wait=True)
+    return _get_browser_state(page, wait=True, action="go_back")
 
 
-def click(page: Page, selector: str) -> dict:
-    selector = _ref_to_selector(selector)
+def _interact(
+    page: Page, selector: str, action: str, fn: Callable[[ElementHandle], object], field: bool = False
+) -> None:
+    """
+    Resolves the element and runs fn on it, turning Playwright errors into the
+    ValueError messages the agent sees.
+    """
+    element = None
     try:
-        page.wait_for_selector(selector, state="visible", timeout=5000)
-        page.click(selector, timeout=5000)
+        element = _resolve_element(page, selector, field=field)
+        fn(element)
+    except ValueError:
+        raise
     except PlaywrightTimeoutError as e:
         raise ValueError(
-            f"TimeoutError: click Could not find or interact with selector '{selector}': {e}"
+            f"TimeoutError: {action} Could not find or interact with selector '{selector}': {e}"
         )
     except Exception as e:
-        raise ValueError(f"Exception during click for selector '{selector}': {e}")
+        raise ValueError(f"Exception during {action} for selector '{selector}': {e}")
+    finally:
+        if element is not None:
+            element.dispose()
+
+
+def _type_into(element: ElementHandle, text: str, clear_first: bool = True, delay: int = 0) -> None:
+    # Typed key by key rather than filled, so autocomplete widgets react. An
+    # element that is no longer editable fails in INTERACT_TIMEOUT_MS, the
+    # typing itself gets its delays on top
+    if clear_first:
+        element.fill("", timeout=INTERACT_TIMEOUT_MS)
+    element.type(text, delay=delay, timeout=INTERACT_TIMEOUT_MS + len(text) * delay)
+
+
+def click(page: Page, selector: str) -> dict:
+    _interact(page, selector, "click", lambda element: element.click(timeout=INTERACT_TIMEOUT_MS))
     # Wait for possible navigation or DOM update
-    return _get_browser_state(page, wait=True)
+    return _get_browser_state(page, wait=True, action="click")
 
 
 def scroll(page: Page, direction: Literal["down", "up"] = "down") -> dict:
@@ -78,7 +118,7 @@ def scroll(page: Page, direction: Literal["down", "up"] = "down") -> dict:
         page.evaluate("window.scrollBy(0, window.innerHeight);")
     elif direction == "up":
         page.evaluate("window.scrollBy(0, -window.innerHeight);")
-    return _get_browser_state(page, wait=True)
+    return _get_browser_state(page, wait=True, action="scroll")
 
 
 def type_text(
@@ -87,28 +127,103 @@ def type_text(
     text: str,
     clear_first: bool = True,
     delay: int = 0,
+    submit: bool = False,
 ) -> dict:
     """
     Types text into the element specified by the selector or [ref=...] reference.
-    If selector is a [ref=...] string, converts to attribute selector.
-    If selector is a bare word (e.g. e16), treats as [ref="e16"].
+    Refs ([ref=e16] or a bare e16) are resolved through the snapshot ref index,
+    anything else is used as a CSS selector.
+    If submit is True, presses Enter afterwards and only snapshots the final state.
     """
-    selector = _ref_to_selector(selector)
-    try:
-        page.wait_for_selector(selector, state="visible", timeout=5000)
-        if clear_first:
-            page.fill(selector, "")
-        page.type(selector, text, delay=delay)
-    except PlaywrightTimeoutError as e:
-        raise ValueError(
-            f"TimeoutError: type_text Could not find or interact with selector '{selector}': {e}"
-        )
-    except Exception as e:
-        raise ValueError(f"Exception during type_text for selector '{selector}': {e}")
-    return _get_browser_state(page, wait=True)
+    _interact(
+        page, selector, "type_text", lambda element: _type_into(element, text, clear_first, delay), field=True
+    )
+    if submit:
+        page.keyboard.press("Enter")
+    return _get_browser_state(page, wait=True, action="type_text")
 
 
 def submit(page: Page) -> dict:
     page.keyboard.press("Enter")
     # Wait for possible navigation or DOM update after submit
-    return _get_browser_state(page, wait=True)
+    return _get_browser_state(page, wait=True, action="submit")
+
+
+def show_more_elements(page: Page, part: int) -> str:
+    """Returns another part of the last snapshot, when it was too large to send at once."""
+    compressor = get_tracker(page).compressor
+    if compressor is None or not compressor.parts:
+        raise ValueError("There is no snapshot split into parts for this page.")
+    return compressor.part(part)
+
+
+def expand(page: Page, ref: str) -> str:
+    """
+    Shows the elements under a ref: a node's whole subtree, or what a
+    collapsed stub of a viewport-scoped snapshot left out.
+    """
+    ref_id = parse_ref(ref)
+    if ref_id is None:
+        raise ValueError(f"'{ref}' is not a ref, use one from the snapshot, e.g. e12.")
+    with tracing.span("snapshot", expand=ref_id):
+        subtree = expand_subtree(page, ref_id)
+    if subtree is None:
+        raise ValueError(f"Ref '{ref_id}' is not in the current page snapshot, the element may have been removed.")
+    return get_tracker(page).compressor.subtree(subtree, ref_id)
+
+
+def _run_step(page: Page, step: dict) -> None:
+    action = step.get("action")
+    selector = step.get("selector") or ""
+    text = step.get("text") or ""
+    if action == "click":
+        _interact(page, selector, "click", lambda element: element.click(timeout=INTERACT_TIMEOUT_MS))
+        # Just long enough for the click's handlers (a dropdown opening, a
+        # field appearing) before the next step looks for its element
+        wait_for_settle(page, "run_actions_step", quiet_ms=STEP_QUIET_MS)
+    elif action == "type":
+        _interact(page, selector, "type_text", lambda element: _type_into(element, text), field=True)
+    elif action == "select":
+        # Matches the option's value or its label
+        _interact(
+            page,
+            selector,
+            "select",
+            lambda element: element.select_option(text, timeout=INTERACT_TIMEOUT_MS),
+            field=True,
+        )
+    elif action == "press":
+        if selector:
+            _interact(page, selector, "press", lambda element: element.press(text, timeout=INTERACT_TIMEOUT_MS))
+        else:
+            try:
+                page.keyboard.press(text)
+            except Exception as e:
+                # An unknown key name ("Return", "Ctrl+A")
+                raise ValueError(f"Exception during press for key '{text}': {e}")
+        wait_for_settle(page, "run_actions_step", quiet_ms=STEP_QUIET_MS)
+    else:
+        raise ValueError(f"Unknown action '{action}', use one of {list(STEP_ACTIONS)}")
+
+
+def run_actions(page: Page, steps: List[dict]) -> dict:
+    """
+    Runs click/type/select/press steps back to back and snapshots the page
+    once at the end. Stops at the first step that fails. Returns the new
+    state, how many steps completed and the error, if any.
+    """
+    completed = 0
+    error = None
+    for i, step in enumerate(steps):
+        try:
+            _run_step(page, step)
+        except Exception as e:
+            # Earlier steps already changed the page, so the state is returned either way
+            error = f"Step {i + 1} ({step.get('action')} {step.get('selector') or ''}) failed: {e}"
+            break
+        completed += 1
+    return {
+        "new_state": _get_browser_state(page, wait=True, action="run_actions"),
+        "completed": completed,
+        "error": error,
+    }
@@ -0,0 +1,215 @@
+"""
+Async versions of the actions in actions.py, for driving many pages from one
+event loop. Behaviour and error messages match the sync versions.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Literal
+from playwright.async_api import ElementHandle, Page, TimeoutError as PlaywrightTimeoutError
+
+from async_browser_state import expand_subtree, snapshot_page
+import prefetch
+from actions import INTERACT_TIMEOUT_MS, STEP_ACTIONS, STEP_QUIET_MS
+from refs import parse_ref
+from resolver import async_resolve
+from settle import async_wait_for_settle
+from snapshot_tracker import get_tracker, render_state
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+async def _get_browser_state(
+    page: Page, wait: bool = False, max_attempts: int = 5, delay: float = 0.2, action: str = ""
+) -> dict:
+    if wait:
+        await async_wait_for_settle(page, action, speculate=prefetch.PREFETCH_SNAPSHOTS)
+
+    last_exc = None
+    for _ in range(max_attempts):
+        try:
+            with tracing.span("snapshot"):
+                snapshot = await prefetch.async_take_warm(page)
+                tracing.annotate(warm=snapshot is not None)
+                if snapshot is None:
+                    snapshot = await snapshot_page(page)
+            # Compressing a large snapshot is CPU work, kept off the event loop
+            # the other tasks' pages are driven from
+            state = await asyncio.to_thread(render_state, page, snapshot)
+            if prefetch.PREFETCH_SNAPSHOTS:
+                prefetch.preresolve(page, snapshot)
+            return state
+        except Exception as e:
+            last_exc = e
+            tracing.increment("snapshot_retries")
+            try:
+                await page.wait_for_load_state("domcontentloaded", timeout=delay * 1000)
+            except PlaywrightTimeoutError:
+                pass
+    raise RuntimeError(
+        f"Failed to get browser state after {max_attempts} attempts: {last_exc}"
+    )
+
+
+async def _resolve_element(page: Page, selector: str, field: bool = False) -> ElementHandle:
+    with tracing.span("resolve"):
+        element, match = await async_resolve(page, selector, field=field)
+        tracing.annotate(by=match["by"], confidence=match["score"])
+    if match["by"] not in ("ref", "css"):
+        logger.info(f"Resolved '{selector}' to {match['ref']} by {match['by']} ({match['score']:.2f})")
+    return element
+
+
+async def go_to(page: Page, url: str) -> dict:
+    await page.goto(url, wait_until="domcontentloaded")
+    return await _get_browser_state(page, wait=True, action="go_to")
+
+
+async def go_back(page: Page) -> dict:
+    await page.go_back(wait_until="domcontentloaded")
+    return await _get_browser_state(page, wait=True, action="go_back")
+
+
+async def _interact(
+    page: Page,
+    selector: str,
+    action: str,
+    fn: Callable[[ElementHandle], Awaitable[object]],
+    field: bool = False,
+) -> None:
+    element = None
+    try:
+        # Resolved while the LM decided (see prefetch.py). If the element went
+        # stale since, fn fails fast and the selector is resolved again
+        element = prefetch.take_preresolved(page, selector)
+        if element is not None:
+            tracing.annotate(preresolved=True)
+            try:
+                await fn(element)
+                return
+            except PlaywrightTimeoutError:
+                raise
+            except Exception:
+                tracing.increment("preresolved_stale")
+                await element.dispose()
+                element = None
+        element = await _resolve_element(page, selector, field=field)
+        await fn(element)
+    except ValueError:
+        raise
+    except PlaywrightTimeoutError as e:
+        raise ValueError(
+            f"TimeoutError: {action} Could not find or interact with selector '{selector}': {e}"
+        )
+    except Exception as e:
+        raise ValueError(f"Exception during {action} for selector '{selector}': {e}")
+    finally:
+        if element is not None:
+            await element.dispose()
+
+
+async def _type_into(element: ElementHandle, text: str, clear_first: bool = True, delay: int = 0) -> None:
+    if clear_first:
+        await element.fill("", timeout=INTERACT_TIMEOUT_MS)
+    await element.type(text, delay=delay, timeout=INTERACT_TIMEOUT_MS + len(text) * delay)
+
+
+async def click(page: Page, selector: str) -> dict:
+    await _interact(page, selector, "click", lambda element: element.click(timeout=INTERACT_TIMEOUT_MS))
+    return await _get_browser_state(page, wait=True, action="click")
+
+
+async def scroll(page: Page, direction: Literal["down", "up"] = "down") -> dict:
+    if direction == "down":
+        await page.evaluate("window.scrollBy(0, window.innerHeight);")
+    elif direction == "up":
+        await page.evaluate("window.scrollBy(0, -window.innerHeight);")
+    return await _get_browser_state(page, wait=True, action="scroll")
+
+
+async def type_text(
+    page: Page,
+    selector: str,
+    text: str,
+    clear_first: bool = True,
+    delay: int = 0,
+    submit: bool = False,
+) -> dict:
+    await _interact(
+        page, selector, "type_text", lambda element: _type_into(element, text, clear_first, delay), field=True
+    )
+    if submit:
+        await page.keyboard.press("Enter")
+    return await _get_browser_state(page, wait=True, action="type_text")
+
+
+async def submit(page: Page) -> dict:
+    await page.keyboard.press("Enter")
+    return await _get_browser_state(page, wait=True, action="submit")
+
+
+async def show_more_elements(page: Page, part: int) -> str:
+    compressor = get_tracker(page).compressor
+    if compressor is None or not compressor.parts:
+        raise ValueError("There is no snapshot split into parts for this page.")
+    return compressor.part(part)
+
+
+async def expand(page: Page, ref: str) -> str:
+    ref_id = parse_ref(ref)
+    if ref_id is None:
+        raise ValueError(f"'{ref}' is not a ref, use one from the snapshot, e.g. e12.")
+    with tracing.span("snapshot", expand=ref_id):
+        subtree = await expand_subtree(page, ref_id)
+    if subtree is None:
+        raise ValueError(f"Ref '{ref_id}' is not in the current page snapshot, the element may have been removed.")
+    return get_tracker(page).compressor.subtree(subtree, ref_id)
+
+
+async def _run_step(page: Page, step: dict) -> None:
+    action = step.get("action")
+    selector = step.get("selector") or ""
+    text = step.get("text") or ""
+    if action == "click":
+        await _interact(page, selector, "click", lambda element: element.click(timeout=INTERACT_TIMEOUT_MS))
+        await async_wait_for_settle(page, "run_actions_step", quiet_ms=STEP_QUIET_MS)
+    elif action == "type":
+        await _interact(page, selector, "type_text", lambda element: _type_into(element, text), field=True)
+    elif action == "select":
+        await _interact(
+            page,
+            selector,
+            "select",
+            lambda element: element.select_option(text, timeout=INTERACT_TIMEOUT_MS),
+            field=True,
+        )
+    elif action == "press":
+        if selector:
+            await _interact(page, selector, "press", lambda element: element.press(text, timeout=INTERACT_TIMEOUT_MS))
+        else:
+            try:
+                await page.keyboard.press(text)
+            except Exception as e:
+                # An unknown key name ("Return", "Ctrl+A")
+                raise ValueError(f"Exception during press for key '{text}': {e}")
+        await async_wait_for_settle(page, "run_actions_step", quiet_ms=STEP_QUIET_MS)
+    else:
+        raise ValueError(f"Unknown action '{action}', use one of {list(STEP_ACTIONS)}")
+
+
+async def run_actions(page: Page, steps: List[dict]) -> dict:
+    completed = 0
+    error = None
+    for i, step in enumerate(steps):
+        try:
+            await _run_step(page, step)
+        except Exception as e:
+            # Earlier steps already changed the page, so the state is returned either way
+            error = f"Step {i + 1} ({step.get('action')} {step.get('selector') or ''}) failed: {e}"
+            break
+        completed += 1
+    return {
+        "new_state": await _get_browser_state(page, wait=True, action="run_actions"),
+        "completed": completed,
+        "error": error,
+    }
@@ -0,0 +1,18 @@
+from typing import Dict, Any, Optional
+from playwright.async_api import Page
+
+from browser_state import SNAPSHOT_JS, serialize_snapshot, snapshot_options
+
+
+async def snapshot_page(page: Page, scope: Optional[str] = None) -> Dict[str, Any]:
+    """Async version of browser_state.snapshot_page."""
+    return await page.evaluate(SNAPSHOT_JS, snapshot_options(scope))
+
+
+async def expand_subtree(page: Page, ref: str) -> Optional[Dict[str, Any]]:
+    """Async version of browser_state.expand_subtree."""
+    return await page.evaluate(SNAPSHOT_JS, {**snapshot_options(), "root": ref})
+
+
+async def get_browser_state(page: Page) -> str:
+    return serialize_snapshot(await snapshot_page(page), page.viewport_size)
@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Literal, Optional
+
+import dspy
+from playwright.async_api import async_playwright
+
+import async_actions
+from async_tabs import AsyncTabs
+import network_profile
+from browser_pool import BrowserPool
+from custom_react import ReActTruncated
+from decision_cache import DecisionCache
+from main import ActionStep, BrowserAgent, ResultSchema, configure_lm
+from session_store import SessionStore, origin_of
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def make_tools(tabs: AsyncTabs, recorder=None) -> list:
+    """
+    Async versions of the agent tools in main.py, acting on the current tab.
+    Frames are only captured when a recorder (recorder.FrameRecorder) is given.
+    """
+
+    async def save_frame(action_name, extra_info=""):
+        if recorder is not None:
+            await recorder.acapture(tabs.page, action_name, extra_info)
+
+    async def go_to(url: str) -> ResultSchema:
+        """Navigates to the specified URL."""
+        new_state = await async_actions.go_to(tabs.page, url)
+        ss_info = url.replace("https://", "").replace("/", "_")
+        await save_frame("go_to", extra_info=ss_info)
+        return {"new_state": new_state, "result": "success"}
+
+    async def click(selector: str) -> ResultSchema:
+        """Clicks on the element specified by the selector: a snapshot ref (e8), a role and name (button "Search") or a CSS selector. If the click opens a new tab, switches to it."""
+        new_state = await async_actions.click(tabs.page, selector)
+        popup = tabs.take_opened()
+        if popup is not None:
+            new_state = await tabs.switch_tab(tabs.id_of(popup))
+        ss_info = selector.replace("#", "id_").replace(".", "cls_")
+        await save_frame("click", extra_info=ss_info)
+        return {"new_state": new_state, "result": "success"}
+
+    async def type_text(selector: str, text: str, submit: bool = False) -> ResultSchema:
+        """Types the given text into the element specified by the selector (a ref, role and name, label text or CSS selector). If submit is True, the text will be submitted by pressing enter."""
+        new_state = await async_actions.type_text(tabs.page, selector, text, True, submit=submit)
+        ss_info = selector.replace("#", "id_").replace(".", "cls_")
+        await save_frame("submit" if submit else "type_text", extra_info=ss_info)
+        return {"new_state": new_state, "result": "success"}
+
+    async def scroll(direction: Literal["up", "down"]) -> ResultSchema:
+        """Scrolls the page up or down."""
+        new_state = await async_actions.scroll(tabs.page, direction)
+        await save_frame("scroll", extra_info=direction)
+        return {"new_state": new_state, "result": "success"}
+
+    async def go_back() -> ResultSchema:
+        """Navigates back to the previous page."""
+        new_state = await async_actions.go_back(tabs.page)
+        await save_frame("go_back")
+        return {"new_state": new_state, "result": "success"}
+
+    async def show_more_elements(part: int) -> str:
+        """Shows another part of the current page's elements, when the snapshot says it was split into parts."""
+        return await async_actions.show_more_elements(tabs.page, part)
+
+    async def expand(ref: str) -> str:
+        """Shows the elements under a ref, e.g. the ones a collapsed node of the snapshot stands for."""
+        return await async_actions.expand(tabs.page, ref)
+
+    async def run_actions(steps: list[ActionStep]) -> ResultSchema:
+        """Runs several click/type/select/press steps in order, e.g. to fill a whole form, and returns one snapshot at the end. Stops at the first step that fails."""
+        outcome = await async_actions.run_actions(tabs.page, [step.model_dump() for step in steps])
+        await save_frame("run_actions", extra_info=f"{outcome['completed']}_of_{len(steps)}")
+        if outcome["error"]:
+            return {"new_state": outcome["new_state"], "result": "failure", "error": outcome["error"]}
+        return {"new_state": outcome["new_state"], "result": "success"}
+
+    async def new_tab(url: str = "") -> ResultSchema:
+        """Opens a new tab, optionally at the given URL, and switches to it. Other tabs keep their state."""
+        new_state = await tabs.new_tab(url or None)
+        await save_frame("new_tab", extra_info=tabs.id_of(tabs.page))
+        return {"new_state": new_state, "result": "success"}
+
+    async def switch_tab(tab_id: str) -> ResultSchema:
+        """Switches to the tab with the given id (see list_tabs). Returns instantly if the tab didn't change."""
+        new_state = await tabs.switch_tab(tab_id)
+        await save_frame("switch_tab", extra_info=tab_id)
+        return {"new_state": new_state, "result": "success"}
+
+    async def list_tabs() -> str:
+        """Lists the open tabs with their id, title and URL."""
+        return await tabs.list_tabs()
+
+    async def close_tab(tab_id: str) -> ResultSchema:
+        """Closes the tab with the given id. If it was the current tab, switches to the last open one."""
+        new_state = await tabs.close_tab(tab_id)
+        await save_frame("close_tab", extra_info=tab_id)
+        return {"new_state": new_state, "result": "success"}
+
+    return [
+        go_to,
+        click,
+        type_text,
+        scroll,
+        go_back,
+        show_more_elements,
+        expand,
+        run_actions,
+        new_tab,
+        switch_tab,
+        list_tabs,
+        close_tab,
+    ]
+
+
+async def run_task(
+    pool: BrowserPool,
+    task: str,
+    max_iters: int = 20,
+    record: bool = False,
+    cache: Optional[DecisionCache] = None,
+    trace_dir: Optional[str] = None,
+    spans: Optional[list] = None,
+    profile: Optional[str] = None,
+    network: Optional[list] = None,
+    start_url: Optional[str] = None,
+) -> dspy.Prediction:
+    """
+    Runs one task in a clean BrowserContext from the pool, seeded with the
+    stored session of start_url's origin if given. Its timing spans are
+    written to trace_dir and added to spans, and its network summary is added
+    to network, when given.
+    """
+    if profile is None:
+        # Recorded runs need images in their screenshots
+        profile = "screenshots" if record else network_profile.NETWORK_PROFILE
+    run_id = str(datetime.now().timestamp())
+    recorder = None
+    if record:
+        # PIL and the gif code are only loaded for recorded runs
+        from recorder import FrameRecorder
+
+        os.makedirs(f"frames/{run_id}", exist_ok=True)
+        recorder = FrameRecorder(f"frames/{run_id}/animation.gif", frames_dir=f"frames/{run_id}")
+
+    with tracing.trace(run_id) as tracer:
+        try:
+            origin = start_url and origin_of(start_url)
+            async with pool.page(origins=[origin] if origin else None) as page:
+                # Routed on the context so popups are covered, removed before the
+                # context goes back to the pool
+                stats = await network_profile.async_apply(page.context, profile)
+                tabs = AsyncTabs(page)
+                try:
+                    react = ReActTruncated(
+                        BrowserAgent, tools=make_tools(tabs, recorder), max_iters=max_iters, cache=cache
+                    )
+                    return await react.acall(task=task)
+                finally:
+                    tabs.detach()
+                    await stats.async_remove()
+                    logger.info(f"Network for '{task}': {stats.summary()}")
+                    if network is not None:
+                        network.append(stats.summary())
+        finally:
+            if recorder is not None:
+                await asyncio.to_thread(recorder.close)
+            if trace_dir is not None:
+                tracer.export(os.path.join(trace_dir, f"{run_id}.jsonl"))
+            if spans is not None:
+                spans.extend(tracer.spans)
+
+
+async def run_tasks(
+    tasks: list[str],
+    concurrency: int = 8,
+    browsers: int = 1,
+    headless: bool = True,
+    max_iters: int = 20,
+    record: bool = False,
+    use_cache: bool = True,
+    trace_dir: Optional[str] = None,
+    profile: Optional[str] = None,
+    use_sessions: bool = True,
+) -> list:
+    """
+    Runs all tasks on a warm pool of `browsers` Chromium instances, at most
+    `concurrency` at a time. Returns a prediction per task, or the exception it
+    failed with, in task order. With use_sessions, contexts start with the
+    cookies and storage earlier runs saved (see session_store.py).
+    """
+    configure_lm()
+    cache = DecisionCache() if use_cache else None
+    sessions = SessionStore() if use_sessions else None
+    spans: list = []
+    network: list = []
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    async with async_playwright() as p:
+        pool = BrowserPool(
+            p,
+            # No more browsers than contexts, so none of them sits empty
+            browsers=min(browsers, concurrency),
+            contexts=concurrency,
+            launch_options={"headless": headless},
+            session_store=sessions,
+        )
+        async with pool:
+
+            async def guarded(task: str):
+                try:
+                    return await run_task(
+                        pool,
+                        task,
+                        max_iters=max_iters,
+                        record=record,
+                        cache=cache,
+                        trace_dir=trace_dir,
+                        spans=spans,
+                        profile=profile,
+                        network=network,
+                    )
+                except Exception as e:
+                    logger.exception(f"Task failed: {task}")
+                    return e
+
+            # The pool only hands out `capacity` contexts, which bounds concurrency
+            results = await asyncio.gather(*(guarded(task) for task in tasks))
+            print(f"Browser pool: {pool.stats()}")
+    if cache is not None:
+        print(f"Decision cache: {cache.stats()}")
+    if sessions is not None:
+        print(f"Session store: {sessions.stats()}")
+        sessions.close()
+    print(f"Time per phase: {tracing.summarize(spans)}")
+    print(
+        f"Network: {sum(n['requests_blocked'] for n in network)} requests blocked, "
+        f"~{sum(n['est_bytes_saved'] for n in network) / 1e6:.1f}MB saved, "
+        f"{sum(n['bytes_loaded'] for n in network) / 1e6:.1f}MB loaded"
+    )
+    return results
+
+
+if __name__ == "__main__":
+    import cli
+
+    cli.main(["tasks", *sys.argv[1:]])
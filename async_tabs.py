@@ -0,0 +1,65 @@
+"""
+Async version of the tabs in tabs.py, kept apart so sync runs don't import the
+async actions.
+"""
+from typing import Optional
+
+from playwright.async_api import Page as AsyncPage
+
+import async_actions
+from browser_state import IS_STALE_JS
+from snapshot_tracker import get_tracker, render_state
+from tabs import _TabRegistry
+import tracing
+
+
+class AsyncTabs(_TabRegistry):
+    """Async version of Tabs."""
+
+    async def _state(self, page: AsyncPage) -> dict:
+        with tracing.span("tab_state"):
+            cached = self._cached(page)
+            if cached is not None and not await page.evaluate(IS_STALE_JS):
+                self.hits += 1
+                tracing.annotate(cached=True)
+                return render_state(page, cached, full=True)
+            self.misses += 1
+            tracing.annotate(cached=False)
+            get_tracker(page).reset()
+            return await async_actions._get_browser_state(page, wait=True, action="switch_tab")
+
+    async def new_tab(self, url: Optional[str] = None) -> dict:
+        self._creating = True
+        try:
+            page = await self.context.new_page()
+        finally:
+            self._creating = False
+        self._add(page)
+        self._current = page
+        if url:
+            return await async_actions.go_to(page, url)
+        return await async_actions._get_browser_state(page, action="new_tab")
+
+    async def switch_tab(self, tab_id: str) -> dict:
+        page = self._get(tab_id)
+        self._current = page
+        await page.bring_to_front()
+        return await self._state(page)
+
+    async def list_tabs(self) -> str:
+        lines = []
+        for page in list(self._ids):
+            cached = self._cached(page)
+            lines.append(self._describe(page, cached["title"] if cached else await page.title()))
+        return "\n".join(lines)
+
+    async def close_tab(self, tab_id: str) -> dict:
+        page = self._get(tab_id)
+        await page.close()
+        self._forget(page)
+        if not self._ids:
+            return await self.new_tab()
+        if page is self._current:
+            self._current = list(self._ids)[-1]
+            await self._current.bring_to_front()
+        return await self._state(self._current)
@@ -0,0 +1,339 @@
+"""
+Batch evaluation over a task dataset. Tasks are spread over worker processes,
+each running its own Playwright and warm browser (see async_main.run_task),
+so a slow page or a stuck event loop only holds back one worker.
+
+Every finished task is appended to the results JSONL right away, which is also
+the checkpoint: rerunning with the same --output skips the tasks already in
+it. Sources can be a text file (one task per line), a JSON/JSONL file or a
+Hugging Face dataset, in WebArena (intent, start_url, eval), WebVoyager (ques,
+web) or GAIA (Question, Final answer) shape. "{fixtures}" in a task or start
+URL is replaced by a local server of the benchmark fixtures, so
+
+    python batch.py benchmarks/fixture_tasks.jsonl --workers 2
+
+runs offline sites as a stand-in for the real benchmarks.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_PLACEHOLDER = "{fixtures}"
+
+# First field found is used, covering WebArena, WebVoyager, GAIA and Mind2Web
+_TASK_FIELDS = ("task", "intent", "ques", "Question", "question", "confirmed_task")
+_ID_FIELDS = ("id", "task_id", "uid")
+_URL_FIELDS = ("start_url", "web", "url", "website")
+_ANSWER_FIELDS = ("answer", "Final answer", "reference_answer")
+
+# Set in each worker process by _init_worker
+_worker = None
+
+
+def _first(record: dict, fields: Iterable[str]):
+    for field in fields:
+        if record.get(field) not in (None, ""):
+            return record[field]
+    return None
+
+
+def _expected_answer(record: dict) -> Optional[str]:
+    answer = _first(record, _ANSWER_FIELDS)
+    # WebArena keeps it under eval.reference_answers
+    reference = (record.get("eval") or {}).get("reference_answers") or {}
+    answer = answer or reference.get("exact_match") or reference.get("must_include")
+    if isinstance(answer, list):
+        answer = " | ".join(str(part) for part in answer)
+    return str(answer) if answer is not None else None
+
+
+def normalize(record: dict, index: int) -> dict:
+    """{id, task, start_url, expected} from a dataset record."""
+    task = _first(record, _TASK_FIELDS)
+    if task is None:
+        raise ValueError(f"Record {index} has none of the task fields {_TASK_FIELDS}: {record}")
+    task_id = _first(record, _ID_FIELDS)
+    return {
+        "id": str(task_id if task_id is not None else index),
+        "task": str(task),
+        "start_url": _first(record, _URL_FIELDS),
+        "expected": _expected_answer(record),
+    }
+
+
+def load_tasks(source: str, split: str = "test", limit: Optional[int] = None) -> List[dict]:
+    """Reads a .txt, .json or .jsonl task file, or a Hugging Face dataset by name."""
+    extension = os.path.splitext(source)[1]
+    if extension == ".txt":
+        with open(source) as f:
+            records = [{"task": line.strip()} for line in f if line.strip()]
+    elif extension == ".jsonl":
+        with open(source) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    elif extension == ".json":
+        with open(source) as f:
+            records = json.load(f)
+    else:
+        from datasets import load_dataset
+
+        records = load_dataset(source, split=split)
+    tasks = [normalize(dict(record), i) for i, record in enumerate(records)]
+    return tasks[:limit] if limit else tasks
+
+
+def load_checkpoint(path: str) -> dict:
+    """{task id: result} of the tasks already in a results file."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            done[result["id"]] = result
+    return done
+
+
+def _end_partial_line(path: str) -> None:
+    """Terminates the partial last line an interrupted run may have left, before appending."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+def is_correct(answer: Optional[str], expected: Optional[str]) -> Optional[bool]:
+    """Whether every "|"-separated part of the expected answer is in the answer, None without one."""
+    if expected is None:
+        return None
+    if answer is None:
+        return False
+    answer = " ".join(answer.lower().split())
+    return all(" ".join(part.lower().split()) in answer for part in expected.split("|"))
+
+
+def _prompt(task: dict) -> str:
+    if task["start_url"] and task["start_url"] not in task["task"]:
+        return f"{task['task']}\nStart at {task['start_url']}"
+    return task["task"]
+
+
+def _init_worker(options: dict) -> None:
+    """Starts this worker's Playwright and browser pool, kept for all its tasks."""
+    global _worker
+    from multiprocessing.util import Finalize
+
+    from playwright.async_api import async_playwright
+
+    from browser_pool import BrowserPool
+    from decision_cache import DecisionCache
+    from main import configure_lm, init_weave
+    from session_store import SessionStore
+
+    logging.basicConfig(level=options["log_level"])
+    configure_lm()
+    if options["use_weave"]:
+        init_weave()
+    loop = asyncio.new_event_loop()
+    playwright = loop.run_until_complete(async_playwright().start())
+    # Shared by all workers, each task starts with the sessions earlier tasks saved
+    sessions = SessionStore() if options["use_sessions"] else None
+    pool = BrowserPool(
+        playwright,
+        browsers=1,
+        contexts_per_browser=1,
+        launch_options={"headless": options["headless"]},
+        session_store=sessions,
+    )
+    loop.run_until_complete(pool.start())
+    cache = DecisionCache() if options["use_cache"] else None
+    _worker = {
+        "loop": loop,
+        "playwright": playwright,
+        "pool": pool,
+        "cache": cache,
+        "sessions": sessions,
+        "options": options,
+    }
+    # Worker processes exit without running atexit hooks, but do run finalizers
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker() -> None:
+    loop = _worker["loop"]
+    loop.run_until_complete(_worker["pool"].close())
+    loop.run_until_complete(_worker["playwright"].stop())
+    if _worker["cache"] is not None:
+        _worker["cache"].close()
+    if _worker["sessions"] is not None:
+        _worker["sessions"].close()
+    loop.close()
+
+
+def _run_one(task: dict) -> dict:
+    """Runs one task in this worker, never raises."""
+    from async_main import run_task
+
+    options = _worker["options"]
+    start = time.perf_counter()
+    answer = error = None
+    steps = 0
+    try:
+        prediction = _worker["loop"].run_until_complete(
+            run_task(
+                _worker["pool"],
+                _prompt(task),
+                max_iters=options["max_iters"],
+                record=options["record"],
+                cache=_worker["cache"],
+                trace_dir=options["trace_dir"],
+                profile=options["profile"],
+                start_url=task["start_url"],
+            )
+        )
+        answer = prediction.answer
+        steps = sum(1 for key in prediction.trajectory if key.startswith("tool_name_"))
+    except Exception as e:
+        logger.exception(f"Task {task['id']} failed")
+        error = f"{type(e).__name__}: {e}"
+    return {
+        **task,
+        "answer": answer,
+        "correct": is_correct(answer, task["expected"]),
+        "error": error,
+        "steps": steps,
+        "wall_s": round(time.perf_counter() - start, 2),
+        "worker": os.getpid(),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _with_fixtures(tasks: List[dict], base_url: str) -> List[dict]:
+    return [
+        {
+            **task,
+            "task": task["task"].replace(FIXTURES_PLACEHOLDER, base_url),
+            "start_url": task["start_url"] and task["start_url"].replace(FIXTURES_PLACEHOLDER, base_url),
+        }
+        for task in tasks
+    ]
+
+
+def summarize(results: List[dict]) -> dict:
+    """Error count, success rate over the tasks with an expected answer, and wall time per task."""
+    walls = sorted(result["wall_s"] for result in results)
+    graded = [result["correct"] for result in results if result["correct"] is not None]
+    summary = {
+        "tasks": len(results),
+        "errors": sum(1 for result in results if result["error"]),
+        "success_rate": round(sum(graded) / len(graded), 3) if graded else None,
+        "graded": len(graded),
+        "wall_p50_s": round(statistics.median(walls), 1) if walls else None,
+        "wall_p95_s": tracing.percentile(walls, 0.95) if walls else None,
+    }
+    return summary
+
+
+def run_batch(
+    tasks: List[dict],
+    output: str,
+    workers: int = 4,
+    headless: bool = True,
+    max_iters: int = 20,
+    record: bool = False,
+    use_cache: bool = True,
+    trace_dir: Optional[str] = None,
+    profile: Optional[str] = None,
+    retry_errors: bool = False,
+    use_sessions: bool = True,
+    use_weave: bool = True,
+) -> dict:
+    """
+    Runs the tasks not yet in output over `workers` processes, appending each
+    result as it finishes. Returns the summary of all the tasks' results, with
+    the throughput of this run.
+    """
+    done = load_checkpoint(output)
+    if retry_errors:
+        done = {task_id: result for task_id, result in done.items() if not result["error"]}
+    pending = [task for task in tasks if task["id"] not in done]
+    print(f"{len(tasks)} tasks, {len(tasks) - len(pending)} already in {output}, {len(pending)} to run")
+    if not pending:
+        return summarize([done[task["id"]] for task in tasks if task["id"] in done])
+    if trace_dir is not None:
+        os.makedirs(trace_dir, exist_ok=True)
+    options = {
+        "headless": headless,
+        "max_iters": max_iters,
+        "record": record,
+        "use_cache": use_cache,
+        "use_sessions": use_sessions,
+        "use_weave": use_weave,
+        "trace_dir": trace_dir,
+        "profile": profile,
+        "log_level": logging.getLogger().level,
+    }
+
+    results = []
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        if any(FIXTURES_PLACEHOLDER in (task["task"] + (task["start_url"] or "")) for task in pending):
+            from benchmarks.pages import load_fixtures
+            from benchmarks.server import FixtureServer
+
+            server = stack.enter_context(FixtureServer(load_fixtures()))
+            pending = _with_fixtures(pending, server.base_url)
+        _end_partial_line(output)
+        out = stack.enter_context(open(output, "a"))
+        # spawn, not fork: the parent may already run threads (the fixture server)
+        executor = stack.enter_context(
+            ProcessPoolExecutor(
+                max_workers=min(workers, len(pending)),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(options,),
+            )
+        )
+        futures = {executor.submit(_run_one, task): task for task in pending}
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                results.append(result)
+                status = "error" if result["error"] else {True: "ok", False: "wrong", None: "done"}[result["correct"]]
+                print(f"[{len(results)}/{len(pending)}] {status:<5} {result['wall_s']:>6.1f}s  {result['id']}: {result['task'][:80]}")
+        except (KeyboardInterrupt, BrokenProcessPool) as e:
+            logger.warning(f"Stopping after {len(results)} tasks ({type(e).__name__}), rerun to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+    elapsed_s = time.perf_counter() - start
+    summary = summarize([*done.values(), *results])
+    summary.update(
+        ran=len(results), elapsed_s=round(elapsed_s, 1), tasks_per_min=round(len(results) / elapsed_s * 60, 2)
+    )
+    return summary
+
+
+if __name__ == "__main__":
+    import cli
+
+    cli.main(["batch", *sys.argv[1:]])
@@ -0,0 +1,130 @@
+"""
+Per-task overhead of the MCP flow: spawning a server per task (as
+other/playwright_mcp.py did) against leasing one from a warm MCPSessionPool.
+Each task is a fixed script of tool calls in place of the LM, so the
+difference is what the agent waits for before and after its first action.
+
+Runs against other/stub_mcp_server.py by default, so it works offline;
+--startup-ms makes the stub as slow to start as npx. --real uses
+`npx @playwright/mcp` and needs network access.
+
+    python -m benchmarks.bench_mcp [--tasks 20] [--concurrency 2] [--startup-ms 1500] [--real]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import dspy
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from other.mcp_pool import PLAYWRIGHT_MCP, MCPSessionPool
+from tracing import percentile
+
+STUB_SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "other", "stub_mcp_server.py")
+
+# What an agent does on a search task, without the LM
+SCRIPT = [
+    ("browser_navigate", {"url": "https://example.com"}),
+    ("browser_type", {"element": "Search", "ref": "e1", "text": "webarena"}),
+    ("browser_click", {"element": "First result", "ref": "e3"}),
+    ("browser_snapshot", {}),
+]
+
+
+async def _run_script(tools: List[dspy.Tool]) -> None:
+    by_name = {tool.name: tool for tool in tools}
+    for name, args in SCRIPT:
+        await by_name[name].acall(**args)
+
+
+async def _spawn_task(params: StdioServerParameters) -> Dict[str, float]:
+    """One task the old way: a new server, handshake and tool wrappers, then the script."""
+    start = time.perf_counter()
+    async with stdio_client(params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            tools = [dspy.Tool.from_mcp_tool(session, tool) for tool in (await session.list_tools()).tools]
+            ready = time.perf_counter()
+            await _run_script(tools)
+            done = time.perf_counter()
+    end = time.perf_counter()
+    return {"setup": (ready - start) * 1000, "script": (done - ready) * 1000, "total": (end - start) * 1000}
+
+
+async def _pooled_task(pool: MCPSessionPool) -> Dict[str, float]:
+    start = time.perf_counter()
+    async with pool.tools() as tools:
+        ready = time.perf_counter()
+        await _run_script(tools)
+        done = time.perf_counter()
+    end = time.perf_counter()
+    return {"setup": (ready - start) * 1000, "script": (done - ready) * 1000, "total": (end - start) * 1000}
+
+
+async def _run_all(make_task, tasks: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await make_task()
+
+    start = time.perf_counter()
+    timings = await asyncio.gather(*(limited() for _ in range(tasks)))
+    wall = time.perf_counter() - start
+    result = {"tasks_per_s": round(tasks / wall, 2)}
+    for key in ("setup", "script", "total"):
+        values = sorted(timing[key] for timing in timings)
+        result[f"{key}_p50_ms"] = round(statistics.median(values), 1)
+        result[f"{key}_p95_ms"] = round(percentile(values, 0.95), 1)
+    # Everything a task waits for besides its own tool calls
+    result["overhead_p50_ms"] = round(result["total_p50_ms"] - result["script_p50_ms"], 1)
+    return result
+
+
+async def run(tasks: int = 20, concurrency: int = 2, startup_ms: int = 0, real: bool = False) -> dict:
+    if real:
+        params = PLAYWRIGHT_MCP
+    else:
+        params = StdioServerParameters(
+            command=sys.executable, args=[STUB_SERVER, "--startup-ms", str(startup_ms)], env=None
+        )
+    results = {"spawn_per_task": await _run_all(lambda: _spawn_task(params), tasks, concurrency)}
+
+    start = time.perf_counter()
+    async with MCPSessionPool(params, servers=concurrency) as pool:
+        warmup_ms = (time.perf_counter() - start) * 1000
+        results["pooled"] = await _run_all(lambda: _pooled_task(pool), tasks, concurrency)
+        results["pooled"]["pool_warmup_ms"] = round(warmup_ms, 1)
+        results["pooled"]["restarts"] = pool.restarts
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MCP spawn-per-task against a warm pool.")
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--startup-ms", type=int, default=0, help="Startup delay of the stub server.")
+    parser.add_argument("--real", action="store_true", help="Use npx @playwright/mcp, needs network access.")
+    parser.add_argument("--output", help="Write the results to this json file.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.tasks, args.concurrency, args.startup_ms, args.real))
+    for name, metrics in results.items():
+        print(
+            f"{name:<16} overhead p50 {metrics['overhead_p50_ms']:>8.1f}ms  "
+            f"setup p50 {metrics['setup_p50_ms']:>8.1f}ms  p95 {metrics['setup_p95_ms']:>8.1f}ms  "
+            f"{metrics['tasks_per_s']:>6.2f} tasks/s"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Latency with and without the work prefetch.py does ahead (PREFETCH_SNAPSHOTS),
+alternating it off and on for every repeat so drift affects both alike:
+
+- post-action: the action scenarios of bench_suite on the fixture pages, with
+  per action the p50 of the whole action (settle and snapshot included) and of
+  its snapshot phase, and how often the snapshot taken while settling was used
+- lookup (async): after an observation and --lm-ms of simulated LM time, the
+  p50 of acting on a ref of the viewport (focusing it), with the ref resolved
+  ahead or looked up on the spot
+
+    python -m benchmarks.bench_prefetch [--repeat 10] [--lm-ms 500] [--huge] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Dict, List
+
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright
+
+import async_actions
+import prefetch
+import settle
+import tracing
+from benchmarks.bench_suite import _scenarios
+from benchmarks.pages import load_fixtures
+from benchmarks.server import FixtureServer
+from snapshot_tracker import get_tracker
+
+
+def _measure(page, setup, fn, speculate: bool) -> Dict[str, float]:
+    prepared = setup(page)
+    prefetch.PREFETCH_SNAPSHOTS = speculate
+    with tracing.trace("bench_prefetch") as tracer:
+        with tracing.span("action"):
+            fn(page, prepared)
+    spans = {span["name"]: span for span in tracer.spans}
+    snapshot = spans.get("snapshot", {})
+    return {
+        "action": spans["action"]["dur_ms"],
+        "snapshot": snapshot.get("dur_ms", 0.0),
+        "warm": bool(snapshot.get("warm")),
+    }
+
+
+def _summary(runs: List[Dict[str, float]]) -> dict:
+    return {
+        "action_p50_ms": round(statistics.median(run["action"] for run in runs), 1),
+        "snapshot_p50_ms": round(statistics.median(run["snapshot"] for run in runs), 1),
+        "warm": sum(run["warm"] for run in runs),
+        "n": len(runs),
+    }
+
+
+async def _lookup_ms(page, url: str, lm_ms: int) -> float:
+    await page.goto(url, wait_until="domcontentloaded")
+    await async_actions._get_browser_state(page, wait=True, action="go_to")
+    ref = prefetch.likely_targets(get_tracker(page).previous)[0]
+    await asyncio.sleep(lm_ms / 1000)
+    start = time.perf_counter()
+    await async_actions._interact(page, ref, "focus", lambda element: element.focus())
+    return (time.perf_counter() - start) * 1000
+
+
+async def run_lookups(repeat: int = 10, lm_ms: int = 500) -> Dict[str, dict]:
+    fixtures = load_fixtures()
+    default = prefetch.PREFETCH_SNAPSHOTS
+    results: Dict[str, dict] = {}
+    with FixtureServer(fixtures) as server:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch()
+            page = await browser.new_page()
+            try:
+                for name in ("search_form", "results_100", "results_1000"):
+                    runs = {False: [], True: []}
+                    for _ in range(repeat):
+                        for speculate in (False, True):
+                            prefetch.PREFETCH_SNAPSHOTS = speculate
+                            runs[speculate].append(await _lookup_ms(page, server.url(name), lm_ms))
+                    off = round(statistics.median(runs[False]), 2)
+                    on = round(statistics.median(runs[True]), 2)
+                    results[f"{name}/lookup"] = {"off_p50_ms": off, "on_p50_ms": on, "saved_p50_ms": round(off - on, 2)}
+                    print(f"{name + '/lookup':<28} p50 {off:>7.2f} -> {on:>7.2f}ms", flush=True)
+            finally:
+                prefetch.PREFETCH_SNAPSHOTS = default
+                await browser.close()
+    return results
+
+
+def run(repeat: int = 10, huge: bool = False) -> Dict[str, dict]:
+    fixtures = load_fixtures(huge=huge)
+    default = prefetch.PREFETCH_SNAPSHOTS
+    results: Dict[str, dict] = {}
+    with FixtureServer(fixtures) as server, sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page()
+        settle.watch(page)
+        try:
+            for name, scenarios in _scenarios(server).items():
+                if name not in fixtures:
+                    continue
+                for action, (setup, fn) in scenarios.items():
+                    runs = {False: [], True: []}
+                    for _ in range(repeat):
+                        for speculate in (False, True):
+                            runs[speculate].append(_measure(page, setup, fn, speculate))
+                    off, on = _summary(runs[False]), _summary(runs[True])
+                    key = f"{name}/{action}"
+                    results[key] = {
+                        "off": off,
+                        "on": on,
+                        "saved_p50_ms": round(off["action_p50_ms"] - on["action_p50_ms"], 1),
+                    }
+                    print(
+                        f"{key:<28} action p50 {off['action_p50_ms']:>7.1f} -> {on['action_p50_ms']:>7.1f}ms  "
+                        f"snapshot p50 {off['snapshot_p50_ms']:>6.1f} -> {on['snapshot_p50_ms']:>6.1f}ms  "
+                        f"settled snapshot used {on['warm']}/{on['n']}",
+                        flush=True,
+                    )
+        finally:
+            prefetch.PREFETCH_SNAPSHOTS = default
+            browser.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark actions with and without the work done ahead by prefetch.py.")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--lm-ms", type=int, default=500, help="Simulated LM time before the lookup.")
+    parser.add_argument("--huge", action="store_true", help="Include the ~50k node page.")
+    parser.add_argument("--output", help="Write the results to this json file.")
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat, huge=args.huge)
+    results.update(asyncio.run(run_lookups(repeat=args.repeat, lm_ms=args.lm_ms)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares the legacy recursive get_browser_state with the single-pass in-page
+extractor on the page fixtures.
+
+    python -m benchmarks.bench_snapshot [--repeat 10]
+"""
+import argparse
+import statistics
+import time
+
+from playwright.sync_api import sync_playwright
+
+from benchmarks.legacy_browser_state import get_browser_state as legacy_get_browser_state
+from benchmarks.pages import load_fixtures
+from browser_state import get_browser_state, serialize_snapshot, snapshot_page
+from tracing import percentile
+
+
+def _time(fn, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page()
+        print(
+            f"{'fixture':<16} {'nodes':>7} {'impl':<8} {'median ms':>10} {'p95 ms':>8} {'bytes':>9}"
+        )
+        for name, html in load_fixtures().items():
+            page.set_content(html)
+            snapshot = snapshot_page(page)
+            n_nodes = len(snapshot["nodes"])
+            viewport = page.viewport_size
+
+            for impl, fn in (
+                ("legacy", lambda: legacy_get_browser_state(page)),
+                ("inpage", lambda: get_browser_state(page)),
+                ("extract", lambda: snapshot_page(page)),
+                ("yaml", lambda: serialize_snapshot(snapshot, viewport)),
+            ):
+                size = len(fn().encode()) if impl in ("legacy", "inpage") else 0
+                timings = _time(fn, args.repeat)
+                print(
+                    f"{name:<16} {n_nodes:>7} {impl:<8} {statistics.median(timings):>10.1f} "
+                    f"{percentile(timings, 0.95):>8.1f} {size or '':>9}"
+                )
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
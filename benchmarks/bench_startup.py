@@ -0,0 +1,105 @@
+"""
+Startup cost of the entry points, each measured in a fresh interpreter: the
+wall time of `python cli.py --help`, and the import time and heavy modules of
+cli, batch (what the batch parent loads) and main (what a run or a batch
+worker loads before its first task).
+
+    python -m benchmarks.bench_startup [--repeat 5]
+
+Exits with status 1 if a median is over its budget in BUDGETS_MS, or if an
+entry point imports a module it should only load on demand.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Medians, with room for slower machines. main is dominated by dspy and litellm:
+# its median measured ~4.8s, the budget leaves ~25% on top of that
+BUDGETS_MS = {"cli --help": 1000, "import cli": 150, "import batch": 300, "import main": 6000}
+
+# Modules each entry point must not import: weave is only for W&B tracing,
+# the recorder and gif code only for recorded runs, dspy and Playwright only
+# once a command runs, the async actions only for async runs. dspy imports PIL
+# itself, so main can't avoid it
+FORBIDDEN = {
+    "cli": ["dspy", "litellm", "playwright", "weave", "PIL"],
+    "batch": ["dspy", "litellm", "playwright", "weave", "PIL"],
+    "main": ["weave", "recorder", "utils", "async_actions", "async_tabs"],
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps([elapsed, [name for name in {forbidden!r} if name in sys.modules]]))
+"""
+
+
+def _median(values: List[float]) -> float:
+    return round(statistics.median(values), 1)
+
+
+def _wall(args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def _import(module: str) -> tuple:
+    code = _PROBE.format(module=module, forbidden=FORBIDDEN[module])
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    # The last line, modules may print their own output on import
+    elapsed, loaded = json.loads(out.stdout.splitlines()[-1])
+    return elapsed, loaded
+
+
+def run(repeat: int = 5) -> Dict[str, dict]:
+    results = {"cli --help": {"median_ms": _median([_wall(["cli.py", "--help"]) for _ in range(repeat)])}}
+    for module in FORBIDDEN:
+        timings, loaded = [], set()
+        for _ in range(repeat):
+            elapsed, names = _import(module)
+            timings.append(elapsed)
+            loaded.update(names)
+        results[f"import {module}"] = {"median_ms": _median(timings), "loaded": sorted(loaded)}
+    return results
+
+
+def check(results: Dict[str, dict]) -> List[str]:
+    failures = []
+    for name, metrics in results.items():
+        if metrics["median_ms"] > BUDGETS_MS[name]:
+            failures.append(f"{name}: {metrics['median_ms']}ms over the {BUDGETS_MS[name]}ms budget")
+        if metrics.get("loaded"):
+            failures.append(f"{name}: imports {', '.join(metrics['loaded'])}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup of the entry points.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the results to this json file.")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    for name, metrics in results.items():
+        print(f"{name:<14} {metrics['median_ms']:>9.1f}ms  (budget {BUDGETS_MS[name]}ms)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    failures = check(results)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
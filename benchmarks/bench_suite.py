@@ -0,0 +1,239 @@
+"""
+Offline benchmark of the observation pipeline and the agent actions. The page
+fixtures are served from a local HTTP server, so no network access is needed.
+
+Per fixture it measures in-page extraction (whole page and viewport-scoped),
+YAML serialization, compression and the full state render, the snapshot size
+in bytes and tokens, and the latency of the actions that make sense on that
+page (including settling).
+
+    python -m benchmarks.bench_suite [--repeat 10] [--huge]
+    python -m benchmarks.bench_suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_suite --baseline benchmarks/baseline.json [--tolerance 0.25]
+
+With --baseline, exits with status 1 if a median got slower or a snapshot got
+bigger by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from playwright.sync_api import Page, sync_playwright
+
+import actions
+import settle
+from benchmarks.pages import load_fixtures
+from benchmarks.server import FixtureServer
+from browser_state import serialize_snapshot, snapshot_page
+from observation import ObservationCompressor, count_tokens
+from snapshot_tracker import get_tracker
+from tracing import percentile
+
+# Timing differences below this are noise, whatever the ratio
+NOISE_FLOOR_MS = 2.0
+
+
+def _summary(timings: List[float]) -> dict:
+    return {
+        "p50": round(percentile(timings, 0.5), 2),
+        "p95": round(percentile(timings, 0.95), 2),
+        "max": round(max(timings), 2),
+        "n": len(timings),
+    }
+
+
+def _time(fn: Callable[[Any], object], repeat: int, setup: Callable[[], Any] = lambda: None) -> dict:
+    """Times fn(setup()) repeat times, setup is not timed."""
+    timings = []
+    for _ in range(repeat):
+        prepared = setup()
+        start = time.perf_counter()
+        fn(prepared)
+        timings.append((time.perf_counter() - start) * 1000)
+    return _summary(timings)
+
+
+def _unprepared(snapshot: dict) -> dict:
+    """The snapshot without what compress cached on it."""
+    return {key: value for key, value in snapshot.items() if not key.startswith("_")}
+
+
+def _ref(page: Page, role: str, name: Optional[str] = None) -> str:
+    """Ref of the first node with this role (and name) in the current snapshot."""
+    for node in snapshot_page(page, scope="page")["nodes"]:
+        if node["role"] == role and (name is None or node.get("name") == name):
+            return node["ref"]
+    raise LookupError(f"No {role} {name or ''} on {page.url}")
+
+
+def _scenarios(server: FixtureServer) -> Dict[str, Dict[str, tuple]]:
+    """
+    {fixture: {action: (setup, run)}}. setup(page) puts the page in the state
+    the action starts from and returns what run(page, prepared) needs, usually
+    the ref to act on. Only run is timed.
+    """
+
+    def open_fixture(name: str, role: Optional[str] = None, node_name: Optional[str] = None):
+        def setup(page: Page) -> Optional[str]:
+            page.goto(server.url(name), wait_until="domcontentloaded")
+            settle.wait_for_settle(page)
+            get_tracker(page).reset()
+            return _ref(page, role, node_name) if role else None
+
+        return setup
+
+    def click_missing(page: Page, _) -> None:
+        # A selector that matches nothing should fail fast, not time out
+        try:
+            actions.click(page, "#no-such-element")
+        except ValueError:
+            return
+        raise AssertionError("Clicking a missing element succeeded")
+
+    def open_and_follow_link(page: Page) -> None:
+        actions.click(page, open_fixture("results_100", "link")(page))
+
+    return {
+        "search_form": {
+            "go_to": (lambda page: None, lambda page, _: actions.go_to(page, server.url("search_form"))),
+            "type_text": (
+                open_fixture("search_form", "textbox"),
+                lambda page, ref: actions.type_text(page, ref, "webarena"),
+            ),
+            "submit": (
+                open_fixture("search_form", "textbox"),
+                lambda page, ref: actions.type_text(page, ref, "webarena", submit=True),
+            ),
+            "click_missing": (open_fixture("search_form"), click_missing),
+        },
+        "results_100": {
+            "click": (open_fixture("results_100", "link"), actions.click),
+            "go_back": (open_and_follow_link, lambda page, _: actions.go_back(page)),
+            "scroll": (open_fixture("results_100"), lambda page, _: actions.scroll(page, "down")),
+        },
+        "results_1000": {
+            "scroll": (open_fixture("results_1000"), lambda page, _: actions.scroll(page, "down")),
+        },
+        "results_4200": {
+            "scroll": (open_fixture("results_4200"), lambda page, _: actions.scroll(page, "down")),
+        },
+        "table_1500x8": {
+            "scroll": (open_fixture("table_1500x8"), lambda page, _: actions.scroll(page, "down")),
+        },
+        "spa": {
+            "click": (open_fixture("spa", "link", "Sent"), actions.click),
+        },
+        "infinite_scroll": {
+            "scroll": (open_fixture("infinite_scroll"), lambda page, _: actions.scroll(page, "down")),
+        },
+    }
+
+
+def run(repeat: int = 10, huge: bool = False) -> Dict[str, dict]:
+    fixtures = load_fixtures(huge=huge)
+    results: Dict[str, dict] = {}
+    with FixtureServer(fixtures) as server, sync_playwright() as p:
+        browser = p.chromium.launch()
+        page = browser.new_page()
+        settle.watch(page)
+        scenarios = _scenarios(server)
+
+        for name in fixtures:
+            page.goto(server.url(name), wait_until="domcontentloaded")
+            settle.wait_for_settle(page)
+            snapshot = snapshot_page(page)
+            scoped = snapshot_page(page, scope="viewport")
+            viewport = page.viewport_size
+            yaml = serialize_snapshot(snapshot, viewport)
+            compressor = ObservationCompressor()
+            observation = compressor.compress(snapshot, viewport)
+            tracker = get_tracker(page)
+
+            metrics = {
+                "nodes": len(snapshot["nodes"]),
+                "yaml_bytes": len(yaml.encode()),
+                "yaml_tokens": count_tokens(yaml),
+                "observation_bytes": len(observation.encode()),
+                "observation_tokens": count_tokens(observation),
+                "extract_ms": _time(lambda _: snapshot_page(page), repeat),
+                "viewport_nodes": len(scoped["nodes"]),
+                "viewport_tokens": count_tokens(serialize_snapshot(scoped, viewport)),
+                "viewport_extract_ms": _time(lambda _: snapshot_page(page, scope="viewport"), repeat),
+                "serialize_ms": _time(lambda _: serialize_snapshot(snapshot, viewport), repeat),
+                "compress_ms": _time(
+                    lambda fresh: compressor.compress(fresh, viewport), repeat, setup=lambda: _unprepared(snapshot)
+                ),
+                # A full render each time, a diff against the same page would be trivial
+                "state_ms": _time(lambda _: actions._get_browser_state(page), repeat, setup=tracker.reset),
+                # Nothing changed since the last snapshot, which is reused
+                "state_unchanged_ms": _time(lambda _: actions._get_browser_state(page), repeat),
+            }
+            for action, (setup, fn) in scenarios.get(name, {}).items():
+                metrics[f"{action}_ms"] = _time(
+                    lambda prepared: fn(page, prepared), repeat, setup=lambda: setup(page)
+                )
+            results[name] = metrics
+            print(_format_row(name, metrics), flush=True)
+        browser.close()
+    return results
+
+
+def _format_row(name: str, metrics: dict) -> str:
+    sizes = (
+        f"{metrics['nodes']} nodes, yaml {metrics['yaml_bytes']}B/{metrics['yaml_tokens']}tok, "
+        f"sent {metrics['observation_bytes']}B/{metrics['observation_tokens']}tok"
+    )
+    timings = ", ".join(
+        f"{key[:-3]} {value['p50']}/{value['p95']}ms" for key, value in metrics.items() if key.endswith("_ms")
+    )
+    return f"{name:<16} {sizes}\n{'':<16} p50/p95: {timings}"
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Lists the metrics that regressed against the baseline by more than tolerance."""
+    regressions = []
+    for name, metrics in results.items():
+        for key, value in metrics.items():
+            old = baseline.get(name, {}).get(key)
+            if old is None:
+                continue
+            if key.endswith("_ms"):
+                new_p50, old_p50 = value["p50"], old["p50"]
+                if new_p50 > old_p50 * (1 + tolerance) and new_p50 - old_p50 > NOISE_FLOOR_MS:
+                    regressions.append(f"{name} {key}: p50 {old_p50}ms -> {new_p50}ms")
+            elif not key.endswith("nodes") and value > old * (1 + tolerance):
+                regressions.append(f"{name} {key}: {old} -> {value}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--huge", action="store_true", help="Include the ~50k node page.")
+    parser.add_argument("--output", help="Write the results to this json file.")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline.")
+    parser.add_argument("--baseline", help="Compare against this baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = run(repeat=args.repeat, huge=args.huge)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import glob
+import os
+from typing import Dict
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _results_page(n_results: int) -> str:
+    """A search results listing, roughly 12 accessibility nodes per result."""
+    items = []
+    for i in range(n_results):
+        items.append(
+            f"""
+            <li>
+              <h3><a href="/abs/{i}">Result title number {i} about web agents</a></h3>
+              <p>Authors: <a href="/a/{i}">Author {i}</a>, <a href="/a/{i + 1}">Author {i + 1}</a></p>
+              <p>Abstract of result {i}. Browser agents navigate real websites to complete tasks.</p>
+              <button aria-pressed="false">Save</button>
+              <label><input type="checkbox" name="select-{i}"> Select</label>
+            </li>"""
+        )
+    return f"""<!DOCTYPE html>
+<html><head><title>Search results ({n_results})</title></head>
+<body>
+  <form role="search"><input type="search" aria-label="Search" value="webarena"><button>Search</button></form>
+  <main><h1>Showing {n_results} results</h1><ol>{''.join(items)}</ol></main>
+</body></html>"""
+
+
+def _table_page(n_rows: int, n_cols: int = 8) -> str:
+    """A wide data table, one row and n_cols cells (plus text) per row."""
+    header = "".join(f"<th>Column {c}</th>" for c in range(n_cols))
+    rows = []
+    for r in range(n_rows):
+        cells = "".join(f"<td>r{r}c{c}</td>" for c in range(n_cols - 1))
+        rows.append(f'<tr>{cells}<td><a href="/row/{r}">open</a></td></tr>')
+    return f"""<!DOCTYPE html>
+<html><head><title>Table ({n_rows} rows)</title></head>
+<body><main><table><thead><tr>{header}</tr></thead><tbody>{''.join(rows)}</tbody></table></main></body></html>"""
+
+
+def load_fixtures(huge: bool = False) -> Dict[str, str]:
+    """
+    Returns {name: html} for every saved page in benchmarks/fixtures plus the
+    generated small/medium/large pages. huge adds a ~50k node page.
+    """
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        name, _ = os.path.splitext(os.path.basename(path))
+        with open(path, encoding="utf-8") as f:
+            fixtures[name] = f.read()
+    fixtures["results_100"] = _results_page(100)
+    fixtures["results_1000"] = _results_page(1000)
+    fixtures["table_1500x8"] = _table_page(1500)
+    if huge:
+        fixtures["results_4200"] = _results_page(4200)
+    return fixtures
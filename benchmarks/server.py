@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+# Simulated latency of the JSON endpoints, so SPA and feed updates are async
+API_DELAY_S = 0.05
+
+_VIEWS = ("inbox", "sent", "archive")
+
+
+def _detail_page(path: str) -> str:
+    return f"""<!DOCTYPE html>
+<html><head><title>Detail {path}</title></head>
+<body><main><h1>Detail page {path}</h1><p>Some text about {path}.</p>
+<a href="/">Home</a></main></body></html>"""
+
+
+class FixtureServer:
+    """
+    Serves the benchmark fixtures on localhost, so pages load over real HTTP
+    (navigations, fetches) without network access:
+
+    - /<name> serves fixture <name>; /spa/<view> serves the SPA fixture
+    - /api/items?offset=&limit= feeds the infinite scroll fixture
+    - /api/view/<view> feeds the SPA fixture
+    - any other path is a small detail page, so links can be followed
+    """
+
+    def __init__(self, fixtures: Dict[str, str], port: int = 0):
+        self.fixtures = fixtures
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}"
+
+    def _handle(self, request: BaseHTTPRequestHandler) -> None:
+        parts = urlsplit(request.path)
+        path = parts.path.strip("/")
+        content_type = "text/html; charset=utf-8"
+        if path == "api/items":
+            time.sleep(API_DELAY_S)
+            query = parse_qs(parts.query)
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["20"])[0])
+            body = json.dumps(
+                [
+                    {"id": i, "title": f"Post {i}", "body": f"Body of post {i}, a few words long."}
+                    for i in range(offset, offset + limit)
+                ]
+            )
+            content_type = "application/json"
+        elif path.startswith("api/view/"):
+            time.sleep(API_DELAY_S)
+            name = path.rsplit("/", 1)[-1]
+            body = json.dumps(
+                {
+                    "title": name.capitalize(),
+                    "items": [{"subject": f"{name} message {i}", "from": f"user{i}@example.com"} for i in range(30)],
+                }
+            )
+            content_type = "application/json"
+        elif path in self.fixtures:
+            body = self.fixtures[path]
+        elif path.startswith("spa/") and path[4:] in _VIEWS and "spa" in self.fixtures:
+            body = self.fixtures["spa"]
+        else:
+            body = _detail_page(path or "home")
+
+        data = body.encode()
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def start(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
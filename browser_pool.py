@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from playwright.async_api import Browser, BrowserContext, Page, Playwright
+
+import tracing
+from session_store import SessionStore, track_origins
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """
+    Keeps pre-launched headless browsers, each with pre-created contexts that
+    already have a blank page open, so a task never pays for a cold start.
+
+    Contexts are handed out one per task and reset on release: extra pages are
+    closed, cookies, permissions and the storage of every visited origin are
+    cleared and a fresh page is opened. A context is recycled (closed and
+    recreated) after max_context_uses tasks or if its reset fails. A browser
+    that crashed or disconnected is replaced, together with its contexts.
+
+    The pool holds contexts_per_browser contexts per browser, or, if contexts is
+    given, exactly that many spread as evenly as possible across the browsers.
+
+    With a session_store, a context is seeded when a task acquires it, so it
+    sees the sessions saved up to then, and a task that finishes without
+    raising saves the sessions of the origins it visited. Cookies are added to
+    the reset context. localStorage and IndexedDB can only be restored when a
+    context is created, so they are only seeded for the origins a task names
+    (its start URL), by recreating the context when one of them has any.
+    """
+
+    def __init__(
+        self,
+        playwright: Playwright,
+        browsers: int = 2,
+        contexts_per_browser: int = 4,
+        max_context_uses: int = 20,
+        launch_options: Optional[dict] = None,
+        context_options: Optional[dict] = None,
+        session_store: Optional[SessionStore] = None,
+        contexts: Optional[int] = None,
+    ):
+        if browsers < 1:
+            raise ValueError(f"A pool needs at least one browser, got browsers={browsers}")
+        if contexts is not None and contexts < browsers:
+            raise ValueError(f"contexts={contexts} would leave browsers without a context, use at least {browsers}")
+        if contexts is None and contexts_per_browser < 1:
+            raise ValueError(f"A browser needs at least one context, got contexts_per_browser={contexts_per_browser}")
+        self.playwright = playwright
+        self.n_browsers = browsers
+        self.contexts_per_browser = contexts_per_browser
+        if contexts is not None:
+            self._slots = [contexts // browsers + (i < contexts % browsers) for i in range(browsers)]
+        else:
+            self._slots = [contexts_per_browser] * browsers
+        self.max_context_uses = max_context_uses
+        self.launch_options = {"headless": True, **(launch_options or {})}
+        self.context_options = context_options or {}
+        self.session_store = session_store
+
+        self._browsers: List[Browser] = []
+        # How many contexts each browser holds, for its replacement
+        self._size: Dict[Browser, int] = {}
+        self._idle: "asyncio.Queue[BrowserContext]" = asyncio.Queue()
+        self._uses: Dict[BrowserContext, int] = {}
+        self._origins: Dict[BrowserContext, Set[str]] = {}
+
+        self.acquire_latencies: List[float] = []
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.browsers_replaced = 0
+        self.contexts_recycled = 0
+        # Contexts recreated at acquire to restore an origin's storage
+        self.contexts_seeded = 0
+        self._occupancy_area = 0.0
+        self._started_at = 0.0
+        self._last_change = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return sum(self._slots)
+
+    async def start(self) -> "BrowserPool":
+        self._started_at = self._last_change = time.perf_counter()
+        await asyncio.gather(*(self._add_browser(n) for n in self._slots))
+        return self
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            *(browser.close() for browser in self._browsers), return_exceptions=True
+        )
+        self._browsers.clear()
+        self._size.clear()
+
+    async def __aenter__(self) -> "BrowserPool":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _add_browser(self, n_contexts: int) -> None:
+        browser = await self.playwright.chromium.launch(**self.launch_options)
+        self._browsers.append(browser)
+        self._size[browser] = n_contexts
+        contexts = await asyncio.gather(
+            *(self._new_context(browser) for _ in range(n_contexts))
+        )
+        for context in contexts:
+            self._idle.put_nowait(context)
+
+    async def _replace_browser(self, browser: Browser) -> None:
+        # Several contexts of the same dead browser can reach this, replace it once
+        if browser not in self._browsers:
+            return
+        self._browsers.remove(browser)
+        self.browsers_replaced += 1
+        logger.warning("Browser disconnected, launching a replacement")
+        await self._add_browser(self._size.pop(browser))
+
+    async def _new_context(self, browser: Browser, storage_state: Optional[dict] = None) -> BrowserContext:
+        context = await browser.new_context(storage_state=storage_state, **self.context_options)
+        self._origins[context] = track_origins(context)
+        if storage_state is not None:
+            # Cleared on reset like the origins a task visits
+            self._origins[context].update(storage["origin"] for storage in storage_state["origins"])
+        await context.new_page()
+        self._uses[context] = 0
+        return context
+
+    def _forget(self, context: BrowserContext) -> None:
+        self._uses.pop(context, None)
+        self._origins.pop(context, None)
+
+    async def _reset(self, context: BrowserContext) -> None:
+        # A fresh tab also drops sessionStorage, which is scoped to the tab
+        await asyncio.gather(*(page.close() for page in context.pages))
+        page = await context.new_page()
+        await context.clear_cookies()
+        await context.clear_permissions()
+        origins = self._origins[context]
+        if origins:
+            cdp = await context.new_cdp_session(page)
+            for origin in origins:
+                await cdp.send(
+                    "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+                )
+            await cdp.detach()
+            origins.clear()
+
+    def _track_occupancy(self, delta: int) -> None:
+        now = time.perf_counter()
+        self._occupancy_area += self.in_use * (now - self._last_change)
+        self._last_change = now
+        self.in_use += delta
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    async def _seed(self, context: BrowserContext, origins: Optional[Iterable[str]]) -> BrowserContext:
+        """Applies the stored sessions of the given origins, or the cookies of the most recent ones."""
+        state = self.session_store.storage_state(origins)
+        if origins and state["origins"]:
+            # Created first, so the reset context is kept if this fails
+            seeded = await self._new_context(context.browser, storage_state=state)
+            self._forget(context)
+            try:
+                await context.close()
+            except Exception:
+                pass
+            self.contexts_seeded += 1
+            return seeded
+        if state["cookies"]:
+            await context.add_cookies(state["cookies"])
+        return context
+
+    async def acquire(self, origins: Optional[Iterable[str]] = None) -> BrowserContext:
+        """
+        Waits for an idle context whose browser is still alive, seeded with the
+        sessions of origins (see _seed) when there is a session store.
+        """
+        start = time.perf_counter()
+        while True:
+            context = await self._idle.get()
+            browser = context.browser
+            if browser is not None and browser.is_connected():
+                break
+            self._forget(context)
+            await self._replace_browser(browser)
+        if self.session_store is not None:
+            try:
+                context = await self._seed(context, origins)
+            except Exception as e:
+                logger.warning(f"Seeding the context's sessions failed: {e}")
+        self.acquire_latencies.append((time.perf_counter() - start) * 1000)
+        self._uses[context] += 1
+        self._track_occupancy(+1)
+        return context
+
+    async def _save_session(self, context: BrowserContext) -> None:
+        try:
+            state = await context.storage_state(indexed_db=True)
+            self.session_store.save(state, self._origins[context])
+        except Exception as e:
+            logger.warning(f"Failed to save the context's sessions: {e}")
+
+    async def release(self, context: BrowserContext, save_session: bool = False) -> None:
+        """
+        Resets the context and returns it to the pool, recycling it if needed.
+        With save_session, its sessions are saved to the session store first.
+        """
+        self._track_occupancy(-1)
+        browser = context.browser
+        if browser is None or not browser.is_connected():
+            self._forget(context)
+            await self._replace_browser(browser)
+            return
+
+        if save_session and self.session_store is not None:
+            await self._save_session(context)
+        if self._uses[context] < self.max_context_uses:
+            try:
+                await self._reset(context)
+                self._idle.put_nowait(context)
+                return
+            except Exception as e:
+                logger.warning(f"Context reset failed, recycling it: {e}")
+
+        self._forget(context)
+        self.contexts_recycled += 1
+        try:
+            await context.close()
+        except Exception:
+            pass
+        self._idle.put_nowait(await self._new_context(browser))
+
+    @asynccontextmanager
+    async def page(self, origins: Optional[Iterable[str]] = None) -> AsyncIterator[Page]:
+        """
+        Acquires a clean context for the duration of a task and yields its page.
+        origins are the task's known origins, to seed their sessions. Sessions
+        are saved if the task doesn't raise.
+        """
+        context = await self.acquire(origins)
+        finished = False
+        try:
+            yield context.pages[0]
+            finished = True
+        finally:
+            await self.release(context, save_session=finished)
+
+    def stats(self) -> dict:
+        """Acquire latency and occupancy, to size the pool for a workload."""
+        latencies = sorted(self.acquire_latencies)
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0
+        area = self._occupancy_area + self.in_use * (time.perf_counter() - self._last_change)
+        return {
+            "capacity": self.capacity,
+            "idle": self._idle.qsize(),
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "mean_occupancy": round(area / elapsed / self.capacity, 3) if elapsed else 0,
+            "acquires": len(latencies),
+            "acquire_p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "acquire_p95_ms": round(tracing.percentile(latencies, 0.95), 1) if latencies else None,
+            "browsers_replaced": self.browsers_replaced,
+            "contexts_recycled": self.contexts_recycled,
+            "contexts_seeded": self.contexts_seeded,
+        }
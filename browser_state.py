@@ -1,139 +1,432 @@
+import os
 from typing import Dict, Any, List, Optional
 from playwright.sync_api import Page
 
+# "viewport" only walks what intersects the viewport plus SNAPSHOT_MARGIN_PX
+# above and below it, the rest shows as collapsed stubs to expand on demand
+SNAPSHOT_SCOPE = os.getenv("SNAPSHOT_SCOPE", "page")
+SNAPSHOT_MARGIN_PX = int(os.getenv("SNAPSHOT_MARGIN_PX", 400))
 
-def get_browser_state(page: Page) -> str:
-    # Get page metadata
-    url = page.url
-    title = page.title()
-    
-    # Start with page metadata
-    yaml_lines = [
-        f"url: {url}",
-        f"title: {title}",
-        f"viewport: {page.viewport_size}",
-        "elements:"
+INTERACTIVE_ROLES = frozenset(
+    [
+        "button", "link", "textbox", "checkbox", "radio", "combobox",
+        "listbox", "menuitem", "menuitemcheckbox", "menuitemradio",
+        "option", "switch", "tab", "searchbox", "slider", "spinbutton",
+    ]
+)
+
+# Walks the DOM once inside the page and returns everything the snapshot needs
+# (tree, focused element, word count) in a single round-trip. Nodes come back
+# as a flat pre-order list where each entry carries its depth, so Python never
+# has to recurse to rebuild the tree.
+SNAPSHOT_JS = r"""
+(options = {}) => {
+  const MAX_NAME = 200;
+  const SKIP_TAGS = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'HEAD', 'META', 'LINK']);
+  const NAME_FROM_CONTENT = new Set([
+    'button', 'link', 'heading', 'option', 'cell', 'columnheader', 'rowheader', 'tab',
+    'menuitem', 'menuitemcheckbox', 'menuitemradio', 'checkbox', 'radio', 'switch',
+    'tooltip', 'treeitem',
+  ]);
+  const TAG_ROLES = {
+    BUTTON: 'button', SUMMARY: 'button', TEXTAREA: 'textbox', OPTION: 'option',
+    H1: 'heading', H2: 'heading', H3: 'heading', H4: 'heading', H5: 'heading', H6: 'heading',
+    UL: 'list', OL: 'list', MENU: 'list', LI: 'listitem', NAV: 'navigation', MAIN: 'main',
+    HEADER: 'banner', FOOTER: 'contentinfo', ASIDE: 'complementary', FORM: 'form',
+    ARTICLE: 'article', DIALOG: 'dialog', TABLE: 'table', TR: 'row', TD: 'cell',
+    TH: 'columnheader', P: 'paragraph', HR: 'separator', PROGRESS: 'progressbar',
+    FIGURE: 'figure', BLOCKQUOTE: 'blockquote', CODE: 'code', DETAILS: 'group',
+    FIELDSET: 'group', IFRAME: 'iframe',
+  };
+  const INPUT_ROLES = {
+    checkbox: 'checkbox', radio: 'radio', button: 'button', submit: 'button',
+    reset: 'button', image: 'button', range: 'slider', number: 'spinbutton',
+  };
+  const OBSERVED = { subtree: true, childList: true, attributes: true, characterData: true };
+
+  // Refs live in a per-document WeakMap so the same DOM node keeps its ref
+  // across snapshots; a new document (navigation) starts a new registry.
+  // byRef is the reverse index for the latest snapshot, used to resolve refs.
+  const state = (window.__sbu = window.__sbu || {
+    refs: new WeakMap(),
+    nextRef: 1,
+    documentId: Math.random().toString(36).slice(2),
+    seq: 0,
+  });
+  // Expanding one subtree (options.root) adds to the latest snapshot's refs
+  // instead of starting a new snapshot
+  const expanding = options.root !== undefined;
+  if (expanding && !state.byRef) return null;
+  if (!expanding) {
+    // Numbers the snapshots of this document, so prefetch.py can tell whether
+    // the one Python has is the latest
+    state.seq++;
+    state.byRef = new Map();
+    // stubs: collapsed run -> its container and side, for expanding it later
+    state.stubs = new Map();
+    // settled: a snapshot taken while the page settled (see settle.py), which
+    // this one supersedes
+    state.settled = null;
+    // dirty turns true on the first DOM change after this snapshot, which is
+    // how tabs.py and prefetch.py know a snapshot is still current. The
+    // observer stops at the first change, so idle tabs cost nothing. Typing,
+    // scrolling and focus change what a snapshot shows without touching the
+    // DOM, and hovering can show what CSS hid, so they count as changes too.
+    if (!state.observer) {
+      state.observer = new MutationObserver(() => {
+        state.dirty = true;
+        state.observer.disconnect();
+      });
+      for (const type of ['input', 'change', 'scroll', 'resize', 'focusin', 'focusout', 'mouseover', 'keydown']) {
+        window.addEventListener(type, () => { state.dirty = true; }, { capture: true, passive: true });
+      }
+    }
+    state.observer.disconnect();
+    state.dirty = false;
+    state.observer.observe(document, OBSERVED);
+  }
+  const refOf = (node) => {
+    let ref = state.refs.get(node);
+    if (!ref) {
+      ref = 'e' + state.nextRef++;
+      state.refs.set(node, ref);
+    }
+    state.byRef.set(ref, node);
+    return ref;
+  };
+
+  const clean = (s) => (s ? s.replace(/\s+/g, ' ').trim().slice(0, MAX_NAME) : '');
+  const textOfIds = (ids) =>
+    ids.split(/\s+/).map((id) => document.getElementById(id)?.textContent || '').join(' ');
+
+  const roleOf = (el) => {
+    const explicit = el.getAttribute('role');
+    if (explicit) return explicit.split(/\s+/)[0];
+    const tag = el.tagName;
+    if (tag === 'A' || tag === 'AREA') return el.hasAttribute('href') ? 'link' : null;
+    if (tag === 'IMG') return el.getAttribute('alt') === '' ? null : 'img';
+    if (tag === 'SELECT') return el.multiple || el.size > 1 ? 'listbox' : 'combobox';
+    if (tag === 'SECTION')
+      return el.hasAttribute('aria-label') || el.hasAttribute('aria-labelledby') ? 'region' : null;
+    if (tag === 'INPUT') {
+      const type = (el.getAttribute('type') || 'text').toLowerCase();
+      if (type === 'hidden') return null;
+      if (INPUT_ROLES[type]) return INPUT_ROLES[type];
+      if (el.hasAttribute('list')) return 'combobox';
+      return type === 'search' ? 'searchbox' : 'textbox';
+    }
+    return TAG_ROLES[tag] || null;
+  };
+
+  const nameOf = (el, role) => {
+    let name = el.getAttribute('aria-label');
+    if (!name && el.hasAttribute('aria-labelledby')) name = textOfIds(el.getAttribute('aria-labelledby'));
+    if (!name && el.labels && el.labels.length) name = Array.from(el.labels, (l) => l.textContent).join(' ');
+    if (!name && (el.tagName === 'IMG' || el.tagName === 'AREA' || el.type === 'image')) name = el.getAttribute('alt');
+    if (!name && el.tagName === 'INPUT' && (el.type === 'submit' || el.type === 'button' || el.type === 'reset'))
+      name = el.value || (el.type === 'reset' ? 'Reset' : el.type === 'submit' ? 'Submit' : '');
+    if (!name && NAME_FROM_CONTENT.has(role)) name = el.textContent;
+    if (!name) name = el.getAttribute('title');
+    return clean(name);
+  };
+  // Kept on the registry so resolver.RESOLVE_JS names elements the same way
+  state.roleOf = roleOf;
+  state.nameOf = nameOf;
+
+  const valueOf = (el, role) => {
+    if (el.tagName === 'SELECT') return clean(el.selectedOptions[0]?.textContent);
+    if (el.tagName === 'TEXTAREA') return el.value;
+    if (el.tagName === 'INPUT' && !INPUT_ROLES[(el.type || '').toLowerCase()]) return el.value;
+    if (el.isContentEditable && (role === 'textbox' || role === 'searchbox')) return clean(el.textContent);
+    return el.getAttribute('aria-valuetext') || el.getAttribute('aria-valuenow') || '';
+  };
+
+  const statesOf = (el) => {
+    const states = [];
+    const aria = (name) => el.getAttribute('aria-' + name) === 'true';
+    if (el.checked === true || aria('checked')) states.push('checked');
+    if ((el.tagName === 'OPTION' && el.selected) || aria('selected')) states.push('selected');
+    if (el.disabled === true || aria('disabled')) states.push('disabled');
+    if (el.required === true || aria('required')) states.push('required');
+    if (el.readOnly === true || aria('readonly')) states.push('readonly');
+    if ((el.tagName === 'DETAILS' && el.open) || aria('expanded')) states.push('expanded');
+    if (aria('pressed')) states.push('pressed');
+    if (aria('busy')) states.push('busy');
+    return states;
+  };
+
+  const childrenOf = (node) => {
+    if (node.shadowRoot) {
+      // Observing the document doesn't reach into shadow roots
+      if (!state.dirty) state.observer.observe(node.shadowRoot, OBSERVED);
+      return node.shadowRoot.childNodes;
+    }
+    if (node.tagName === 'SLOT') return node.assignedNodes({ flatten: true });
+    return node.childNodes;
+  };
+
+  const isOffscreen = (el) => {
+    const rect = el.getBoundingClientRect();
+    return rect.bottom < 0 || rect.top > innerHeight || rect.right < 0 || rect.left > innerWidth;
+  };
+
+  // -1 above the viewport plus margin, 1 below it, 0 inside (or no box of its
+  // own, like display: contents, which is judged by its children)
+  const margin = options.margin || 0;
+  const band = (el) => {
+    const rect = el.getBoundingClientRect();
+    if (!rect.width && !rect.height) return 0;
+    if (rect.bottom < -margin) return -1;
+    return rect.top > innerHeight + margin ? 1 : 0;
+  };
+  // Stubs keep their ref across snapshots like nodes do, one per container and side
+  const stubRef = (container, side) => {
+    if (!state.stubRefs) state.stubRefs = new WeakMap();
+    let refs = state.stubRefs.get(container);
+    if (!refs) state.stubRefs.set(container, (refs = {}));
+    if (!refs[side]) refs[side] = 'e' + state.nextRef++;
+    state.byRef.set(refs[side], container);
+    state.stubs.set(refs[side], { container, side });
+    return refs[side];
+  };
+
+  // Stack entries: [node, depth of nearest emitted ancestor, parent names itself
+  // from content, nearest emitted ancestor is outside the viewport]. Collapsed
+  // runs of children are pushed as { stub, side, count } instead of nodes.
+  const stack = [];
+  const scoped = options.scope === 'viewport' && !expanding;
+  const pushChildren = (node, depth, fromContent, offscreen, only = 0) => {
+    let children = childrenOf(node);
+    if (only) children = Array.from(children).filter((child) => child.nodeType === Node.ELEMENT_NODE && band(child) === only);
+    if (!scoped || fromContent) {
+      for (let i = children.length - 1; i >= 0; i--) stack.push([children[i], depth, fromContent, offscreen]);
+      return;
+    }
+    // Children entirely above or below the band are left out, and counted in
+    // one stub per side, so the walk never descends into them
+    const kept = [];
+    let above = 0;
+    let below = 0;
+    for (const child of children) {
+      const side = child.nodeType === Node.ELEMENT_NODE && !SKIP_TAGS.has(child.tagName) ? band(child) : 0;
+      if (side < 0) above++;
+      else if (side > 0) below++;
+      else kept.push(child);
+    }
+    if (below) stack.push([{ stub: node, side: 1, count: below }, depth, fromContent, true]);
+    for (let i = kept.length - 1; i >= 0; i--) stack.push([kept[i], depth, fromContent, offscreen]);
+    if (above) stack.push([{ stub: node, side: -1, count: above }, depth, fromContent, true]);
+  };
+
+  const nodes = [];
+  let wordCount = 0;
+  if (expanding) {
+    // A stub expands to the children it collapsed, any other ref to its subtree
+    const stub = state.stubs && state.stubs.get(options.root);
+    let root = stub ? stub.container : state.byRef.get(options.root);
+    if (!root || !root.isConnected) return null;
+    if (root.nodeType === Node.DOCUMENT_NODE) root = root.body;
+    if (root.nodeType === Node.TEXT_NODE) root = root.parentElement;
+    const role = roleOf(root) || 'group';
+    nodes.push({ depth: 0, ref: refOf(root), role, name: nameOf(root, role) });
+    pushChildren(root, 0, false, false, stub ? stub.side : 0);
+  } else {
+    nodes.push({ depth: 0, ref: refOf(document), role: 'WebArea', name: clean(document.title) });
+    if (document.body) pushChildren(document.body, 0, false, false);
+  }
+
+  while (stack.length) {
+    const [node, depth, fromContent, parentOffscreen] = stack.pop();
+    if (node.stub) {
+      const where = node.side < 0 ? 'above' : 'below';
+      nodes.push({
+        depth: depth + 1,
+        ref: stubRef(node.stub, node.side),
+        role: 'collapsed',
+        name: `${node.count} element${node.count === 1 ? '' : 's'} ${where} the viewport`,
+        offscreen: true,
+      });
+      continue;
+    }
+    if (node.nodeType === Node.TEXT_NODE) {
+      const text = clean(node.data);
+      if (!text) continue;
+      wordCount += text.split(' ').length;
+      if (fromContent) continue;
+      const entry = { depth: depth + 1, ref: refOf(node), role: 'text', name: text };
+      if (parentOffscreen) entry.offscreen = true;
+      nodes.push(entry);
+      continue;
+    }
+    if (node.nodeType !== Node.ELEMENT_NODE || SKIP_TAGS.has(node.tagName)) continue;
+    if (node.hidden || node.getAttribute('aria-hidden') === 'true') continue;
+    if (!node.checkVisibility() && getComputedStyle(node).display !== 'contents') continue;
+
+    const role = roleOf(node);
+    if (!role || role === 'none' || role === 'presentation' || role === 'generic') {
+      pushChildren(node, depth, fromContent, parentOffscreen);
+      continue;
+    }
+    const entry = { depth: depth + 1, ref: refOf(node), role };
+    const name = nameOf(node, role);
+    if (name) entry.name = name;
+    const value = valueOf(node, role);
+    if (value) entry.value = value;
+    if (node.hasAttribute('aria-describedby')) {
+      const description = clean(textOfIds(node.getAttribute('aria-describedby')));
+      if (description) entry.description = description;
+    }
+    const placeholder = node.getAttribute('placeholder');
+    if (placeholder) entry.placeholder = placeholder;
+    const states = statesOf(node);
+    if (states.length) entry.states = states;
+    const offscreen = isOffscreen(node);
+    if (offscreen) entry.offscreen = true;
+    nodes.push(entry);
+    pushChildren(node, depth + 1, fromContent || NAME_FROM_CONTENT.has(role), offscreen);
+  }
+
+  const active = document.activeElement;
+  return {
+    url: location.href,
+    title: document.title,
+    documentId: state.documentId,
+    seq: state.seq,
+    scope: scoped ? 'viewport' : 'page',
+    focused: active ? { tagName: active.tagName, id: active.id, className: String(active.className) } : null,
+    wordCount,
+    nodes,
+  };
+}
+"""
+
+# True when the page changed since its last snapshot, or was never snapshotted
+IS_STALE_JS = "() => !window.__sbu || window.__sbu.dirty !== false"
+
+
+def snapshot_options(scope: Optional[str] = None) -> dict:
+    scope = scope or SNAPSHOT_SCOPE
+    if scope not in ("page", "viewport"):
+        raise ValueError(f"Unknown snapshot scope '{scope}', use page or viewport")
+    return {"scope": scope, "margin": SNAPSHOT_MARGIN_PX}
+
+
+def snapshot_page(page: Page, scope: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extracts the raw snapshot (url, title, focused element, word count and a
+    flat pre-order node list) with a single injected script call. Every node
+    carries a ref that stays the same for as long as its DOM node lives.
+    """
+    return page.evaluate(SNAPSHOT_JS, snapshot_options(scope))
+
+
+def expand_subtree(page: Page, ref: str) -> Optional[Dict[str, Any]]:
+    """
+    Snapshots the subtree under a ref, in full, or the children a collapsed
+    stub stands for. None if the ref is not in the page.
+    """
+    return page.evaluate(SNAPSHOT_JS, {**snapshot_options(), "root": ref})
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, str):
+        return f'"{value}"' if " " in value else value
+    return str(value).lower()  # Convert True/False to true/false
+
+
+def describe_node(node: Dict[str, Any]) -> str:
+    """
+    One-line description of a node, e.g. 'textbox "Search" [value="abc"] [ref=e4] [interactive]'.
+    """
+    role = node["role"]
+    description = [role]
+    if node.get("name"):
+        description.append(f'"{node["name"]}"')
+    for attr in ("value", "description", "placeholder"):
+        if node.get(attr):
+            description.append(f'[{attr}="{node[attr]}"]')
+    for state in node.get("states", ()):
+        description.append(f"[{state}]")
+    description.append(f"[ref={node['ref']}]")
+    if role in INTERACTIVE_ROLES:
+        description.append("[interactive]")
+    return " ".join(description)
+
+
+def serialize_metadata(snapshot: Dict[str, Any], viewport: Optional[dict] = None) -> List[str]:
+    lines = [
+        f"url: {snapshot['url']}",
+        f"title: {snapshot['title']}",
+        f"viewport: {viewport}",
     ]
-    
-    # Get the accessibility tree from Playwright
-    accessibility_snapshot = page.accessibility.snapshot()
-
-    # Counter for unique element references
-    ref_counter = 1
-
-    def process_node(node: Dict[str, Any], indent: int = 1, path: List[str] = []) -> None:
-        nonlocal ref_counter
-
-        # Skip nodes without a role (usually non-interactive elements)
-        if "role" not in node:
-            return
-
-        # Format the node entry
-        node_description = []
-        node_attributes = {}
-
-        # Add the role (element type)
-        role = node.get("role", "generic")
-        node_description.append(role)
-        node_attributes["role"] = role
-
-        # Add the name (usually text content) if available
-        if node.get("name"):
-            node_description.append(f'"{node["name"]}"')
-            node_attributes["name"] = node.get("name")
-
-        # Add any states and attributes
-        for attr in ["value", "description", "placeholder"]:
-            if attr in node and node[attr]:
-                node_attributes[attr] = node[attr]
-                node_description.append(f"[{attr}=\"{node[attr]}\"]")
-                
-        # Add boolean states
-        for state in ["checked", "selected", "disabled", "required", "readonly", "expanded", "pressed", "busy"]:
-            if node.get(state):
-                node_description.append(f"[{state}]")
-                node_attributes[state] = True
-        
-        # Add aria attributes if present
-        for key in node:
-            if key.startswith("aria") and node[key]:
-                node_attributes[key] = node[key]
-                node_description.append(f"[{key}=\"{node[key]}\"]")
-                
-        # Add HTML tag if available
-        if "tag" in node:
-            node_attributes["tag"] = node["tag"]
-            node_description.append(f"[tag={node['tag']}]")
-            
-        # Add CSS classes if available
-        if "className" in node:
-            node_attributes["className"] = node["className"]
-            node_description.append(f"[class=\"{node['className']}\"]")
-
-        # Add a unique reference ID for this element
-        ref_id = f"e{ref_counter}"
-        ref_counter += 1
-        node_description.append(f"[ref={ref_id}]")
-        node_attributes["ref"] = ref_id
-        
-        # Add DOM path if possible
-        current_path = path + [role]
-        path_str = " > ".join(current_path)
-        node_attributes["path"] = path_str
-        
-        # Determine if element is likely interactive
-        is_interactive = role in ["button", "link", "textbox", "checkbox", "radio", "combobox", 
-                                 "listbox", "menuitem", "menuitemcheckbox", "menuitemradio", 
-                                 "option", "switch", "tab"]
-        if is_interactive:
-            node_description.append("[interactive]")
-            node_attributes["interactive"] = True
-
-        # Create the full node entry with proper indentation
-        prefix = "  " * indent
-        entry = f"{prefix}- {' '.join(node_description)}"
-        yaml_lines.append(entry)
-        
-        # Add attributes as nested properties with additional indent
-        attr_prefix = "  " * (indent + 1)
-        for key, value in node_attributes.items():
-            # Format value correctly based on type
-            if isinstance(value, str):
-                formatted_value = f'"{value}"' if " " in value else value
-            else:
-                formatted_value = str(value).lower()  # Convert True/False to true/false
-                
-            yaml_lines.append(f"{attr_prefix}{key}: {formatted_value}")
-
-        # Process children if any exist
-        children = node.get("children", [])
-        if children:
-            yaml_lines.append(f"{attr_prefix}children:")
-            for child in children:
-                process_node(child, indent + 2, current_path)
-
-    # Start with the root node
-    if accessibility_snapshot:
-        process_node(accessibility_snapshot)
-    else:
-        yaml_lines.append("  - No accessibility content available")
-        
-    # Add focused element information
-    try:
-        focused_element = page.evaluate("() => { const el = document.activeElement; return el ? { tagName: el.tagName, id: el.id, className: el.className } : null; }")
-        if focused_element:
-            yaml_lines.append("focused_element:")
-            for key, value in focused_element.items():
-                yaml_lines.append(f"  {key}: {value}")
-    except:
-        yaml_lines.append("focused_element: Unknown")
-    
-    # Add visible text count (helpful to determine content richness)
-    try:
-        text_count = page.evaluate("() => document.body.innerText.split(/\\s+/).filter(Boolean).length")
-        yaml_lines.append(f"text_word_count: {text_count}")
-    except:
-        pass
-        
-    # Return the YAML-formatted snapshot
+    if snapshot.get("scope") == "viewport":
+        lines.append("scope: viewport only, expand(ref) opens a collapsed node")
+    return lines
+
+
+def serialize_footer(snapshot: Dict[str, Any]) -> List[str]:
+    lines = []
+    focused_element = snapshot.get("focused")
+    if focused_element:
+        lines.append("focused_element:")
+        for key, value in focused_element.items():
+            lines.append(f"  {key}: {value}")
+    lines.append(f"text_word_count: {snapshot['wordCount']}")
+    return lines
+
+
+def serialize_snapshot(snapshot: Dict[str, Any], viewport: Optional[dict] = None) -> str:
+    """
+    Renders a flat snapshot as YAML. The node list is already in pre-order with
+    depths, so a single loop is enough; the role path is built incrementally per
+    depth instead of copying a list at every node.
+    """
+    yaml_lines = serialize_metadata(snapshot, viewport)
+    yaml_lines.append("elements:")
+    append = yaml_lines.append
+
+    nodes: List[Dict[str, Any]] = snapshot["nodes"]
+    if not nodes:
+        append("  - No accessibility content available")
+
+    paths: List[str] = []
+    last = len(nodes) - 1
+    for i, node in enumerate(nodes):
+        depth = node["depth"]
+        role = node["role"]
+        name = node.get("name")
+
+        # Each level of nesting adds the entry indent plus the "children:" key
+        prefix = "  " * (1 + 2 * depth)
+        attr_prefix = prefix + "  "
+
+        path_str = f"{paths[depth - 1]} > {role}" if depth else role
+        if depth < len(paths):
+            paths[depth] = path_str
+        else:
+            paths.append(path_str)
+
+        append(f"{prefix}- {describe_node(node)}")
+        append(f"{attr_prefix}role: {_format_value(role)}")
+        if name:
+            append(f"{attr_prefix}name: {_format_value(name)}")
+        for attr in ("value", "description", "placeholder"):
+            value = node.get(attr)
+            if value:
+                append(f"{attr_prefix}{attr}: {_format_value(value)}")
+        for state in node.get("states", ()):
+            append(f"{attr_prefix}{state}: true")
+        append(f"{attr_prefix}ref: {node['ref']}")
+        append(f"{attr_prefix}path: {_format_value(path_str)}")
+        if role in INTERACTIVE_ROLES:
+            append(f"{attr_prefix}interactive: true")
+
+        if i < last and nodes[i + 1]["depth"] > depth:
+            append(f"{attr_prefix}children:")
+
+    yaml_lines.extend(serialize_footer(snapshot))
     return "\n".join(yaml_lines)
+
+
+def get_browser_state(page: Page) -> str:
+    return serialize_snapshot(snapshot_page(page), page.viewport_size)
@@ -0,0 +1,170 @@
+"""
+Command line entry point for the agent. Only argparse is imported up front:
+dspy, Playwright and the rest load once a command runs, so --help and
+argument errors are instant, and weave only loads when tracing to W&B is on
+(WANDB_PROJECT_NAME is set and --no-weave isn't given).
+
+    python cli.py run --task "Open arxiv.org and search for webarena" [--no-record]
+    python cli.py tasks tasks.txt --concurrency 8
+    python cli.py batch benchmarks/fixture_tasks.jsonl --workers 2
+
+python main.py, async_main.py and batch.py still work, as run, tasks and batch.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import List, Optional
+
+DEFAULT_TASK = "Open arxiv.org, and search for webarena, click on the first result."
+# network_profile.PROFILES, spelled out as importing it loads Playwright
+NETWORK_PROFILES = ("full", "screenshots", "lite")
+NETWORK_PROFILE_HELP = (
+    "Which requests to block: full, screenshots or lite. Defaults to NETWORK_PROFILE, or screenshots when recording."
+)
+
+
+def _run(args: argparse.Namespace) -> None:
+    import main
+
+    if not args.no_weave:
+        main.init_weave()
+    main.run(
+        args.task,
+        replay=args.replay,
+        save_decisions_to=args.save_decisions,
+        use_cache=not args.no_cache,
+        trace=args.trace,
+        profile=args.network_profile,
+        use_sessions=not args.no_sessions,
+        record=not args.no_record,
+    )
+
+
+def _tasks(args: argparse.Namespace) -> None:
+    import asyncio
+
+    import async_main
+    import main
+    import settle
+
+    if not args.no_weave:
+        main.init_weave()
+    with open(args.tasks_file) as f:
+        tasks = [line.strip() for line in f if line.strip()]
+    results = asyncio.run(
+        async_main.run_tasks(
+            tasks,
+            concurrency=args.concurrency,
+            browsers=args.browsers,
+            headless=not args.headed,
+            max_iters=args.max_iters,
+            record=args.record,
+            use_cache=not args.no_cache,
+            trace_dir=args.trace_dir,
+            profile=args.network_profile,
+            use_sessions=not args.no_sessions,
+        )
+    )
+    for task, result in zip(tasks, results):
+        answer = f"ERROR: {result}" if isinstance(result, Exception) else result.answer
+        print(f"{task}\n  -> {answer}")
+    print(f"Settle latency per action: {settle.settle_summary()}")
+
+
+def _batch(args: argparse.Namespace) -> None:
+    import batch
+
+    logging.basicConfig(level=logging.INFO)
+    name = os.path.splitext(os.path.basename(args.source.rstrip("/")))[0]
+    output = args.output or f"results/{name}.jsonl"
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    summary = batch.run_batch(
+        batch.load_tasks(args.source, split=args.split, limit=args.limit),
+        output,
+        workers=args.workers,
+        headless=not args.headed,
+        max_iters=args.max_iters,
+        record=args.record,
+        use_cache=not args.no_cache,
+        trace_dir=args.trace_dir,
+        profile=args.network_profile,
+        retry_errors=args.retry_errors,
+        use_sessions=not args.no_sessions,
+        use_weave=not args.no_weave,
+    )
+    print(f"Summary: {json.dumps(summary)}")
+    print(f"Results in {output}")
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a whole number of at least 1, got '{value}'")
+    return number
+
+
+def _add_common(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--no-cache", action="store_true", help="Always call the LM, don't reuse cached decisions.")
+    parser.add_argument(
+        "--no-sessions", action="store_true", help="Start without the cookies and storage earlier runs saved."
+    )
+    parser.add_argument("--no-weave", action="store_true", help="Don't trace the LM calls to W&B weave.")
+    parser.add_argument("--network-profile", choices=NETWORK_PROFILES, help=NETWORK_PROFILE_HELP)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Run the browser agent.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run one task in a visible browser.")
+    run.add_argument("--task", default=DEFAULT_TASK)
+    run.add_argument("--replay", help="Replay the decisions saved with --save-decisions instead of calling the LM.")
+    run.add_argument("--save-decisions", help="Save the agent's decisions to this json file.")
+    run.add_argument(
+        "--trace",
+        help="Where to write the timing spans, as Chrome trace events for .json, JSONL "
+        "otherwise. Defaults to frames/<run_id>/trace.jsonl.",
+    )
+    run.add_argument("--no-record", action="store_true", help="Don't save frames and a gif of the run.")
+    _add_common(run)
+    run.set_defaults(handler=_run)
+
+    tasks = commands.add_parser("tasks", help="Run the tasks of a text file concurrently on a browser pool.")
+    tasks.add_argument("tasks_file", help="Text file with one task per line.")
+    tasks.add_argument("--concurrency", type=_positive_int, default=8)
+    tasks.add_argument("--browsers", type=_positive_int, default=1)
+    tasks.add_argument("--max-iters", type=int, default=20)
+    tasks.add_argument("--headed", action="store_true")
+    tasks.add_argument("--record", action="store_true", help="Save frames and a gif per task.")
+    tasks.add_argument("--trace-dir", help="Write each task's timing spans there as JSONL.")
+    _add_common(tasks)
+    tasks.set_defaults(handler=_tasks)
+
+    batch = commands.add_parser("batch", help="Run a task dataset over worker processes, resumably.")
+    batch.add_argument("source", help="A .txt/.json/.jsonl task file or a Hugging Face dataset name.")
+    batch.add_argument("--split", default="test", help="Dataset split, for Hugging Face datasets.")
+    batch.add_argument("--limit", type=int, help="Only the first N tasks.")
+    batch.add_argument("--output", help="Results JSONL, also the checkpoint to resume from.")
+    batch.add_argument("--workers", type=_positive_int, default=4)
+    batch.add_argument("--max-iters", type=int, default=20)
+    batch.add_argument("--headed", action="store_true")
+    batch.add_argument("--record", action="store_true", help="Save frames and a gif per task.")
+    batch.add_argument("--trace-dir", help="Write each task's timing spans there as JSONL.")
+    batch.add_argument("--retry-errors", action="store_true", help="Rerun the tasks that errored.")
+    _add_common(batch)
+    batch.set_defaults(handler=_batch)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,175 @@
 import logging
-from typing import Callable
+from typing import Callable, Optional
 
 
 import dspy
 from dspy.predict.react import _fmt_exc
 
+from decision_cache import DecisionCache
+import tracing
+from trajectory_memory import TrajectoryMemory
+
 logger = logging.getLogger(__name__)
 
 
 class ReActTruncated(dspy.ReAct):
-    def __init__(self, signature, tools: list[Callable], max_iters=5):
+    def __init__(
+        self,
+        signature,
+        tools: list[Callable],
+        max_iters=5,
+        memory: Optional[TrajectoryMemory] = None,
+        cache: Optional[DecisionCache] = None,
+    ):
         super().__init__(signature, tools, max_iters)
+        self.memory = memory or TrajectoryMemory()
+        self.cache = cache
+
+    def _format_trajectory(self, trajectory):
+        return super()._format_trajectory(self.memory.view(trajectory))
+
+    def truncate_trajectory(self, trajectory):
+        # The full trajectory is kept, the memory decides what is shown
+        self.memory.shrink()
+        tracing.increment("truncations")
+        return trajectory
+
+    def _cache_key(self, module, trajectory, input_args):
+        if self.cache is None:
+            return None
+        lm = dspy.settings.lm
+        signature = "/".join(
+            [
+                getattr(lm, "model", ""),
+                self.signature.__name__,
+                "react" if module is self.react else "extract",
+            ]
+        )
+        return self.cache.key(signature, input_args, self._format_trajectory(trajectory))
+
+    def _call_with_potential_trajectory_truncation(self, module, trajectory, **input_args):
+        with tracing.span("lm", module="react" if module is self.react else "extract"):
+            key = self._cache_key(module, trajectory, input_args)
+            if key is not None and (cached := self.cache.get(key)) is not None:
+                tracing.annotate(cached=True)
+                return dspy.Prediction(**cached)
+            pred = super()._call_with_potential_trajectory_truncation(module, trajectory, **input_args)
+            if key is not None and pred is not None:
+                self.cache.set(key, dict(pred.items()))
+            return pred
+
+    async def _async_call_with_potential_trajectory_truncation(self, module, trajectory, **input_args):
+        with tracing.span("lm", module="react" if module is self.react else "extract"):
+            key = self._cache_key(module, trajectory, input_args)
+            if key is not None and (cached := self.cache.get(key)) is not None:
+                tracing.annotate(cached=True)
+                return dspy.Prediction(**cached)
+            pred = await super()._async_call_with_potential_trajectory_truncation(
+                module, trajectory, **input_args
+            )
+            if key is not None and pred is not None:
+                self.cache.set(key, dict(pred.items()))
+            return pred
+
+    def _prediction(self, trajectory, extract):
+        if extract is None:
+            # Even the extraction didn't fit in the context window
+            extract = {name: None for name in self.signature.output_fields}
+        return dspy.Prediction(trajectory=trajectory, **extract)
 
     def forward(self, **input_args):
         trajectory = {}
+        self.memory.reset()
         max_iters = input_args.pop("max_iters", self.max_iters)
         for idx in range(max_iters):
-            try:
-                pred = self._call_with_potential_trajectory_truncation(
-                    self.react, trajectory, **input_args
-                )
-            except ValueError as err:
-                logger.warning(
-                    f"Ending the trajectory: Agent failed to select a valid tool: {_fmt_exc(err)}"
-                )
-                break
-
-            # TODO: AttributeError: 'NoneType' object has no attribute 'next_thought' (context exceeded)
-            trajectory[f"thought_{idx}"] = pred.next_thought
-            trajectory[f"tool_name_{idx}"] = pred.next_tool_name
-            trajectory[f"tool_args_{idx}"] = pred.next_tool_args
-
-            print(f"[{idx}] Thought: {pred.next_thought}")
-            print(f"[{idx}] Tool: {pred.next_tool_name} | Args: {pred.next_tool_args}")
-
-            try:
-                # --------- truncate previous observations (DOM) ---------
-                for j in range(idx):
+            tracing.set_step(idx)
+            with tracing.span("step"):
+                try:
+                    pred = self._call_with_potential_trajectory_truncation(
+                        self.react, trajectory, **input_args
+                    )
+                except ValueError as err:
+                    logger.warning(
+                        f"Ending the trajectory: Agent failed to select a valid tool: {_fmt_exc(err)}"
+                    )
+                    break
+
+                if pred is None:
+                    # The prompt still exceeded the context window after truncating
+                    logger.warning("Ending the trajectory: context window exceeded")
+                    break
+
+                trajectory[f"thought_{idx}"] = pred.next_thought
+                trajectory[f"tool_name_{idx}"] = pred.next_tool_name
+                trajectory[f"tool_args_{idx}"] = pred.next_tool_args
+
+                print(f"[{idx}] Thought: {pred.next_thought}")
+                print(f"[{idx}] Tool: {pred.next_tool_name} | Args: {pred.next_tool_args}")
+
+                with tracing.span("tool", tool=pred.next_tool_name):
                     try:
-                        trajectory[f"observation_{j}"]["new_state"]["snapshot"] = "truncated"
-                    except TypeError:
-                        pass
-                # ---------
-                trajectory[f"observation_{idx}"] = self.tools[pred.next_tool_name](
-                    **pred.next_tool_args
-                )
-            except Exception as err:
-                trajectory[f"observation_{idx}"] = (
-                    f"Execution error in {pred.next_tool_name}: {_fmt_exc(err)}"
-                )
-
-            if pred.next_tool_name == "finish":
-                break
+                        trajectory[f"observation_{idx}"] = self.tools[pred.next_tool_name](
+                            **pred.next_tool_args
+                        )
+                    except Exception as err:
+                        tracing.annotate(error=type(err).__name__)
+                        trajectory[f"observation_{idx}"] = (
+                            f"Execution error in {pred.next_tool_name}: {_fmt_exc(err)}"
+                        )
+
+                if pred.next_tool_name == "finish":
+                    break
 
+        tracing.set_step(None)
         extract = self._call_with_potential_trajectory_truncation(
             self.extract, trajectory, **input_args
         )
-        return dspy.Prediction(trajectory=trajectory, **extract)
+        return self._prediction(trajectory, extract)
+
+    async def aforward(self, **input_args):
+        trajectory = {}
+        self.memory.reset()
+        max_iters = input_args.pop("max_iters", self.max_iters)
+        for idx in range(max_iters):
+            tracing.set_step(idx)
+            with tracing.span("step"):
+                try:
+                    pred = await self._async_call_with_potential_trajectory_truncation(
+                        self.react, trajectory, **input_args
+                    )
+                except ValueError as err:
+                    logger.warning(
+                        f"Ending the trajectory: Agent failed to select a valid tool: {_fmt_exc(err)}"
+                    )
+                    break
+
+                if pred is None:
+                    logger.warning("Ending the trajectory: context window exceeded")
+                    break
+
+                trajectory[f"thought_{idx}"] = pred.next_thought
+                trajectory[f"tool_name_{idx}"] = pred.next_tool_name
+                trajectory[f"tool_args_{idx}"] = pred.next_tool_args
+
+                print(f"[{idx}] Thought: {pred.next_thought}")
+                print(f"[{idx}] Tool: {pred.next_tool_name} | Args: {pred.next_tool_args}")
+
+                with tracing.span("tool", tool=pred.next_tool_name):
+                    try:
+                        trajectory[f"observation_{idx}"] = await self.tools[
+                            pred.next_tool_name
+                        ].acall(**pred.next_tool_args)
+                    except Exception as err:
+                        tracing.annotate(error=type(err).__name__)
+                        trajectory[f"observation_{idx}"] = (
+                            f"Execution error in {pred.next_tool_name}: {_fmt_exc(err)}"
+                        )
+
+                if pred.next_tool_name == "finish":
+                    break
+
+        tracing.set_step(None)
+        extract = await self._async_call_with_potential_trajectory_truncation(
+            self.extract, trajectory, **input_args
+        )
+        return self._prediction(trajectory, extract)
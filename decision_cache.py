@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+import re
+from typing import Optional
+
+import diskcache
+
+DECISION_CACHE_DIR = os.getenv("DECISION_CACHE_DIR", ".cache/decisions")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_observation(text: str) -> str:
+    """Whitespace differences between two renders of the same page don't change the decision."""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class DecisionCache:
+    """
+    On-disk cache of agent decisions (the outputs of one ReAct or extract
+    call), keyed by the signature, the task and a hash of the normalized
+    trajectory the decision was made from. A rerun of the same task over the
+    same pages doesn't call the LM at all.
+
+    Backed by diskcache, so it can be shared by threads and processes.
+    """
+
+    def __init__(self, directory: str = DECISION_CACHE_DIR, size_limit: int = 2**30):
+        self.cache = diskcache.Cache(directory, size_limit=size_limit)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, signature: str, inputs: dict, trajectory: str) -> str:
+        observation_hash = hashlib.sha256(normalize_observation(trajectory).encode()).hexdigest()
+        payload = json.dumps([signature, inputs, observation_hash], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: dict) -> None:
+        self.cache.set(key, value)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.cache)}
+
+    def close(self) -> None:
+        self.cache.close()
@@ -1,23 +1,50 @@
+import os
+import sys
 from datetime import datetime
-from typing import Literal
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
 from playwright.sync_api import sync_playwright
-import os
 import dspy
-import weave
 import actions
+import network_profile
 from custom_react import ReActTruncated
-import utils
-
-lm = dspy.LM(
-    "anthropic/claude-3-7-sonnet-latest",
-    api_key=os.getenv("ANTHROPIC_API_KEY"),
-    thinking={"type": "enabled", "budget_tokens": 10000},
-    temperature=1,
-    max_tokens=64000,
-)
-dspy.configure(lm=lm)
-weave.init(os.getenv("WANDB_PROJECT_NAME"))
+from decision_cache import DecisionCache
+from replay import ReplayLM, load_decisions, save_decisions
+from session_store import SessionStore, track_origins
+import settle
+from tabs import Tabs
+import tracing
+
+LM_MODEL = "anthropic/claude-3-7-sonnet-latest"
+
+
+def configure_lm() -> None:
+    """Configures the agent's LM, unless one already is (a replay, a test)."""
+    if dspy.settings.lm is not None:
+        return
+    lm = dspy.LM(
+        LM_MODEL,
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        thinking={"type": "enabled", "budget_tokens": 10000},
+        temperature=1,
+        max_tokens=64000,
+    )
+    dspy.configure(lm=lm)
+
+
+def init_weave(project: Optional[str] = None) -> bool:
+    """
+    Traces the LM calls to W&B weave when a project is set (WANDB_PROJECT_NAME).
+    weave takes seconds to import, so it is only imported then.
+    """
+    project = project or os.getenv("WANDB_PROJECT_NAME")
+    if not project:
+        return False
+    import weave
+
+    weave.init(project)
+    return True
+
 
 blacklist = ["https://google.com", "https://www.google.com"]
 
@@ -26,7 +53,9 @@ class NewStateSchema(BaseModel):
     url: str = Field(description="The URL of the page.")
     title: str = Field(description="The title of the page.")
     snapshot: str = Field(
-        description="The contents of the page, either DOM html or Yaml snapshot."
+        description="The contents of the page as a Yaml snapshot. When it starts with "
+        "'snapshot: diff since previous step' it only lists the nodes added, changed "
+        "or removed since the previous snapshot of the same page."
     )
 
 
@@ -37,6 +66,21 @@ class ResultSchema(BaseModel):
     result: Literal["success", "failure"] = Field(
         description="The result of the action."
     )
+    error: Optional[str] = Field(
+        default=None, description="What went wrong, when the result is a failure."
+    )
+
+
+class ActionStep(BaseModel):
+    action: Literal["click", "type", "select", "press"]
+    selector: str = Field(
+        default="",
+        description='The element, as a snapshot ref (e8), a role and name (button "Search") or a CSS selector. Optional for press.',
+    )
+    text: str = Field(
+        default="",
+        description="The text to type, the option to select (value or label) or the key to press (Enter, Tab...).",
+    )
 
 
 class BrowserAgent(dspy.Signature):
@@ -50,74 +94,184 @@ class BrowserAgent(dspy.Signature):
     answer: str = dspy.OutputField()
 
 
-if __name__ == "__main__":
+def run(
+    task: str,
+    replay: Optional[str] = None,
+    save_decisions_to: Optional[str] = None,
+    use_cache: bool = True,
+    trace: Optional[str] = None,
+    profile: Optional[str] = None,
+    use_sessions: bool = True,
+    record: bool = True,
+) -> dspy.Prediction:
+    """
+    Runs the agent on a task in a visible Chrome window, printing its answer
+    and what the run cost. See cli.py for the options.
+    """
+    if replay:
+        decisions = load_decisions(replay)
+        task = decisions["task"]
+        dspy.configure(lm=ReplayLM(decisions))
+    else:
+        configure_lm()
+    if profile is None:
+        # Recorded runs need images in their screenshots
+        profile = "screenshots" if record else network_profile.NETWORK_PROFILE
+    # Replays are deterministic already, the cache would only hide the LM stub
+    cache = None if not use_cache or replay else DecisionCache()
+
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=False, channel="chrome")
-        page = browser.new_page()
+        # Past the cookie banners and logins of earlier runs, except for replays
+        # that have to see the pages as they were recorded
+        sessions = None if not use_sessions or replay else SessionStore()
+        context = browser.new_context(storage_state=sessions.storage_state() if sessions else None)
+        origins = track_origins(context)
+        page = context.new_page()
+        network = network_profile.apply(page.context, profile)
+        settle.watch(page)
         run_id = str(datetime.now().timestamp())
 
-        os.makedirs(f"frames/{run_id}", exist_ok=True)
-        frame_counter = {"count": 0}
+        recorder = None
+        if record:
+            # PIL and the gif code are only loaded for recorded runs
+            from recorder import FrameRecorder
 
-        def save_frame(page, action_name, extra_info=""):
+            os.makedirs(f"frames/{run_id}", exist_ok=True)
+            # Frames are encoded into the gif by a background thread as the run goes
             # TODO: Record mouse click(?) or bounding boxes
-            frame_counter["count"] += 1
-            filename = f"{frame_counter['count']:03d}_{action_name}"
-            if extra_info:
-                filename += f"_{extra_info}"
-            filename += ".png"
-            path = os.path.join(f"frames/{run_id}", filename)
-            page.screenshot(path=path, full_page=False)
-            return path
+            recorder = FrameRecorder(f"frames/{run_id}/animation.gif", frames_dir=f"frames/{run_id}")
+
+        # The tools act on whichever tab is current
+        tabs = Tabs(page)
+
+        def save_frame(page, action_name, extra_info=""):
+            if recorder is not None:
+                recorder.capture(page, action_name, extra_info)
 
         def go_to(url: str) -> ResultSchema:
             """Navigates to the specified URL."""
-            new_state = actions.go_to(page, url)
+            new_state = actions.go_to(tabs.page, url)
             ss_info = url.replace("https://", "").replace("/", "_")
-            save_frame(page, "go_to", extra_info=ss_info)
+            save_frame(tabs.page, "go_to", extra_info=ss_info)
             return {"new_state": new_state, "result": "success"}
 
         def click(selector: str) -> ResultSchema:
-            """Clicks on the element specified by the selector."""
-            new_state = actions.click(page, selector)
+            """Clicks on the element specified by the selector: a snapshot ref (e8), a role and name (button "Search") or a CSS selector. If the click opens a new tab, switches to it."""
+            new_state = actions.click(tabs.page, selector)
+            popup = tabs.take_opened()
+            if popup is not None:
+                new_state = tabs.switch_tab(tabs.id_of(popup))
             ss_info = selector.replace("#", "id_").replace(".", "cls_")
-            save_frame(page, "click", extra_info=ss_info)
+            save_frame(tabs.page, "click", extra_info=ss_info)
             return {"new_state": new_state, "result": "success"}
 
         def type_text(selector: str, text: str, submit: bool = False) -> ResultSchema:
-            """Types the given text into the element specified by the selector. If submit is True, the text will be submitted by pressing enter."""
-            new_state = actions.type_text(page, selector, text, True)
+            """Types the given text into the element specified by the selector (a ref, role and name, label text or CSS selector). If submit is True, the text will be submitted by pressing enter."""
+            # Submitting inside the same action keeps a single snapshot per step,
+            # so the next diff is relative to the state the agent actually saw
+            new_state = actions.type_text(tabs.page, selector, text, True, submit=submit)
             ss_info = selector.replace("#", "id_").replace(".", "cls_")
-            save_frame(page, "type_text", extra_info=ss_info)
-
-            if submit:
-                new_state = actions.submit(page)
-                save_frame(page, "submit", extra_info=ss_info)
-                return {"new_state": new_state, "result": "success"}
-
+            save_frame(tabs.page, "submit" if submit else "type_text", extra_info=ss_info)
             return {"new_state": new_state, "result": "success"}
 
         def scroll(direction: Literal["up", "down"]) -> ResultSchema:
             """Scrolls the page up or down."""
-            new_state = actions.scroll(page, direction)
-            save_frame(page, "scroll", extra_info=direction)
+            new_state = actions.scroll(tabs.page, direction)
+            save_frame(tabs.page, "scroll", extra_info=direction)
             return {"new_state": new_state, "result": "success"}
 
         def go_back() -> ResultSchema:
             """Navigates back to the previous page."""
-            new_state = actions.go_back(page)
-            save_frame(page, "go_back")
+            new_state = actions.go_back(tabs.page)
+            save_frame(tabs.page, "go_back")
+            return {"new_state": new_state, "result": "success"}
+
+        def show_more_elements(part: int) -> str:
+            """Shows another part of the current page's elements, when the snapshot says it was split into parts."""
+            return actions.show_more_elements(tabs.page, part)
+
+        def expand(ref: str) -> str:
+            """Shows the elements under a ref, e.g. the ones a collapsed node of the snapshot stands for."""
+            return actions.expand(tabs.page, ref)
+
+        def run_actions(steps: list[ActionStep]) -> ResultSchema:
+            """Runs several click/type/select/press steps in order, e.g. to fill a whole form, and returns one snapshot at the end. Stops at the first step that fails."""
+            outcome = actions.run_actions(tabs.page, [step.model_dump() for step in steps])
+            save_frame(tabs.page, "run_actions", extra_info=f"{outcome['completed']}_of_{len(steps)}")
+            if outcome["error"]:
+                return {"new_state": outcome["new_state"], "result": "failure", "error": outcome["error"]}
+            return {"new_state": outcome["new_state"], "result": "success"}
+
+        def new_tab(url: str = "") -> ResultSchema:
+            """Opens a new tab, optionally at the given URL, and switches to it. Other tabs keep their state."""
+            new_state = tabs.new_tab(url or None)
+            save_frame(tabs.page, "new_tab", extra_info=tabs.id_of(tabs.page))
+            return {"new_state": new_state, "result": "success"}
+
+        def switch_tab(tab_id: str) -> ResultSchema:
+            """Switches to the tab with the given id (see list_tabs). Returns instantly if the tab didn't change."""
+            new_state = tabs.switch_tab(tab_id)
+            save_frame(tabs.page, "switch_tab", extra_info=tab_id)
+            return {"new_state": new_state, "result": "success"}
+
+        def list_tabs() -> str:
+            """Lists the open tabs with their id, title and URL."""
+            return tabs.list_tabs()
+
+        def close_tab(tab_id: str) -> ResultSchema:
+            """Closes the tab with the given id. If it was the current tab, switches to the last open one."""
+            new_state = tabs.close_tab(tab_id)
+            save_frame(tabs.page, "close_tab", extra_info=tab_id)
             return {"new_state": new_state, "result": "success"}
 
         react = ReActTruncated(
             BrowserAgent,
-            tools=[go_to, click, type_text, scroll, go_back],
+            tools=[
+                go_to,
+                click,
+                type_text,
+                scroll,
+                go_back,
+                show_more_elements,
+                expand,
+                run_actions,
+                new_tab,
+                switch_tab,
+                list_tabs,
+                close_tab,
+            ],
             max_iters=20,
+            cache=cache,
         )
-        result = react(
-            task="Open arxiv.org, and search for webarena, click on the first result."
-        )
+        with tracing.trace(run_id) as tracer:
+            result = react(task=task)
         print(result.answer)
+        if sessions is not None:
+            sessions.save(context.storage_state(indexed_db=True), origins)
+            print(f"Session store: {sessions.stats()}")
+            sessions.close()
+        if save_decisions_to:
+            save_decisions(save_decisions_to, task, result)
+        if cache is not None:
+            print(f"Decision cache: {cache.stats()}")
+        print(f"Settle latency per action: {settle.settle_summary()}")
+        print(f"Network: {network.summary()}")
+        print(f"Tabs: {tabs.stats()}")
+        trace_path = trace or f"frames/{run_id}/trace.jsonl"
+        os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+        tracer.export(trace_path)
+        print(f"Time per phase: {tracer.summary()}")
+        print(f"Saved trace to {trace_path}")
+
+        if recorder is not None:
+            gif_path = recorder.close()
+            if gif_path:
+                print(f"Saved animation gif to {gif_path}")
+        return result
+
+
+if __name__ == "__main__":
+    import cli
 
-        # After finishing, join all frames as a gif (or video if preferred)
-        utils.create_gif(run_id)
+    cli.main(["run", *sys.argv[1:]])
@@ -0,0 +1,231 @@
+import logging
+import os
+from collections import Counter
+from typing import Iterable, Union
+from urllib.parse import urlsplit
+
+from playwright.async_api import BrowserContext as AsyncBrowserContext, Page as AsyncPage
+from playwright.sync_api import BrowserContext, Page, Request, Response, Route
+
+logger = logging.getLogger(__name__)
+
+NETWORK_PROFILE = os.getenv("NETWORK_PROFILE", "lite")
+
+# Ads, analytics and session-replay hosts, matched with their subdomains
+TRACKER_DOMAINS = frozenset(
+    [
+        "doubleclick.net",
+        "googlesyndication.com",
+        "googleadservices.com",
+        "google-analytics.com",
+        "googletagmanager.com",
+        "googletagservices.com",
+        "adservice.google.com",
+        "connect.facebook.net",
+        "analytics.twitter.com",
+        "ads-twitter.com",
+        "bat.bing.com",
+        "clarity.ms",
+        "scorecardresearch.com",
+        "quantserve.com",
+        "adnxs.com",
+        "criteo.com",
+        "criteo.net",
+        "taboola.com",
+        "outbrain.com",
+        "amazon-adsystem.com",
+        "hotjar.com",
+        "fullstory.com",
+        "mixpanel.com",
+        "amplitude.com",
+        "cdn.segment.com",
+        "api.segment.io",
+        "nr-data.net",
+        "js-agent.newrelic.com",
+        "branch.io",
+        "chartbeat.com",
+    ]
+)
+
+# Rough median transfer sizes per resource type (HTTP Archive), used to
+# estimate what blocked requests would have cost since they never download
+TYPICAL_BYTES = {
+    "image": 20_000,
+    "media": 500_000,
+    "font": 40_000,
+    "script": 25_000,
+    "stylesheet": 15_000,
+    "xhr": 2_000,
+    "fetch": 2_000,
+}
+
+
+def _host_in(host: str, domains: Iterable[str]) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+class NetworkProfile:
+    """
+    Which requests a page may make. The agent reads the accessibility
+    snapshot, so images, media and fonts are usually dead weight, and trackers
+    only add requests the settle logic has to wait for.
+
+    allow_domains wins over both block lists, to keep what a task needs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        block_types: Iterable[str] = (),
+        block_domains: Iterable[str] = (),
+        allow_domains: Iterable[str] = (),
+    ):
+        self.name = name
+        self.block_types = frozenset(block_types)
+        self.block_domains = frozenset(block_domains)
+        self.allow_domains = frozenset(allow_domains)
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        host = parts.hostname or ""
+        if self.allow_domains and _host_in(host, self.allow_domains):
+            return False
+        return resource_type in self.block_types or _host_in(host, self.block_domains)
+
+    def allowing(self, types: Iterable[str] = (), domains: Iterable[str] = ()) -> "NetworkProfile":
+        """A copy that lets these resource types and domains through."""
+        return NetworkProfile(
+            self.name,
+            block_types=self.block_types - set(types),
+            block_domains=self.block_domains,
+            allow_domains=self.allow_domains | set(domains),
+        )
+
+    def __repr__(self) -> str:
+        return f"NetworkProfile({self.name!r}, block_types={sorted(self.block_types)})"
+
+
+PROFILES = {
+    # Everything loads, as before
+    "full": NetworkProfile("full"),
+    # Screenshots still look right, but no video, audio or trackers
+    "screenshots": NetworkProfile("screenshots", block_types={"media"}, block_domains=TRACKER_DOMAINS),
+    # Only what the snapshot can see
+    "lite": NetworkProfile(
+        "lite", block_types={"image", "media", "font"}, block_domains=TRACKER_DOMAINS
+    ),
+}
+
+
+def get_profile(profile: Union[str, NetworkProfile, None] = None) -> NetworkProfile:
+    if isinstance(profile, NetworkProfile):
+        return profile
+    name = profile or NETWORK_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown network profile '{name}', use one of {list(PROFILES)}")
+    return PROFILES[name]
+
+
+class NetworkStats:
+    """Requests blocked and loaded through one page or context, and the bytes saved."""
+
+    def __init__(self, profile: NetworkProfile):
+        self.profile = profile
+        self.blocked = Counter()
+        self.loaded = 0
+        self.bytes_loaded = 0
+        self.est_bytes_saved = 0
+        self._remove = None
+
+    def _on_blocked(self, request: Request) -> None:
+        self.blocked[request.resource_type] += 1
+        self.est_bytes_saved += TYPICAL_BYTES.get(request.resource_type, 0)
+
+    def _on_response(self, response: Response) -> None:
+        self.loaded += 1
+        # Missing for chunked responses, so this is a lower bound
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            self.bytes_loaded += int(length)
+
+    def summary(self) -> dict:
+        return {
+            "profile": self.profile.name,
+            "requests_blocked": sum(self.blocked.values()),
+            "blocked_by_type": dict(self.blocked),
+            "requests_loaded": self.loaded,
+            "bytes_loaded": self.bytes_loaded,
+            "est_bytes_saved": self.est_bytes_saved,
+        }
+
+    def remove(self) -> None:
+        """Stops blocking (sync pages and contexts)."""
+        if self._remove is not None:
+            self._remove()
+
+    async def async_remove(self) -> None:
+        if self._remove is not None:
+            await self._remove()
+
+
+def apply(
+    target: Union[Page, BrowserContext], profile: Union[str, NetworkProfile, None] = None
+) -> NetworkStats:
+    """
+    Routes the requests of a page, or of every page of a context, through the
+    profile. Routing every request costs a round trip to Python, so the
+    "full" profile doesn't route at all.
+    """
+    stats = NetworkStats(get_profile(profile))
+    target.on("response", stats._on_response)
+    routed = bool(stats.profile.block_types or stats.profile.block_domains)
+
+    def handler(route: Route, request: Request) -> None:
+        if stats.profile.blocks(request.resource_type, request.url):
+            stats._on_blocked(request)
+            route.abort("blockedbyclient")
+        else:
+            route.fallback()
+
+    if routed:
+        target.route("**/*", handler)
+
+    def remove() -> None:
+        if routed:
+            target.unroute("**/*", handler)
+        target.remove_listener("response", stats._on_response)
+
+    stats._remove = remove
+    logger.info(f"Network profile {stats.profile}")
+    return stats
+
+
+async def async_apply(
+    target: Union[AsyncPage, AsyncBrowserContext],
+    profile: Union[str, NetworkProfile, None] = None,
+) -> NetworkStats:
+    """Async version of apply."""
+    stats = NetworkStats(get_profile(profile))
+    target.on("response", stats._on_response)
+    routed = bool(stats.profile.block_types or stats.profile.block_domains)
+
+    async def handler(route, request) -> None:
+        if stats.profile.blocks(request.resource_type, request.url):
+            stats._on_blocked(request)
+            await route.abort("blockedbyclient")
+        else:
+            await route.fallback()
+
+    if routed:
+        await target.route("**/*", handler)
+
+    async def remove() -> None:
+        if routed:
+            await target.unroute("**/*", handler)
+        target.remove_listener("response", stats._on_response)
+
+    stats._remove = remove
+    logger.info(f"Network profile {stats.profile}")
+    return stats
@@ -0,0 +1,223 @@
+import logging
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+import tiktoken
+
+from browser_state import (
+    INTERACTIVE_ROLES,
+    describe_node,
+    serialize_footer,
+    serialize_metadata,
+    serialize_snapshot,
+)
+
+logger = logging.getLogger(__name__)
+
+OBSERVATION_TOKEN_BUDGET = int(os.getenv("OBSERVATION_TOKEN_BUDGET", 8000))
+
+_encoding = None
+
+
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    """
+    Claude's tokenizer isn't public, cl100k is close enough for budgeting.
+    tiktoken downloads it on first use, so offline we fall back to estimating.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken encoding unavailable, estimating 4 chars per token: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode_ordinary(text))
+
+
+def _count_tokens_batch(lines: List[str]) -> List[int]:
+    encoding = _get_encoding()
+    if encoding is None:
+        return [len(line) // 4 + 1 for line in lines]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(lines)]
+
+
+def _compact_lines(nodes: List[Dict[str, Any]]) -> List[Tuple[str, bool]]:
+    """
+    Renders nodes one line each (no attribute block, no path) and collapses
+    unnamed, non-interactive containers: wrappers with a single child are
+    replaced by that child, empty ones are dropped. Returns (line, offscreen)
+    pairs in document order.
+    """
+    n = len(nodes)
+    child_counts = [0] * n
+    parents: List[int] = []
+    for i, node in enumerate(nodes):
+        del parents[node["depth"]:]
+        if parents:
+            child_counts[parents[-1]] += 1
+        parents.append(i)
+
+    lines: List[Tuple[str, bool]] = []
+    # Depth in the compacted tree of the nearest kept ancestor at each original depth
+    kept_depths: List[int] = []
+    for i, node in enumerate(nodes):
+        depth = node["depth"]
+        del kept_depths[depth:]
+        parent_depth = kept_depths[-1] if kept_depths else -1
+        collapsible = (
+            depth > 0
+            and child_counts[i] <= 1
+            and node["role"] not in INTERACTIVE_ROLES
+            and not node.get("name")
+            and not node.get("value")
+            and not node.get("states")
+        )
+        if collapsible:
+            kept_depths.append(parent_depth)
+            continue
+        new_depth = parent_depth + 1
+        kept_depths.append(new_depth)
+        lines.append((f"{'  ' * (new_depth + 1)}- {describe_node(node)}", bool(node.get("offscreen"))))
+    return lines
+
+
+def _prepare(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Computes what compressing a snapshot needs from the snapshot alone, its
+    compact lines and their token counts, and keeps them on it. A snapshot
+    rendered again (an unchanged page reused, see prefetch.py) skips that work.
+    """
+    if "_compact" not in snapshot:
+        compact = _compact_lines(snapshot["nodes"])
+        snapshot["_compact"] = compact
+        snapshot["_line_tokens"] = _count_tokens_batch([line for line, _ in compact])
+    return snapshot
+
+
+class ObservationCompressor:
+    """
+    Fits a page snapshot into a token budget. The snapshot is rendered in a
+    compact one-line-per-node format; if that still doesn't fit, nodes inside
+    the viewport come first and everything else is split into parts that the
+    agent can fetch on demand with part(n).
+    """
+
+    def __init__(self, token_budget: int = OBSERVATION_TOKEN_BUDGET, prune_offscreen: bool = True):
+        self.token_budget = token_budget
+        self.prune_offscreen = prune_offscreen
+        self.parts: List[str] = []
+        self.history: List[dict] = []
+        # The last observation recorded and its tokens, for count() to reuse
+        self._last: Tuple[Optional[str], int] = (None, 0)
+
+    @property
+    def paged(self) -> bool:
+        return len(self.parts) > 1
+
+    def _pack(self, lines: List[str], budget: int, line_tokens: Optional[List[int]] = None) -> List[List[str]]:
+        """Splits lines into consecutive chunks of at most `budget` tokens."""
+        if line_tokens is None:
+            line_tokens = _count_tokens_batch(lines)
+        chunks: List[List[str]] = [[]]
+        used = 0
+        for line, tokens in zip(lines, line_tokens):
+            if used + tokens > budget and chunks[-1]:
+                chunks.append([])
+                used = 0
+            chunks[-1].append(line)
+            used += tokens + 1  # newline
+        return chunks
+
+    def compress(self, snapshot: Dict[str, Any], viewport: Optional[dict] = None) -> str:
+        _prepare(snapshot)
+        compact, line_tokens = snapshot["_compact"], snapshot["_line_tokens"]
+        header = serialize_metadata(snapshot, viewport)
+        footer = serialize_footer(snapshot)
+        reserve = count_tokens("\n".join(header + footer)) + 64  # room for the parts note
+        budget = max(self.token_budget - reserve, 1)
+
+        # Each line costs its tokens and a newline, as _pack counts them
+        if self.prune_offscreen and sum(line_tokens) + len(line_tokens) > budget:
+            # Doesn't fit: what is in the viewport goes first, the rest to later parts
+            main = [i for i, (_, offscreen) in enumerate(compact) if not offscreen]
+            rest = [i for i, (_, offscreen) in enumerate(compact) if offscreen]
+        else:
+            main, rest = list(range(len(compact))), []
+
+        chunks = self._pack([compact[i][0] for i in main], budget, [line_tokens[i] for i in main])
+        first, later = chunks[0], main[len(chunks[0]):] + rest
+        self.parts = ["\n".join(first)] + [
+            "\n".join(chunk)
+            for chunk in self._pack([compact[i][0] for i in later], budget, [line_tokens[i] for i in later])
+            if chunk
+        ]
+
+        lines = header + ["elements:"] + first
+        if self.paged:
+            hidden = len(later)
+            lines.append(
+                f"more_elements: {hidden} more elements (mostly outside the viewport) in parts "
+                f"2-{len(self.parts)}, use show_more_elements(part) to see them"
+            )
+        lines.extend(footer)
+        observation = "\n".join(lines)
+        self.record(snapshot, viewport, observation, kind="full")
+        return observation
+
+    def record(self, snapshot: Dict[str, Any], viewport: Optional[dict], observation: str, kind: str) -> int:
+        """
+        Logs the tokens sent, and with debug logging those of the uncompressed
+        snapshot, which takes serializing the whole page. Returns the tokens sent.
+        """
+        tokens_before = None
+        if logger.isEnabledFor(logging.DEBUG):
+            tokens_before = count_tokens(serialize_snapshot(snapshot, viewport))
+        tokens_after = count_tokens(observation)
+        self._last = (observation, tokens_after)
+        self.history.append(
+            {
+                "url": snapshot["url"],
+                "kind": kind,
+                "tokens_before": tokens_before,
+                "tokens_after": tokens_after,
+                "parts": len(self.parts),
+            }
+        )
+        logger.debug(
+            f"observation ({kind}) tokens {tokens_before} -> {tokens_after} for {snapshot['url']}"
+        )
+        return tokens_after
+
+    def count(self, text: str) -> int:
+        """Tokens of text, reusing record's count when it is the observation last recorded."""
+        observation, tokens = self._last
+        return tokens if text is observation else count_tokens(text)
+
+    def subtree(self, snapshot: Dict[str, Any], ref: str) -> str:
+        """
+        Renders an expanded subtree (see browser_state.expand_subtree) in the
+        compact format, split into parts like a snapshot when over budget.
+        """
+        lines = [line for line, _ in _compact_lines(snapshot["nodes"])]
+        self.parts = ["\n".join(chunk) for chunk in self._pack(lines, self.token_budget) if chunk]
+        text = f"expanded: {ref}\nelements:\n{self.parts[0]}"
+        if self.paged:
+            text += (
+                f"\nmore_elements: the rest is in parts 2-{len(self.parts)}, "
+                "use show_more_elements(part) to see them"
+            )
+        return text
+
+    def part(self, n: int) -> str:
+        """Returns part n (1-based) of the last compressed snapshot."""
+        if not 1 <= n <= len(self.parts):
+            raise ValueError(f"Part {n} doesn't exist, the current snapshot has {len(self.parts)} part(s).")
+        return f"part: {n}/{len(self.parts)}\nelements:\n{self.parts[n - 1]}"
+
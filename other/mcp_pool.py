@@ -0,0 +1,194 @@
+"""
+A pool of warm MCP server processes shared across tasks. Starting
+`npx @playwright/mcp` and going through initialize and list_tools takes
+seconds, so the pool pays it once per server instead of once per task.
+
+Each server drives a single browser, so a server runs one task at a time:
+concurrent tasks lease different servers and queue for one when all are
+busy. After each task the reset tool (browser_close) is called, and with
+--isolated the next task starts in a fresh in-memory browser profile. A
+server that stops answering is restarted.
+"""
+import asyncio
+import logging
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import dspy
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger(__name__)
+
+PLAYWRIGHT_MCP = StdioServerParameters(
+    command="npx", args=["@playwright/mcp@latest", "--isolated"], env=None
+)
+
+PING_TIMEOUT_S = 5
+
+
+class MCPServer:
+    """
+    One server process and its session. The stdio client and session are
+    entered and exited in their own task, as anyio requires, so the server can
+    be closed or restarted from whichever task finds it broken.
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self.session: Optional[ClientSession] = None
+        self.tools: List[dspy.Tool] = []
+        self.tasks_run = 0
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> ClientSession:
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._serve(ready))
+        self.session = await ready
+        return self.session
+
+    async def _serve(self, ready: asyncio.Future) -> None:
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    ready.set_result(session)
+                    await self._stop.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not isinstance(e, asyncio.CancelledError):
+                logger.warning(f"MCP server exited: {e}")
+
+    async def alive(self) -> bool:
+        if self._task is None or self._task.done():
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), PING_TIMEOUT_S)
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, PING_TIMEOUT_S)
+            except Exception:
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """
+    Keeps `servers` MCP servers running and hands out one per task as a list
+    of dspy tools. The tool schemas are listed once, from the first server,
+    and every server's dspy tools are built once, when it starts.
+    """
+
+    def __init__(
+        self,
+        params: StdioServerParameters = PLAYWRIGHT_MCP,
+        servers: int = 2,
+        reset_tool: Optional[str] = "browser_close",
+    ):
+        self.params = params
+        self.n_servers = servers
+        self.reset_tool = reset_tool
+        self.schemas = None
+        self._servers: List[MCPServer] = []
+        self._idle: "asyncio.Queue[MCPServer]" = asyncio.Queue()
+        self._schemas_lock = asyncio.Lock()
+
+        self.startup_ms: List[float] = []
+        self.acquire_latencies: List[float] = []
+        self.restarts = 0
+
+    async def start(self) -> "MCPSessionPool":
+        servers = await asyncio.gather(*(self._start_server() for _ in range(self.n_servers)))
+        for server in servers:
+            self._idle.put_nowait(server)
+        return self
+
+    async def close(self) -> None:
+        await asyncio.gather(*(server.close() for server in self._servers), return_exceptions=True)
+        self._servers.clear()
+
+    async def __aenter__(self) -> "MCPSessionPool":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _start_server(self) -> MCPServer:
+        start = time.perf_counter()
+        server = MCPServer(self.params)
+        session = await server.start()
+        async with self._schemas_lock:
+            if self.schemas is None:
+                self.schemas = (await session.list_tools()).tools
+        server.tools = [dspy.Tool.from_mcp_tool(session, schema) for schema in self.schemas]
+        self._servers.append(server)
+        self.startup_ms.append((time.perf_counter() - start) * 1000)
+        return server
+
+    async def _restart(self, server: MCPServer) -> MCPServer:
+        self.restarts += 1
+        logger.warning(f"MCP server stopped answering after {server.tasks_run} tasks, restarting it")
+        if server in self._servers:
+            self._servers.remove(server)
+        await server.close()
+        return await self._start_server()
+
+    async def acquire(self) -> MCPServer:
+        """Waits for an idle server, restarting it first if it died while idle."""
+        start = time.perf_counter()
+        server = await self._idle.get()
+        try:
+            if not await server.alive():
+                server = await self._restart(server)
+        except BaseException:
+            self._idle.put_nowait(server)
+            raise
+        self.acquire_latencies.append((time.perf_counter() - start) * 1000)
+        return server
+
+    async def release(self, server: MCPServer) -> None:
+        """Closes the task's browser and returns the server, restarting it if it died."""
+        server.tasks_run += 1
+        try:
+            if self.reset_tool and any(schema.name == self.reset_tool for schema in self.schemas):
+                await asyncio.wait_for(server.session.call_tool(self.reset_tool, {}), PING_TIMEOUT_S)
+            healthy = await server.alive()
+        except Exception as e:
+            logger.warning(f"Resetting the MCP server failed: {type(e).__name__} {e}")
+            healthy = False
+        if not healthy:
+            try:
+                server = await self._restart(server)
+            except Exception as e:
+                # Keep the pool's size, the next acquire retries the restart
+                logger.warning(f"Restarting the MCP server failed: {e}")
+        self._idle.put_nowait(server)
+
+    @asynccontextmanager
+    async def tools(self) -> AsyncIterator[List[dspy.Tool]]:
+        """Leases a server for the duration of a task and yields its dspy tools."""
+        server = await self.acquire()
+        try:
+            yield server.tools
+        finally:
+            await self.release(server)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.acquire_latencies)
+        return {
+            "servers": self.n_servers,
+            "idle": self._idle.qsize(),
+            "acquires": len(latencies),
+            "acquire_p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+            "startup_p50_ms": round(statistics.median(self.startup_ms), 1) if self.startup_ms else None,
+            "restarts": self.restarts,
+        }
@@ -1,12 +1,10 @@
+import asyncio
 import os
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from typing import Optional
 import dspy
 import weave
 
-server_params = StdioServerParameters(
-    command="npx", args=["@playwright/mcp@latest"], env=None
-)
+from mcp_pool import PLAYWRIGHT_MCP, MCPSessionPool
 
 lm = dspy.LM(
     "anthropic/claude-3-7-sonnet-latest",
@@ -29,25 +27,30 @@ class BrowserAgent(dspy.Signature):
     answer: str = dspy.OutputField()
 
 
-async def run(task: str):
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            tools = await session.list_tools()
-
-            dspy_tools = []
-            for tool in tools.tools:
-                dspy_tools.append(dspy.Tool.from_mcp_tool(session, tool))
+async def run(task: str, pool: Optional[MCPSessionPool] = None):
+    """Runs a task on a server leased from the pool, or on a pool of one started for it."""
+    if pool is None:
+        async with MCPSessionPool(PLAYWRIGHT_MCP, servers=1) as pool:
+            return await run(task, pool)
+    async with pool.tools() as tools:
+        react = dspy.ReAct(BrowserAgent, tools=tools)
+        result = await react.acall(task=task)
+        print(result.answer)
+        return result
 
-            react = dspy.ReAct(BrowserAgent, tools=dspy_tools)
 
-            result = await react.acall(task=task)
-            print(result.answer)
+async def run_tasks(tasks: list[str], servers: int = 2) -> list:
+    """
+    Runs the tasks over `servers` warm MCP servers, at most that many at a time.
+    Returns a prediction per task, or the exception it failed with.
+    """
+    async with MCPSessionPool(PLAYWRIGHT_MCP, servers=servers) as pool:
+        results = await asyncio.gather(*(run(task, pool) for task in tasks), return_exceptions=True)
+        print(f"MCP pool: {pool.stats()}")
+    return results
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(
         run(
             "As of the 2020 census, what was the population difference between the largest county seat and smallest county seat, by land area of the county seat, in Washington state? For population figures, please use the official data from data.census.gov. Please report the integer difference."
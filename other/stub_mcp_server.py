@@ -0,0 +1,86 @@
+"""
+A stdio MCP server with the names and arguments of the main @playwright/mcp
+tools, over a fake in-memory page, to exercise mcp_pool.py and
+benchmarks/bench_mcp.py without npx, a browser or network access.
+
+    python other/stub_mcp_server.py [--startup-ms 1500] [--crash-after 10]
+
+--startup-ms stands in for npx resolving the package and launching Node,
+--crash-after exits the process after that many tool calls.
+"""
+import argparse
+import os
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("stub-playwright", log_level="WARNING")
+_page = {"url": "about:blank", "typed": {}}
+_calls = 0
+_crash_after = None
+
+
+def _count_call() -> None:
+    global _calls
+    _calls += 1
+    if _crash_after is not None and _calls >= _crash_after:
+        os._exit(1)
+
+
+def _snapshot() -> str:
+    lines = [f"- Page URL: {_page['url']}", "- Page Snapshot:", "```yaml"]
+    lines.append('- textbox "Search" [ref=e1]' + (f": {_page['typed']['e1']}" if "e1" in _page["typed"] else ""))
+    lines.append('- button "Go" [ref=e2]')
+    lines.append('- link "First result" [ref=e3]')
+    lines.append("```")
+    return "\n".join(lines)
+
+
+@mcp.tool()
+def browser_navigate(url: str) -> str:
+    """Navigate to a URL"""
+    _count_call()
+    _page.update(url=url, typed={})
+    return _snapshot()
+
+
+@mcp.tool()
+def browser_snapshot() -> str:
+    """Capture accessibility snapshot of the current page"""
+    _count_call()
+    return _snapshot()
+
+
+@mcp.tool()
+def browser_click(element: str, ref: str) -> str:
+    """Perform click on a web page"""
+    _count_call()
+    if ref == "e3":
+        _page.update(url=_page["url"].rstrip("/") + "/result", typed={})
+    return _snapshot()
+
+
+@mcp.tool()
+def browser_type(element: str, ref: str, text: str, submit: bool = False) -> str:
+    """Type text into editable element"""
+    _count_call()
+    _page["typed"][ref] = text
+    return _snapshot()
+
+
+@mcp.tool()
+def browser_close() -> str:
+    """Close the page"""
+    _count_call()
+    _page.update(url="about:blank", typed={})
+    return "Browser closed"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Playwright MCP server.")
+    parser.add_argument("--startup-ms", type=int, default=0)
+    parser.add_argument("--crash-after", type=int)
+    args = parser.parse_args()
+    _crash_after = args.crash_after
+    time.sleep(args.startup_ms / 1000)
+    mcp.run()
@@ -0,0 +1,154 @@
+"""
+Work done ahead of the agent, behind PREFETCH_SNAPSHOTS (off by default until
+bench_prefetch shows it helps on real pages).
+
+Snapshots taken while the page settles: wait_for_settle waits for
+SETTLE_QUIET_MS without DOM changes, with the page idle, and then the snapshot
+was extracted on the critical path. With PREFETCH_SNAPSHOTS=1, the actions
+settle with speculate=True: the page is snapshotted in-page once, halfway
+through a quiet window, so it is ready when the window closes. The dirty flag
+tells whether the page stayed as that snapshot saw it; if it did, the snapshot
+is the post-action observation and only transferring it is left. A snapshot
+taken before the action settled never stands in for one taken after.
+
+Without a settled snapshot, a page that didn't change at all since its last
+snapshot (a click with no effect, a tab switched back to) reuses that one.
+Snapshots are numbered in-page, so that only happens when the snapshot Python
+last rendered is also the latest one taken.
+
+Refs resolved while the LM decides (async runs): once an observation is
+rendered, the enabled interactive elements in the viewport, the likely targets
+of the next action, are resolved to element handles in the background. An
+action on one of those refs then skips its lookup; if the element went stale
+meanwhile, the action fails fast and the ref is resolved again.
+"""
+import asyncio
+import logging
+import os
+import weakref
+from typing import Any, Dict, List, Optional
+
+from playwright.async_api import ElementHandle as AsyncElementHandle, Page as AsyncPage
+from playwright.sync_api import Page
+
+from browser_state import INTERACTIVE_ROLES
+from refs import RESOLVE_REF_JS, parse_ref
+from snapshot_tracker import get_tracker
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_SNAPSHOTS = os.getenv("PREFETCH_SNAPSHOTS", "0") != "0"
+# Likely targets resolved ahead per observation at most
+PRERESOLVE_REFS = 32
+
+# Null if the page changed since its latest snapshot. Otherwise {} if that is
+# the snapshot Python has (its document and sequence number are passed in), or
+# the settled snapshot if that is the latest. Only a newer snapshot clears
+# settled, so a retry after a failed render gets the same answer
+WARM_JS = r"""
+([documentId, seq]) => {
+  const state = window.__sbu;
+  if (!state || state.dirty !== false) return null;
+  if (state.documentId === documentId && state.seq === seq) return {};
+  return state.settled || null;
+}
+"""
+
+PRERESOLVE_JS = f"(refs) => refs.map({RESOLVE_REF_JS})"
+
+# page -> {"handles": ref -> element handle, None until resolved}
+_preresolved: "weakref.WeakKeyDictionary[AsyncPage, dict]" = weakref.WeakKeyDictionary()
+# Keeps the background tasks alive until they finish
+_background: set = set()
+
+
+def _known(page) -> list:
+    previous = get_tracker(page).previous
+    return [previous["documentId"], previous.get("seq")] if previous is not None else [None, None]
+
+
+def _warm(page, warm: Optional[dict]) -> Optional[Dict[str, Any]]:
+    if warm is None:
+        return None
+    if warm:
+        return warm
+    previous = get_tracker(page).previous
+    if previous is None or previous["url"] != page.url:
+        return None
+    return previous
+
+
+def take_warm(page: Page) -> Optional[Dict[str, Any]]:
+    """A snapshot of the page as it is now without extracting one, or None."""
+    return _warm(page, page.evaluate(WARM_JS, _known(page)))
+
+
+async def async_take_warm(page: AsyncPage) -> Optional[Dict[str, Any]]:
+    """Async version of take_warm."""
+    return _warm(page, await page.evaluate(WARM_JS, _known(page)))
+
+
+def likely_targets(snapshot: Dict[str, Any]) -> List[str]:
+    """The refs of the enabled interactive elements in the viewport, in page order."""
+    refs = [
+        node["ref"]
+        for node in snapshot["nodes"]
+        if node["role"] in INTERACTIVE_ROLES and not node.get("offscreen") and "disabled" not in node.get("states", ())
+    ]
+    return refs[:PRERESOLVE_REFS]
+
+
+def _in_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _dispose(handles: List[AsyncElementHandle]) -> None:
+    await asyncio.gather(*(handle.dispose() for handle in handles), return_exceptions=True)
+
+
+async def _preresolve(page: AsyncPage, entry: dict, refs: List[str]) -> None:
+    try:
+        array = await page.evaluate_handle(PRERESOLVE_JS, refs)
+        try:
+            properties = await array.get_properties()
+        finally:
+            await array.dispose()
+    except Exception as e:
+        # The page navigated or closed meanwhile
+        logger.debug(f"Pre-resolving refs failed: {e}")
+        return
+    handles = {}
+    for key, handle in properties.items():
+        element = handle.as_element()
+        if element is not None:
+            handles[refs[int(key)]] = element
+    if _preresolved.get(page) is entry:
+        entry["handles"] = handles
+    else:
+        # A newer observation replaced this one meanwhile
+        await _dispose(list(handles.values()))
+
+
+def preresolve(page: AsyncPage, snapshot: Dict[str, Any]) -> None:
+    """
+    Starts resolving the likely targets of the next action in the background,
+    dropping the handles resolved for the previous observation.
+    """
+    previous = _preresolved.pop(page, None)
+    if previous is not None and previous["handles"]:
+        _in_background(_dispose(list(previous["handles"].values())))
+    refs = likely_targets(snapshot)
+    if refs:
+        entry = _preresolved[page] = {"handles": None}
+        _in_background(_preresolve(page, entry, refs))
+
+
+def take_preresolved(page: AsyncPage, selector: str) -> Optional[AsyncElementHandle]:
+    """The handle resolved ahead for a ref selector, or None. The caller disposes it."""
+    entry = _preresolved.get(page)
+    ref = parse_ref(selector)
+    if entry is None or entry["handles"] is None or ref is None:
+        return None
+    return entry["handles"].pop(ref, None)
@@ -0,0 +1,319 @@
+import io
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from PIL import GifImagePlugin, Image, ImageChops
+
+import tracing
+from utils import _add_text_overlay
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Frames are compared as grayscale thumbnails this wide, and two frames look
+# the same when at most DUPLICATE_PIXELS of their thumbnail pixels differ by
+# more than encoding noise. That merges a failed click, a scroll at the end of
+# the page or a blinking caret; a single typed character already changes ~6
+THUMBNAIL_WIDTH = 320
+DUPLICATE_PIXELS = 2
+NOISE_LEVEL = 24
+
+# Steps whose frame is always kept: what they typed can be too small to tell
+# apart from noise at thumbnail size
+UNMERGED_ACTIONS = ("type_text", "submit", "run_actions")
+
+
+def thumbnail(image: Image.Image) -> Image.Image:
+    height = max(1, round(image.height * THUMBNAIL_WIDTH / image.width))
+    return image.convert("L").resize((THUMBNAIL_WIDTH, height), Image.Resampling.BOX)
+
+
+def changed_pixels(a: Image.Image, b: Image.Image) -> int:
+    """How many pixels of two thumbnails differ by more than NOISE_LEVEL."""
+    if a.size != b.size:
+        return a.width * a.height
+    return sum(ImageChops.difference(a, b).histogram()[NOISE_LEVEL + 1 :])
+
+
+class _GifWriter:
+    """
+    Writes GIF frames to disk as they arrive, each with its own palette, so only
+    the current frame is ever held in memory.
+    """
+
+    def __init__(self, path: str, duration: int):
+        self.fp = open(path, "wb")
+        self.duration = duration
+        self.size = None
+
+    def add(self, image: Image.Image, duration: Optional[int] = None) -> None:
+        if self.size is None:
+            self.size = image.size
+        elif image.size != self.size:
+            image = image.resize(self.size)
+        frame = image.convert("RGB").quantize(colors=256)
+        if self.fp.tell() == 0:
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": 0})
+            for chunk in header:
+                self.fp.write(chunk)
+        for chunk in GifImagePlugin.getdata(frame, duration=duration or self.duration, include_color_table=True):
+            self.fp.write(chunk)
+
+    def close(self) -> None:
+        if self.fp.tell():
+            self.fp.write(b";")  # trailer
+        self.fp.close()
+
+
+class _Mp4Writer:
+    """Streams frames to ffmpeg, needs the optional imageio[ffmpeg] package."""
+
+    def __init__(self, path: str, duration: int):
+        try:
+            import imageio.v2 as imageio
+        except ImportError:
+            raise ImportError("Recording to mp4 needs imageio[ffmpeg]: pip install 'imageio[ffmpeg]'")
+        self.writer = imageio.get_writer(path, fps=1000 / duration, macro_block_size=16)
+        self.duration = duration
+        self.size = None
+
+    def add(self, image: Image.Image, duration: Optional[int] = None) -> None:
+        import numpy as np
+
+        if self.size is None:
+            self.size = image.size
+        elif image.size != self.size:
+            image = image.resize(self.size)
+        data = np.asarray(image.convert("RGB"))
+        # Constant frame rate, a longer frame is repeated
+        for _ in range(max(1, round((duration or self.duration) / self.duration))):
+            self.writer.append_data(data)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class _WebpWriter:
+    """
+    Pillow can only encode an animated WebP from all frames at once, so frames
+    are spooled to a temporary file as JPEG until close. Prefer gif or mp4 for
+    very long runs.
+    """
+
+    def __init__(self, path: str, duration: int):
+        self.path = path
+        self.duration = duration
+        self.spool = tempfile.TemporaryFile()
+        self.offsets = []
+        self.durations: List[int] = []
+
+    def add(self, image: Image.Image, duration: Optional[int] = None) -> None:
+        start = self.spool.tell()
+        image.convert("RGB").save(self.spool, format="JPEG", quality=90)
+        self.offsets.append((start, self.spool.tell()))
+        self.durations.append(duration or self.duration)
+
+    def _frames(self):
+        for start, end in self.offsets:
+            self.spool.seek(start)
+            yield Image.open(io.BytesIO(self.spool.read(end - start)))
+
+    def close(self) -> None:
+        frames = self._frames()
+        first = next(frames, None)
+        if first is not None:
+            first.save(
+                self.path,
+                save_all=True,
+                append_images=frames,
+                duration=self.durations,
+                loop=0,
+            )
+        self.spool.close()
+
+
+_WRITERS = {"gif": _GifWriter, "mp4": _Mp4Writer, "webp": _WebpWriter}
+
+_FRAME_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+INDEX_FILE = "index.jsonl"
+
+
+class FrameRecorder:
+    """
+    Records the agent's run into an animation off the critical path. The agent
+    loop only takes a screenshot and enqueues its bytes; a worker thread
+    decodes, optionally downsamples, overlays the step label and streams each
+    frame into the encoder.
+
+    The queue is bounded (max_queue frames). When it is full, frames are dropped
+    if drop_when_full is set, otherwise capture blocks until there is room.
+
+    A frame that looks like the previous one (at most dedup_pixels changed
+    thumbnail pixels, None to keep every frame) isn't encoded again, the previous frame
+    just stays on screen longer. Frames of UNMERGED_ACTIONS are always kept. With frames_dir, each distinct frame is also
+    kept there as a small WebP/JPEG, and index.jsonl maps every step to its
+    frame file, or to the step whose frame it repeats.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        duration: int = 2000,
+        max_queue: int = 16,
+        drop_when_full: bool = True,
+        scale: float = 1.0,
+        screenshot_type: str = "jpeg",
+        dedup_pixels: Optional[int] = DUPLICATE_PIXELS,
+        frames_dir: Optional[str] = None,
+        frame_format: str = "webp",
+        frame_quality: int = 80,
+    ):
+        fmt = os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in _WRITERS:
+            raise ValueError(f"Unsupported recording format '{fmt}', use one of {list(_WRITERS)}")
+        if frame_format not in _FRAME_EXTENSIONS:
+            raise ValueError(f"Unsupported frame format '{frame_format}', use one of {list(_FRAME_EXTENSIONS)}")
+        self.path = path
+        self.duration = duration
+        self.scale = scale
+        self.drop_when_full = drop_when_full
+        self.screenshot_type = screenshot_type
+        self.dedup_pixels = dedup_pixels
+        self.frames_dir = frames_dir
+        self.frame_format = frame_format
+        self.frame_quality = frame_quality
+        self._writer = _WRITERS[fmt](path, duration)
+        self._index = None
+        if frames_dir is not None:
+            os.makedirs(frames_dir, exist_ok=True)
+            self._index = open(os.path.join(frames_dir, INDEX_FILE), "a")
+
+        self.steps = 0
+        self.encoded = 0
+        self.merged = 0
+        self.dropped = 0
+        self.capture_ms = 0.0
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._worker = threading.Thread(target=self._run, name="frame-recorder", daemon=True)
+        self._worker.start()
+
+    def _label(self, action_name: str, extra_info: str) -> str:
+        self.steps += 1
+        label = f"{self.steps:03d}: {action_name}"
+        return f"{label} ({extra_info})" if extra_info else label
+
+    def enqueue(self, data: bytes, label: str, mergeable: bool = True) -> None:
+        item = (data, label, self.steps, mergeable)
+        if self.drop_when_full:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            self._queue.put(item)
+
+    def capture(self, page, action_name: str, extra_info: str = "") -> None:
+        """Screenshots a sync page and hands the bytes to the worker."""
+        start = time.perf_counter()
+        with tracing.span("screenshot"):
+            data = page.screenshot(type=self.screenshot_type, full_page=False)
+        self.enqueue(data, self._label(action_name, extra_info), action_name not in UNMERGED_ACTIONS)
+        self.capture_ms += (time.perf_counter() - start) * 1000
+
+    async def acapture(self, page, action_name: str, extra_info: str = "") -> None:
+        """Async version of capture."""
+        start = time.perf_counter()
+        with tracing.span("screenshot"):
+            data = await page.screenshot(type=self.screenshot_type, full_page=False)
+        self.enqueue(data, self._label(action_name, extra_info), action_name not in UNMERGED_ACTIONS)
+        self.capture_ms += (time.perf_counter() - start) * 1000
+
+    def _write_index(self, step: int, label: str, frame: dict, duplicate: bool) -> None:
+        if self._index is None:
+            return
+        entry = {
+            "step": step,
+            "label": label,
+            "frame": frame["file"],
+            "duplicate_of": frame["step"] if duplicate else None,
+        }
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+
+    def _add(self, data: bytes, label: str, step: int, pending: Optional[dict], mergeable: bool = True) -> dict:
+        """
+        Merges the frame into pending if it looks the same, otherwise encodes
+        pending and returns the new frame as the pending one. Frames are encoded
+        one behind, so a merged frame still gets its full duration.
+        """
+        image = Image.open(io.BytesIO(data))
+        if self.scale != 1.0:
+            image = image.resize((max(1, int(image.width * self.scale)), max(1, int(image.height * self.scale))))
+        thumb = thumbnail(image)
+        if (
+            pending is not None
+            and mergeable
+            and self.dedup_pixels is not None
+            and changed_pixels(thumb, pending["thumb"]) <= self.dedup_pixels
+        ):
+            pending["duration"] += self.duration
+            pending["labels"].append(label)
+            self.merged += 1
+            self._write_index(step, label, pending, duplicate=True)
+            return pending
+        if pending is not None:
+            self._encode(pending)
+        frame = {"image": image, "thumb": thumb, "step": step, "labels": [label], "duration": self.duration}
+        frame["file"] = None
+        if self.frames_dir is not None:
+            frame["file"] = f"{step:03d}.{_FRAME_EXTENSIONS[self.frame_format]}"
+            image.convert("RGB").save(
+                os.path.join(self.frames_dir, frame["file"]), format=self.frame_format, quality=self.frame_quality
+            )
+        self._write_index(step, label, frame, duplicate=False)
+        return frame
+
+    def _encode(self, frame: dict) -> None:
+        label = frame["labels"][0]
+        if len(frame["labels"]) > 1:
+            label += f" (+{len(frame['labels']) - 1} unchanged)"
+        self._writer.add(_add_text_overlay(frame["image"].convert("RGBA"), label), frame["duration"])
+        self.encoded += 1
+
+    def _run(self) -> None:
+        pending = None
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            data, label, step, mergeable = item
+            try:
+                pending = self._add(data, label, step, pending, mergeable)
+            except Exception as e:
+                logger.warning(f"Failed to encode frame '{label}': {e}")
+        if pending is not None:
+            try:
+                self._encode(pending)
+            except Exception as e:
+                logger.warning(f"Failed to encode frame '{pending['labels'][0]}': {e}")
+
+    def close(self) -> Optional[str]:
+        """Waits for queued frames to be encoded and finalizes the file."""
+        self._queue.put(_STOP)
+        self._worker.join()
+        self._writer.close()
+        if self._index is not None:
+            self._index.close()
+        logger.info(
+            f"Recorded {self.encoded}/{self.steps} frames to {self.path} "
+            f"({self.merged} unchanged merged, {self.dropped} dropped, {self.capture_ms:.0f}ms spent capturing)"
+        )
+        return self.path if self.encoded else None
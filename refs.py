@@ -0,0 +1,50 @@
+import re
+from typing import Optional
+from playwright.async_api import ElementHandle as AsyncElementHandle, Page as AsyncPage
+from playwright.sync_api import ElementHandle, Page
+
+# Accepts e8, [ref=e8], [ref="e8"] and ref=e8
+_REF_PATTERN = re.compile(r"""^\s*\[?\s*(?:ref\s*=\s*)?['"]?(e\d+)['"]?\s*\]?\s*$""")
+
+# Looks the ref up in the index built by the latest snapshot (see
+# browser_state.SNAPSHOT_JS). Text nodes resolve to their parent element and
+# the document to its root element.
+RESOLVE_REF_JS = r"""
+(ref) => {
+  const node = window.__sbu?.byRef?.get(ref);
+  if (!node || !node.isConnected) return null;
+  if (node.nodeType === Node.DOCUMENT_NODE) return node.documentElement;
+  if (node.nodeType === Node.TEXT_NODE) return node.parentElement;
+  return node;
+}
+"""
+
+
+def parse_ref(selector: str) -> Optional[str]:
+    """
+    Returns the ref id if the selector points at a snapshot ref, else None.
+    E.g. [ref=e8] -> e8, e16 -> e16, #search -> None
+    """
+    m = _REF_PATTERN.match(selector)
+    return m.group(1) if m else None
+
+
+def resolve_ref(page: Page, ref: str) -> Optional[ElementHandle]:
+    """
+    Resolves a ref from the latest snapshot straight to an element handle with
+    a single lookup. Returns None if the ref is unknown or its element is gone.
+    """
+    handle = page.evaluate_handle(RESOLVE_REF_JS, ref)
+    element = handle.as_element()
+    if element is None:
+        handle.dispose()
+    return element
+
+
+async def async_resolve_ref(page: AsyncPage, ref: str) -> Optional[AsyncElementHandle]:
+    """Async version of resolve_ref."""
+    handle = await page.evaluate_handle(RESOLVE_REF_JS, ref)
+    element = handle.as_element()
+    if element is None:
+        await handle.dispose()
+    return element
@@ -0,0 +1,84 @@
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import dspy
+
+# The ReAct step signature is the only one with this output field
+_REACT_MARKER = "[[ ## next_tool_name ## ]]"
+
+_FINISH = {
+    "next_thought": "The recording has no more steps.",
+    "next_tool_name": "finish",
+    "next_tool_args": {},
+}
+
+
+def decisions_of(task: str, prediction: dspy.Prediction) -> dict:
+    """The LM outputs behind a ReAct run: one dict per step, plus the final extract."""
+    trajectory = prediction.trajectory
+    steps = []
+    idx = 0
+    while f"tool_name_{idx}" in trajectory:
+        steps.append(
+            {
+                "next_thought": trajectory[f"thought_{idx}"],
+                "next_tool_name": trajectory[f"tool_name_{idx}"],
+                "next_tool_args": trajectory[f"tool_args_{idx}"],
+            }
+        )
+        idx += 1
+    extract = {key: value for key, value in prediction.items() if key != "trajectory"}
+    return {"task": task, "steps": steps, "extract": extract}
+
+
+def save_decisions(path: str, task: str, prediction: dspy.Prediction) -> None:
+    with open(path, "w") as f:
+        json.dump(decisions_of(task, prediction), f, indent=2, default=str)
+
+
+def load_decisions(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _format_outputs(outputs: Dict[str, Any]) -> str:
+    """Renders outputs the way dspy's ChatAdapter expects to parse them."""
+    sections = []
+    for name, value in outputs.items():
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        sections.append(f"[[ ## {name} ## ]]\n{value}")
+    sections.append("[[ ## completed ## ]]")
+    return "\n\n".join(sections)
+
+
+class ReplayLM(dspy.BaseLM):
+    """
+    Stub LM that answers with the decisions of a recorded run, so the tools
+    (and so actions and browser_state) run at full speed with no live LM.
+    ReAct calls get the recorded steps in order; once they run out the agent
+    is told to finish. The extract call gets the recorded answer.
+    """
+
+    def __init__(self, decisions: dict):
+        super().__init__(model="replay", cache=False)
+        self.steps: List[dict] = list(decisions["steps"])
+        self.extract = decisions["extract"]
+        self.calls = 0
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        self.calls += 1
+        system = messages[0]["content"] if messages else prompt or ""
+        if _REACT_MARKER in system:
+            outputs = self.steps.pop(0) if self.steps else _FINISH
+        else:
+            outputs = self.extract
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=_format_outputs(outputs)))],
+            usage={},
+            model=self.model,
+        )
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        return self.forward(prompt=prompt, messages=messages, **kwargs)
@@ -0,0 +1,294 @@
+"""
+Resolves what the agent points at to an element without waiting for it. A
+target is a snapshot ref (e8), a role and name as the snapshot shows them
+(button "Search", role=button[name="Search"]), a quoted text ("Sign in") or a
+CSS selector. Every strategy (ref, CSS, role/name, text, the field next to a
+label) is tried in a single in-page evaluation, and each match gets a
+confidence:
+
+    ref          1.0   the element the snapshot gave that ref
+    css          0.95  (0.9 for the first of several matches)
+    role/name    up to 0.9, by how close the name is
+    text         up to 0.75, the element holding that text
+    label        up to 0.8, the field after a label with that text
+
+When typing, matches that aren't fields count less and label matches more.
+Hidden or disabled matches count half. A ref that is gone from the page falls
+back to the role and name it had in the last snapshot, which recovers
+elements a framework re-rendered. CSS selectors reach into open shadow
+roots, as Playwright's do. A CSS selector that matches nothing only yields
+suggestions, never a guess. Below RESOLVE_MIN_CONFIDENCE, or when two
+elements score about the same, the lookup fails in milliseconds with the
+closest matches and their refs, instead of timing out.
+"""
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from playwright.async_api import ElementHandle as AsyncElementHandle, Page as AsyncPage
+from playwright.sync_api import ElementHandle, Page
+
+from browser_state import describe_node
+from refs import async_resolve_ref, parse_ref, resolve_ref
+from snapshot_tracker import get_tracker
+
+RESOLVE_MIN_CONFIDENCE = float(os.getenv("RESOLVE_MIN_CONFIDENCE", "0.6"))
+# Two different elements scoring within this of each other are ambiguous
+AMBIGUITY_MARGIN = 0.05
+MAX_SUGGESTIONS = 5
+
+# button "Search", the way describe_node writes nodes
+_ROLE_NAME_PATTERN = re.compile(r'^\s*([a-z]+)\s+"(.+)"\s*$')
+# Playwright's role=button[name="Search"]
+_PLAYWRIGHT_ROLE_PATTERN = re.compile(r"""^\s*role=([a-z]+)\[name=['"](.+?)['"]i?\]\s*$""")
+# "Sign in", text=Sign in
+_TEXT_PATTERN = re.compile(r"""^\s*(?:text=)?(?:"(.+)"|'(.+)')\s*$|^\s*text=([^>]+)$""")
+# Ids, classes, attribute values and :has-text() of a CSS selector, as words
+# to suggest alternatives when it matches nothing
+_CSS_WORDS_PATTERN = re.compile(
+    r"""[#.]([\w-]+)|\[[\w-]+\s*[*^$~|]?=\s*['"]?([^'"\]]+)|:has-text\(\s*['"]([^'"]+)"""
+)
+
+RESOLVE_JS = r"""
+(args) => {
+  const state = window.__sbu;
+  if (!state || !state.roleOf) return { matches: [], invalidCss: false, noSnapshot: true };
+  const CLICKABLE =
+    'a[href], button, input, select, textarea, summary, label, [role=button], [role=link], ' +
+    '[role=tab], [role=menuitem], [role=option], [role=checkbox], [role=radio], [onclick]';
+  const FIELDS =
+    'input:not([type=hidden]), select, textarea, [contenteditable=""], [contenteditable=true], ' +
+    '[role=textbox], [role=searchbox], [role=combobox]';
+
+  const norm = (s) => (s || '').replace(/[\s_-]+/g, ' ').trim().toLowerCase();
+  const similarity = (a, b) => {
+    a = norm(a);
+    b = norm(b);
+    if (!a || !b) return 0;
+    if (a === b) return 1;
+    if (a.includes(b) || b.includes(a))
+      return 0.6 + (0.3 * Math.min(a.length, b.length)) / Math.max(a.length, b.length);
+    const wordsA = new Set(a.split(' '));
+    const wordsB = new Set(b.split(' '));
+    let shared = 0;
+    for (const word of wordsA) if (wordsB.has(word)) shared++;
+    return (0.6 * shared) / (wordsA.size + wordsB.size - shared);
+  };
+  const isField = (el) => el.matches(FIELDS);
+  const usable = (el) =>
+    el.checkVisibility() && !el.disabled && el.getAttribute('aria-disabled') !== 'true';
+  const elementOf = (node) => {
+    if (node.nodeType === Node.DOCUMENT_NODE) return node.documentElement;
+    if (node.nodeType === Node.TEXT_NODE) return node.parentElement;
+    return node;
+  };
+  // The field a label-like element introduces: its control, or the first
+  // field after it in its container or the container's parent
+  const fieldAfter = (el) => {
+    if (el.control) return el.control;
+    for (let box = el.parentElement, hops = 0; box && hops < 2; box = box.parentElement, hops++) {
+      for (const field of box.querySelectorAll(FIELDS))
+        if (el.compareDocumentPosition(field) & Node.DOCUMENT_POSITION_FOLLOWING) return field;
+    }
+    return null;
+  };
+
+  const found = new Map();
+  const add = (el, score, by) => {
+    if (!el || !el.isConnected || score <= 0) return;
+    if (!usable(el)) score /= 2;
+    // Refs and CSS are what the agent asked for, only guesses prefer fields
+    if (args.field && by !== 'ref' && by !== 'css' && !isField(el)) score *= 0.6;
+    const previous = found.get(el);
+    if (!previous || previous.score < score) found.set(el, { score, by });
+  };
+
+  if (args.ref) {
+    const node = state.byRef.get(args.ref);
+    if (node && node.isConnected) add(elementOf(node), 1, 'ref');
+  }
+  let invalidCss = false;
+  // Like Playwright's CSS engine, a selector the document doesn't match is
+  // looked up in open shadow roots too, the way SNAPSHOT_JS walks them
+  const queryAll = (selector) => {
+    const matches = Array.from(document.querySelectorAll(selector));
+    if (matches.length) return matches;
+    const visit = (root) => {
+      for (const el of root.querySelectorAll('*')) {
+        if (!el.shadowRoot) continue;
+        matches.push(...el.shadowRoot.querySelectorAll(selector));
+        visit(el.shadowRoot);
+      }
+    };
+    visit(document);
+    return matches;
+  };
+  let cssMatches = 0;
+  if (args.css) {
+    try {
+      const matches = queryAll(args.css);
+      cssMatches = matches.length;
+      const first = matches.find(usable) || matches[0];
+      for (const el of matches) add(el, el !== first ? 0.5 : matches.length === 1 ? 0.95 : 0.9, 'css');
+    } catch (e) {
+      invalidCss = true;
+    }
+  }
+  const target = args.name || args.hint;
+  if (target) {
+    // Matches that only come from a missed CSS selector's words stay suggestions
+    const weight = args.name ? 1 : 0.5;
+    for (const node of state.byRef.values()) {
+      if (!node.isConnected) continue;
+      if (node.nodeType === Node.TEXT_NODE) {
+        const match = similarity(node.data, target);
+        if (match < 0.5 || !node.parentElement) continue;
+        const el = node.parentElement;
+        add(el.closest(CLICKABLE) || el, 0.75 * match * weight, 'text');
+        add(fieldAfter(el), (args.field ? 0.8 : 0.5) * match * weight, 'label');
+        continue;
+      }
+      if (node.nodeType !== Node.ELEMENT_NODE) continue;
+      const role = state.roleOf(node);
+      let match = Math.max(
+        similarity(state.nameOf(node, role), target),
+        0.9 * similarity(node.getAttribute('placeholder'), target)
+      );
+      if (!args.name) match = Math.max(match, similarity(node.id + ' ' + (node.getAttribute('name') || ''), target));
+      if (match < 0.3) continue;
+      const sameRole = !args.role || args.role === role;
+      add(node, (sameRole ? 0.9 : 0.55) * match * weight, args.role ? 'role' : 'name');
+    }
+  }
+
+  // Matches outside the snapshot get a ref too, so they can be resolved and suggested
+  const refOf = (el) => {
+    let ref = state.refs.get(el);
+    if (!ref) {
+      ref = 'e' + state.nextRef++;
+      state.refs.set(el, ref);
+    }
+    state.byRef.set(ref, el);
+    return ref;
+  };
+  const ranked = Array.from(found, ([el, match]) => ({ el, ...match }))
+    .sort((a, b) => b.score - a.score)
+    .slice(0, args.limit);
+  return {
+    invalidCss,
+    cssMatches,
+    matches: ranked.map(({ el, score, by }) => {
+      const role = state.roleOf(el) || el.tagName.toLowerCase();
+      return { ref: refOf(el), role, name: state.nameOf(el, role), by, score: Math.round(score * 100) / 100 };
+    }),
+  };
+}
+"""
+
+
+def parse_target(selector: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Splits a selector into what RESOLVE_JS matches on. A ref keeps the role and
+    name it had in the previous snapshot, if any, to fall back on.
+    """
+    target: Dict[str, Any] = {"ref": None, "css": None, "role": None, "name": None, "hint": None}
+    ref = parse_ref(selector)
+    if ref:
+        target["ref"] = ref
+        for node in (previous or {}).get("nodes", ()):
+            if node["ref"] == ref:
+                if node["role"] != "text":
+                    target["role"] = node["role"]
+                target["name"] = node.get("name") or None
+                break
+        return target
+    m = _ROLE_NAME_PATTERN.match(selector) or _PLAYWRIGHT_ROLE_PATTERN.match(selector)
+    if m:
+        target["role"], target["name"] = m.group(1), m.group(2)
+        return target
+    m = _TEXT_PATTERN.match(selector)
+    if m:
+        target["name"] = next(group for group in m.groups() if group)
+        return target
+    target["css"] = selector
+    words = [word for m in _CSS_WORDS_PATTERN.finditer(selector) for word in m.groups() if word]
+    # A bare word or two ("Search") is a valid tag selector, but rarely meant as one
+    if not words and re.fullmatch(r"[A-Za-z][\w -]*", selector.strip()):
+        words = [selector.strip()]
+    target["hint"] = " ".join(words) or None
+    return target
+
+
+def _describe(match: dict) -> str:
+    return f"{describe_node(match)} ({match['by']} {match['score']:.2f})"
+
+
+def pick(selector: str, matches: list) -> dict:
+    """The best match, or a ValueError listing the closest ones."""
+    best = matches[0] if matches else None
+    if best is None or best["score"] < RESOLVE_MIN_CONFIDENCE:
+        ref = parse_ref(selector)
+        if ref:
+            message = f"Ref '{ref}' is not in the page anymore, the element may have been removed."
+        else:
+            message = f"No element matches '{selector}' well enough."
+        if matches:
+            message += " Closest: " + "; ".join(_describe(match) for match in matches[:MAX_SUGGESTIONS])
+        raise ValueError(message)
+    rivals = [m for m in matches[1:] if best["score"] - m["score"] <= AMBIGUITY_MARGIN]
+    if rivals:
+        raise ValueError(
+            f"'{selector}' matches several elements about equally: "
+            + "; ".join(_describe(match) for match in [best, *rivals][:MAX_SUGGESTIONS])
+            + ". Use the ref of the one you mean."
+        )
+    return best
+
+
+def resolve(page: Page, selector: str, field: bool = False) -> Tuple[ElementHandle, dict]:
+    """
+    Resolves a selector to an element handle and the match it came from
+    ({ref, role, name, by, score}), preferring form fields if field is True.
+    Never waits, raises ValueError if nothing matches confidently enough.
+    """
+    ref = parse_ref(selector)
+    if ref:
+        # A live ref is the common case, one lookup and done
+        element = resolve_ref(page, ref)
+        if element is not None:
+            return element, {"ref": ref, "by": "ref", "score": 1.0}
+    target = parse_target(selector, get_tracker(page).previous)
+    result = page.evaluate(RESOLVE_JS, {**target, "field": field, "limit": MAX_SUGGESTIONS + 1})
+    if target["css"] and (result["invalidCss"] or not result.get("cssMatches")):
+        # Playwright-only syntax (text=, :has-text(), >>), no snapshot to match
+        # against, or nothing RESOLVE_JS could reach (closed shadow roots, frames)
+        element = page.query_selector(selector)
+        if element is not None:
+            return element, {"ref": None, "by": "css", "score": 0.9}
+    match = pick(selector, result["matches"])
+    element = resolve_ref(page, match["ref"])
+    if element is None:
+        raise ValueError(f"The element matching '{selector}' was removed from the page.")
+    return element, match
+
+
+async def async_resolve(
+    page: AsyncPage, selector: str, field: bool = False
+) -> Tuple[AsyncElementHandle, dict]:
+    """Async version of resolve."""
+    ref = parse_ref(selector)
+    if ref:
+        element = await async_resolve_ref(page, ref)
+        if element is not None:
+            return element, {"ref": ref, "by": "ref", "score": 1.0}
+    target = parse_target(selector, get_tracker(page).previous)
+    result = await page.evaluate(RESOLVE_JS, {**target, "field": field, "limit": MAX_SUGGESTIONS + 1})
+    if target["css"] and (result["invalidCss"] or not result.get("cssMatches")):
+        element = await page.query_selector(selector)
+        if element is not None:
+            return element, {"ref": None, "by": "css", "score": 0.9}
+    match = pick(selector, result["matches"])
+    element = await async_resolve_ref(page, match["ref"])
+    if element is None:
+        raise ValueError(f"The element matching '{selector}' was removed from the page.")
+    return element, match
@@ -0,0 +1,143 @@
+"""
+Per-origin browser sessions shared across runs: the cookies, localStorage and
+IndexedDB a run ended with, for every origin it navigated to. A new context
+seeded from it starts past the cookie banners and logins earlier runs got
+through, instead of spending iterations on them again.
+
+Entries expire after SESSION_TTL_S and the least recently used ones are
+evicted past SESSION_STORE_SIZE_MB. Backed by diskcache, so worker processes
+can share one store: each origin is written as a whole, the last run to
+finish wins. Without specific origins to seed, only the SESSION_SEED_ORIGINS
+most recently saved ones are, so seeding doesn't slow down as the store grows.
+"""
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from urllib.parse import urlsplit
+
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR", ".cache/sessions")
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", 24 * 3600))
+SESSION_STORE_SIZE_MB = int(os.getenv("SESSION_STORE_SIZE_MB", 64))
+SESSION_SEED_ORIGINS = int(os.getenv("SESSION_SEED_ORIGINS", 20))
+
+# Key of the most recently saved origins, newest first. Entries all expire
+# SESSION_TTL_S after they were saved, so the ones that are gone are the
+# oldest, and they are dropped whenever the list is read
+_RECENT_KEY = "_recent"
+
+
+def origin_of(url: str) -> Optional[str]:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def track_origins(context) -> Set[str]:
+    """The origins a context navigates to (sync or async), kept up to date in the returned set."""
+    origins: Set[str] = set()
+
+    def on_request(request) -> None:
+        if request.is_navigation_request():
+            origin = origin_of(request.url)
+            if origin:
+                origins.add(origin)
+
+    context.on("request", on_request)
+    return origins
+
+
+def _cookie_matches(cookie: dict, host: str) -> bool:
+    domain = cookie["domain"].lstrip(".")
+    return host == domain or host.endswith("." + domain)
+
+
+class SessionStore:
+    """Storage states by origin, saved from finished runs and merged to seed new contexts."""
+
+    def __init__(
+        self,
+        directory: str = SESSION_STORE_DIR,
+        ttl_s: int = SESSION_TTL_S,
+        size_limit_mb: int = SESSION_STORE_SIZE_MB,
+        seed_origins: int = SESSION_SEED_ORIGINS,
+    ):
+        self.cache = diskcache.Cache(
+            directory, size_limit=size_limit_mb * 2**20, eviction_policy="least-recently-used"
+        )
+        self.ttl_s = ttl_s
+        self.seed_origins = seed_origins
+        self.seeded = 0
+        self.saved = 0
+
+    def _recent(self) -> List[str]:
+        """The most recently saved origins still in the store (not expired or evicted), newest first."""
+        # `in` checks the expiry without counting as an access
+        return [origin for origin in self.cache.get(_RECENT_KEY, []) if origin in self.cache]
+
+    def storage_state(self, origins: Optional[Iterable[str]] = None) -> dict:
+        """
+        A storage_state for browser.new_context, with the sessions of the given
+        origins, or of the seed_origins most recently saved ones. Cookies that
+        expired since are left out.
+        """
+        if origins is None:
+            origins = self._recent()[: self.seed_origins]
+        now = time.time()
+        cookies: Dict[tuple, dict] = {}
+        storages = []
+        for origin in origins:
+            entry = self.cache.get(origin)
+            if entry is None:
+                continue
+            self.seeded += 1
+            for cookie in entry["cookies"]:
+                # Session cookies have expires -1
+                if 0 <= cookie.get("expires", -1) < now:
+                    continue
+                cookies[(cookie["name"], cookie["domain"], cookie["path"])] = cookie
+            if entry["storage"] is not None:
+                storages.append(entry["storage"])
+        return {"cookies": list(cookies.values()), "origins": storages}
+
+    def save(self, state: dict, origins: Iterable[str]) -> int:
+        """
+        Stores the session of each origin from a context's storage_state
+        (taken with indexed_db=True), replacing what was there. Returns how
+        many origins had something to store.
+        """
+        storages = {storage["origin"]: storage for storage in state.get("origins", [])}
+        saved = []
+        for origin in set(origins) | set(storages):
+            host = urlsplit(origin).hostname or ""
+            cookies = [cookie for cookie in state.get("cookies", []) if _cookie_matches(cookie, host)]
+            storage = storages.get(origin)
+            if not cookies and storage is None:
+                continue
+            entry = {"cookies": cookies, "storage": storage, "saved_at": time.time()}
+            self.cache.set(origin, entry, expire=self.ttl_s)
+            saved.append(origin)
+        if saved:
+            with self.cache.transact():
+                recent = [origin for origin in self._recent() if origin not in saved]
+                self.cache.set(_RECENT_KEY, (saved + recent)[: self.seed_origins])
+        self.saved += len(saved)
+        logger.info(f"Saved the sessions of {len(saved)} origins")
+        return len(saved)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        # Expired entries stay on disk until culled, drop them so they aren't counted
+        self.cache.expire()
+        origins = len(self.cache) - (_RECENT_KEY in self.cache)
+        return {"origins": origins, "seeded": self.seeded, "saved": self.saved}
+
+    def close(self) -> None:
+        self.cache.close()
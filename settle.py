@@ -0,0 +1,225 @@
+import logging
+import os
+import statistics
+import time
+import weakref
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from playwright.async_api import Page as AsyncPage
+from playwright.sync_api import Error as PlaywrightError, Frame, Page, Request
+
+from browser_state import SNAPSHOT_JS, snapshot_options
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for a single settle, and how long the DOM must stay unchanged to count as stable
+SETTLE_TIMEOUT_MS = int(os.getenv("SETTLE_TIMEOUT_MS", 3000))
+SETTLE_QUIET_MS = int(os.getenv("SETTLE_QUIET_MS", 250))
+# Requests running for longer than this (long-polling, streaming) don't hold the page back
+STALE_REQUEST_MS = 2000
+TRACKED_RESOURCE_TYPES = frozenset(["document", "xhr", "fetch", "script"])
+
+# Resolves once no DOM mutation happened for quietMs, or after timeoutMs at the
+# latest. Given snapshot options and the snapshot function, it also snapshots
+# the page once, halfway through the first quiet period that lasts that long,
+# and leaves it in window.__sbu.settled: if the window ends quiet, the page is
+# still as that snapshot saw it (prefetch.py checks the dirty flag).
+QUIET_WINDOW_JS = r"""
+([quietMs, timeoutMs, snapshotOptions], snapshot) => new Promise((resolve) => {
+  const start = performance.now();
+  let quietTimer;
+  let hardTimer;
+  let snapshotTimer;
+  let snapshotted = false;
+  const speculate = () => {
+    if (!snapshot || snapshotted) return;
+    clearTimeout(snapshotTimer);
+    snapshotTimer = setTimeout(() => {
+      snapshotted = true;
+      const settled = snapshot(snapshotOptions);
+      window.__sbu.settled = settled;
+    }, quietMs / 2);
+  };
+  const observer = new MutationObserver(() => {
+    clearTimeout(quietTimer);
+    quietTimer = setTimeout(() => done(true), quietMs);
+    speculate();
+  });
+  const done = (quiet) => {
+    observer.disconnect();
+    clearTimeout(quietTimer);
+    clearTimeout(hardTimer);
+    clearTimeout(snapshotTimer);
+    resolve({ quiet, snapshotted, elapsed: performance.now() - start });
+  };
+  observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+  quietTimer = setTimeout(() => done(true), quietMs);
+  hardTimer = setTimeout(() => done(false), timeoutMs);
+  speculate();
+})
+"""
+
+# QUIET_WINDOW_JS with SNAPSHOT_JS passed in, so it works on a document that
+# was never snapshotted (after a navigation) without evaluating code in the page
+SPECULATIVE_QUIET_WINDOW_JS = f"(args) => ({QUIET_WINDOW_JS})(args, {SNAPSHOT_JS})"
+
+
+class _NetworkWatcher:
+    """Counts in-flight requests that can still change the page."""
+
+    def __init__(self, page: Page):
+        # request -> (start time, is a main-frame navigation)
+        self.inflight: Dict[Request, Tuple[float, bool]] = {}
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+        page.on("framenavigated", self._on_navigated)
+
+    def _on_request(self, request: Request) -> None:
+        if request.resource_type not in TRACKED_RESOURCE_TYPES:
+            return
+        try:
+            navigation = request.is_navigation_request() and request.frame.parent_frame is None
+        except PlaywrightError:
+            # Service worker requests have no frame
+            navigation = False
+        self.inflight[request] = (time.perf_counter(), navigation)
+
+    def _on_done(self, request: Request) -> None:
+        self.inflight.pop(request, None)
+
+    def _on_navigated(self, frame: Frame) -> None:
+        # Once the main frame committed, its document request is no longer a pending navigation
+        if frame.parent_frame is None:
+            self.inflight = {request: (started, False) for request, (started, _) in self.inflight.items()}
+
+    def busy(self) -> bool:
+        cutoff = time.perf_counter() - STALE_REQUEST_MS / 1000
+        return any(started > cutoff for started, _ in self.inflight.values())
+
+    def navigating(self) -> bool:
+        return any(navigation for _, navigation in self.inflight.values())
+
+
+_watchers: "weakref.WeakKeyDictionary[Page, _NetworkWatcher]" = weakref.WeakKeyDictionary()
+
+# action name -> settle latencies in ms
+settle_latencies: Dict[str, List[float]] = defaultdict(list)
+
+
+def watch(page: Page) -> None:
+    """
+    Starts tracking the page's requests. Called lazily by wait_for_settle, call
+    it right after creating a page to also see the requests of the first load.
+    """
+    if page not in _watchers:
+        _watchers[page] = _NetworkWatcher(page)
+
+
+def _record(action: str, start: float, settled: bool) -> float:
+    elapsed = (time.perf_counter() - start) * 1000
+    settle_latencies[action].append(elapsed)
+    tracing.record("settle", start, action=action, settled=settled)
+    logger.info(f"settle[{action}] {elapsed:.0f}ms{'' if settled else ' (timed out)'}")
+    return elapsed
+
+
+def _quiet_window(quiet_ms: int, remaining_ms: float, speculate: bool) -> tuple:
+    """The script and argument to evaluate for one quiet window."""
+    if speculate:
+        return SPECULATIVE_QUIET_WINDOW_JS, [quiet_ms, max(remaining_ms, 0), snapshot_options()]
+    return QUIET_WINDOW_JS, [quiet_ms, max(remaining_ms, 0)]
+
+
+def wait_for_settle(
+    page: Page,
+    action: str = "",
+    timeout_ms: Optional[int] = None,
+    quiet_ms: Optional[int] = None,
+    speculate: bool = False,
+) -> float:
+    """
+    Returns as soon as the page is stable: no pending main-frame navigation,
+    DOM content loaded, no tracked requests in flight and no DOM mutations for
+    quiet_ms. Gives up after timeout_ms. Returns the settle latency in ms.
+
+    With speculate, the page is snapshotted once during a quiet window, for
+    the snapshot that follows to reuse (see prefetch.py).
+    """
+    timeout_ms = SETTLE_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    quiet_ms = SETTLE_QUIET_MS if quiet_ms is None else quiet_ms
+    watch(page)
+    watcher = _watchers[page]
+
+    start = time.perf_counter()
+    deadline = start + timeout_ms / 1000
+    settled = False
+    while not settled:
+        remaining = (deadline - time.perf_counter()) * 1000
+        if remaining <= 0:
+            break
+        try:
+            if watcher.navigating():
+                page.wait_for_event("framenavigated", timeout=remaining)
+                continue
+            page.wait_for_load_state("domcontentloaded", timeout=remaining)
+            remaining = (deadline - time.perf_counter()) * 1000
+            # One speculative snapshot per settle at most, and none while
+            # requests that can still change the page are in flight
+            result = page.evaluate(*_quiet_window(quiet_ms, remaining, speculate and not watcher.busy()))
+            speculate = speculate and not result["snapshotted"]
+            settled = result["quiet"] and not watcher.busy()
+        except PlaywrightError:
+            # Timed out, or the execution context was destroyed by a navigation
+            # that started during the quiet window: check again on the new document
+            continue
+    return _record(action, start, settled)
+
+
+async def async_wait_for_settle(
+    page: AsyncPage,
+    action: str = "",
+    timeout_ms: Optional[int] = None,
+    quiet_ms: Optional[int] = None,
+    speculate: bool = False,
+) -> float:
+    """Async version of wait_for_settle."""
+    timeout_ms = SETTLE_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    quiet_ms = SETTLE_QUIET_MS if quiet_ms is None else quiet_ms
+    watch(page)
+    watcher = _watchers[page]
+
+    start = time.perf_counter()
+    deadline = start + timeout_ms / 1000
+    settled = False
+    while not settled:
+        remaining = (deadline - time.perf_counter()) * 1000
+        if remaining <= 0:
+            break
+        try:
+            if watcher.navigating():
+                await page.wait_for_event("framenavigated", timeout=remaining)
+                continue
+            await page.wait_for_load_state("domcontentloaded", timeout=remaining)
+            remaining = (deadline - time.perf_counter()) * 1000
+            result = await page.evaluate(*_quiet_window(quiet_ms, remaining, speculate and not watcher.busy()))
+            speculate = speculate and not result["snapshotted"]
+            settled = result["quiet"] and not watcher.busy()
+        except PlaywrightError:
+            continue
+    return _record(action, start, settled)
+
+
+def settle_summary() -> Dict[str, dict]:
+    """Per-action settle latency stats, to tune SETTLE_QUIET_MS / SETTLE_TIMEOUT_MS."""
+    summary = {}
+    for action, latencies in settle_latencies.items():
+        ordered = sorted(latencies)
+        summary[action] = {
+            "count": len(ordered),
+            "p50_ms": round(statistics.median(ordered), 1),
+            "p95_ms": round(tracing.percentile(ordered, 0.95), 1),
+            "max_ms": round(ordered[-1], 1),
+        }
+    return summary
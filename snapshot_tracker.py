@@ -0,0 +1,159 @@
+import weakref
+from typing import Dict, Any, List, Optional, Tuple
+from playwright.sync_api import Page
+
+from browser_state import (
+    describe_node,
+    serialize_footer,
+    serialize_metadata,
+    serialize_snapshot,
+)
+from observation import ObservationCompressor, count_tokens
+import tracing
+
+# First line of every diff snapshot, so consumers can tell diffs from full snapshots
+DIFF_HEADER = "snapshot: diff since previous step"
+
+_FIELDS = ("role", "name", "value", "description", "placeholder")
+
+
+def is_diff_snapshot(snapshot: Any) -> bool:
+    return isinstance(snapshot, str) and snapshot.startswith(DIFF_HEADER)
+
+
+def _index(nodes: List[Dict[str, Any]]) -> Dict[str, Tuple[tuple, Optional[str]]]:
+    """
+    Maps ref -> (node signature, parent ref). Parents are tracked with a stack
+    of refs by depth, in the same single pass over the flat node list.
+    """
+    index = {}
+    parents: List[str] = []
+    for node in nodes:
+        depth = node["depth"]
+        del parents[depth:]
+        signature = tuple(node.get(field) for field in _FIELDS) + tuple(node.get("states", ()))
+        index[node["ref"]] = (signature, parents[-1] if parents else None)
+        parents.append(node["ref"])
+    return index
+
+
+class SnapshotTracker:
+    """
+    Remembers the last snapshot taken of a page and renders the next one as a
+    structural diff (added, removed and changed nodes keyed by ref) while the
+    page stays on the same document and URL. Falls back to a full snapshot
+    after navigation, or when the diff would not be meaningfully smaller.
+
+    With a compressor, full snapshots are fitted into its token budget, and a
+    diff over budget is replaced by a compressed full snapshot.
+    """
+
+    def __init__(self, max_diff_ratio: float = 0.5, compressor: Optional[ObservationCompressor] = None):
+        self.max_diff_ratio = max_diff_ratio
+        self.compressor = compressor
+        self.previous: Optional[Dict[str, Any]] = None
+        self.previous_index: Dict[str, Tuple[tuple, Optional[str]]] = {}
+        self.previous_onscreen: set = set()
+
+    def _full(self, snapshot: Dict[str, Any], viewport: Optional[dict]) -> str:
+        if self.compressor is None:
+            return serialize_snapshot(snapshot, viewport)
+        return self.compressor.compress(snapshot, viewport)
+
+    def reset(self) -> None:
+        self.previous = None
+        self.previous_index = {}
+        self.previous_onscreen = set()
+
+    def render(self, snapshot: Dict[str, Any], viewport: Optional[dict] = None, full: bool = False) -> str:
+        previous, previous_index = self.previous, self.previous_index
+        previous_onscreen = self.previous_onscreen
+        index = _index(snapshot["nodes"])
+        onscreen = {node["ref"] for node in snapshot["nodes"] if not node.get("offscreen")}
+        self.previous, self.previous_index, self.previous_onscreen = snapshot, index, onscreen
+
+        if (
+            full
+            or previous is None
+            or previous["url"] != snapshot["url"]
+            or previous["documentId"] != snapshot["documentId"]
+            # The last full snapshot only showed the viewport, and the viewport moved
+            or (self.compressor is not None and self.compressor.paged and onscreen != previous_onscreen)
+        ):
+            return self._full(snapshot, viewport)
+
+        added = [node for node in snapshot["nodes"] if node["ref"] not in previous_index]
+        changed = [
+            node
+            for node in snapshot["nodes"]
+            if node["ref"] in previous_index and previous_index[node["ref"]] != index[node["ref"]]
+        ]
+        removed = [
+            node
+            for node in previous["nodes"]
+            if node["ref"] not in index and previous_index[node["ref"]][1] in index
+        ]
+        n_changes = len(added) + len(changed) + len(removed)
+        if n_changes > self.max_diff_ratio * len(snapshot["nodes"]):
+            return self._full(snapshot, viewport)
+
+        yaml_lines = [DIFF_HEADER]
+        yaml_lines.extend(serialize_metadata(snapshot, viewport))
+        if not n_changes:
+            yaml_lines.append("changes: none")
+        if added:
+            yaml_lines.append("added:")
+            # Added subtrees are indented under their first added ancestor, which
+            # names the existing node it was inserted into
+            anchors: Dict[str, int] = {}
+            for node in added:
+                parent = index[node["ref"]][1]
+                if parent in anchors:
+                    level = anchors[parent] + 1
+                    yaml_lines.append(f"{'  ' * level}- {describe_node(node)}")
+                else:
+                    level = 1
+                    yaml_lines.append(f"  - {describe_node(node)} (in {parent})")
+                anchors[node["ref"]] = level
+        if changed:
+            yaml_lines.append("changed:")
+            for node in changed:
+                yaml_lines.append(f"  - {describe_node(node)}")
+        if removed:
+            # Only the top-most removed nodes are listed; their subtrees are gone too
+            yaml_lines.append("removed:")
+            for node in removed:
+                yaml_lines.append(f"  - {describe_node(node)}")
+        yaml_lines.extend(serialize_footer(snapshot))
+        diff = "\n".join(yaml_lines)
+        if self.compressor is not None:
+            if self.compressor.record(snapshot, viewport, diff, kind="diff") > self.compressor.token_budget:
+                return self._full(snapshot, viewport)
+        return diff
+
+
+_trackers: "weakref.WeakKeyDictionary[Page, SnapshotTracker]" = weakref.WeakKeyDictionary()
+
+
+def get_tracker(page: Page) -> SnapshotTracker:
+    tracker = _trackers.get(page)
+    if tracker is None:
+        tracker = _trackers[page] = SnapshotTracker(compressor=ObservationCompressor())
+    return tracker
+
+
+def render_state(page, snapshot: Dict[str, Any], full: bool = False) -> dict:
+    """The new_state returned by the actions, rendered by the page's tracker."""
+    with tracing.span("render") as span:
+        tracker = get_tracker(page)
+        rendered = tracker.render(snapshot, page.viewport_size, full=full)
+        if span is not None:
+            compressor = tracker.compressor
+            span.update(
+                url=snapshot["url"],
+                nodes=len(snapshot["nodes"]),
+                diff=is_diff_snapshot(rendered),
+                bytes=len(rendered.encode()),
+                tokens=compressor.count(rendered) if compressor is not None else count_tokens(rendered),
+            )
+    return {"snapshot": rendered, "url": snapshot["url"], "title": snapshot["title"]}
@@ -0,0 +1,145 @@
+"""
+Tabs for the agent. Every tab keeps the last snapshot taken of it (in its
+SnapshotTracker), and the snapshot script leaves a dirty flag in the page
+that the first DOM change after it flips. Switching back to a tab whose URL
+and DOM didn't change re-renders the cached snapshot without touching the
+page beyond reading that flag, instead of reloading it and taking a new one.
+"""
+import logging
+from typing import Dict, List, Optional
+
+from playwright.sync_api import Page
+
+import actions
+from browser_state import IS_STALE_JS
+import settle
+from snapshot_tracker import get_tracker, render_state
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class _TabRegistry:
+    """Tab ids and the current tab, shared by Tabs and async_tabs.AsyncTabs."""
+
+    def __init__(self, page):
+        self.context = page.context
+        self._ids: Dict[object, str] = {}
+        self._next_id = 1
+        self._current = page
+        # Tabs the site opened itself (target=_blank, window.open), not yet shown
+        self._opened: List[object] = []
+        self._creating = False
+        self.hits = 0
+        self.misses = 0
+        self._add(page)
+        self.context.on("page", self._on_page)
+
+    def _add(self, page) -> str:
+        if page not in self._ids:
+            self._ids[page] = f"t{self._next_id}"
+            self._next_id += 1
+            settle.watch(page)
+            page.on("close", self._forget)
+        return self._ids[page]
+
+    def _on_page(self, page) -> None:
+        if not self._creating and page not in self._ids:
+            self._opened.append(page)
+        self._add(page)
+
+    def _forget(self, page) -> None:
+        self._ids.pop(page, None)
+        if page in self._opened:
+            self._opened.remove(page)
+
+    @property
+    def page(self):
+        """The current tab. Falls back to the last open tab if the site closed it."""
+        if self._current.is_closed() and self._ids:
+            self._current = list(self._ids)[-1]
+        return self._current
+
+    def id_of(self, page) -> str:
+        return self._ids[page]
+
+    def _get(self, tab_id: str):
+        for page, id_ in self._ids.items():
+            if id_ == tab_id:
+                return page
+        raise ValueError(f"Tab '{tab_id}' doesn't exist, open tabs: {', '.join(self._ids.values())}")
+
+    def take_opened(self):
+        """The latest tab opened by the site since the last call, if any."""
+        opened, self._opened = self._opened, []
+        return opened[-1] if opened else None
+
+    def _cached(self, page) -> Optional[dict]:
+        previous = get_tracker(page).previous
+        if previous is None or previous["url"] != page.url:
+            return None
+        return previous
+
+    def _describe(self, page, title: str) -> str:
+        marker = " (current)" if page is self._current else ""
+        return f"{self._ids[page]}{marker}: {title!r} {page.url}"
+
+    def detach(self) -> None:
+        """Stops tracking the context's new pages, before it is reused for another task."""
+        self.context.remove_listener("page", self._on_page)
+
+    def stats(self) -> dict:
+        return {"tabs": len(self._ids), "cached_switches": self.hits, "fresh_switches": self.misses}
+
+
+class Tabs(_TabRegistry):
+    """Tabs of a sync page's context. The tools act on tabs.page."""
+
+    def _state(self, page: Page) -> dict:
+        with tracing.span("tab_state"):
+            cached = self._cached(page)
+            if cached is not None and not page.evaluate(IS_STALE_JS):
+                self.hits += 1
+                tracing.annotate(cached=True)
+                # Full, the agent may no longer have this tab's earlier snapshots
+                return render_state(page, cached, full=True)
+            self.misses += 1
+            tracing.annotate(cached=False)
+            get_tracker(page).reset()
+            return actions._get_browser_state(page, wait=True, action="switch_tab")
+
+    def new_tab(self, url: Optional[str] = None) -> dict:
+        self._creating = True
+        try:
+            page = self.context.new_page()
+        finally:
+            self._creating = False
+        self._add(page)
+        self._current = page
+        if url:
+            return actions.go_to(page, url)
+        return actions._get_browser_state(page, action="new_tab")
+
+    def switch_tab(self, tab_id: str) -> dict:
+        page = self._get(tab_id)
+        self._current = page
+        page.bring_to_front()
+        return self._state(page)
+
+    def list_tabs(self) -> str:
+        lines = []
+        for page in list(self._ids):
+            cached = self._cached(page)
+            lines.append(self._describe(page, cached["title"] if cached else page.title()))
+        return "\n".join(lines)
+
+    def close_tab(self, tab_id: str) -> dict:
+        page = self._get(tab_id)
+        page.close()
+        self._forget(page)
+        if not self._ids:
+            return self.new_tab()
+        if page is self._current:
+            self._current = list(self._ids)[-1]
+            self._current.bring_to_front()
+        return self._state(self._current)
@@ -0,0 +1,214 @@
+"""
+Timing spans for the agent loop. A Tracer collects one span per phase of
+every iteration (step, lm, tool, settle, snapshot, render, screenshot), with
+the step index and whatever attributes the phase adds (tool name, snapshot
+bytes and tokens, retry counts).
+
+Spans nest: each span knows its parent and its self time (duration minus
+its children), so the self time of a tool span is the Playwright action
+itself. Tracing is off unless a tracer is active in the current context
+(thread or asyncio task), in which case span() is a no-op.
+
+    python -m tracing traces/*.jsonl
+
+summarizes many exported runs to find the hot paths.
+"""
+import argparse
+import contextvars
+import glob
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+_tracer: contextvars.ContextVar[Optional["Tracer"]] = contextvars.ContextVar("tracer", default=None)
+_parent: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("span", default=None)
+
+
+class Tracer:
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.spans: List[dict] = []
+        self.step: Optional[int] = None
+        self._origin = time.perf_counter()
+        self._next_id = 0
+
+    def _open(self, name: str, start: float, attrs: dict) -> dict:
+        self._next_id += 1
+        parent = _parent.get()
+        return {
+            "id": self._next_id,
+            "parent": parent["id"] if parent else None,
+            "name": name,
+            "step": self.step,
+            "start_ms": (start - self._origin) * 1000,
+            "children_ms": 0.0,
+            "thread": threading.get_ident(),
+            **attrs,
+        }
+
+    def _close(self, span: dict, end: float) -> None:
+        span["dur_ms"] = round((end - self._origin) * 1000 - span["start_ms"], 3)
+        span["self_ms"] = round(span["dur_ms"] - span.pop("children_ms"), 3)
+        span["start_ms"] = round(span["start_ms"], 3)
+        parent = _parent.get()
+        if parent is not None:
+            parent["children_ms"] += span["dur_ms"]
+        self.spans.append(span)
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, "w") as f:
+            for span in self.spans:
+                f.write(json.dumps({"run": self.run_id, **span}, default=str) + "\n")
+
+    def export_chrome(self, path: str) -> None:
+        """Chrome trace-event format, for chrome://tracing or Perfetto."""
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": self.run_id}}]
+        for span in self.spans:
+            args = {k: v for k, v in span.items() if k not in ("start_ms", "dur_ms", "thread", "name")}
+            events.append(
+                {
+                    "name": _key(span),
+                    "ph": "X",
+                    "ts": span["start_ms"] * 1000,
+                    "dur": span["dur_ms"] * 1000,
+                    "pid": 1,
+                    "tid": span["thread"],
+                    "args": args,
+                }
+            )
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f, default=str)
+
+    def export(self, path: str) -> None:
+        """Exports as Chrome trace events for .json, JSONL otherwise."""
+        if os.path.splitext(path)[1] == ".json":
+            self.export_chrome(path)
+        else:
+            self.export_jsonl(path)
+
+    def summary(self) -> Dict[str, dict]:
+        return summarize(self.spans)
+
+
+def _key(span: dict) -> str:
+    return span["name"] if span.get("tool") is None else f"{span['name']}:{span['tool']}"
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """The nearest-rank q-th percentile (0 < q <= 1) of values, which must not be empty."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * q) - 1)]
+
+
+def summarize(spans: Iterable[dict]) -> Dict[str, dict]:
+    """Per phase (and per tool) count, total/p50/p95 duration and total self time, slowest first."""
+    durations: Dict[str, List[float]] = defaultdict(list)
+    self_ms: Dict[str, float] = defaultdict(float)
+    for span in spans:
+        durations[_key(span)].append(span["dur_ms"])
+        self_ms[_key(span)] += span["self_ms"]
+    summary = {}
+    for key, values in sorted(durations.items(), key=lambda item: -self_ms[item[0]]):
+        ordered = sorted(values)
+        summary[key] = {
+            "count": len(ordered),
+            "total_ms": round(sum(ordered), 1),
+            "self_ms": round(self_ms[key], 1),
+            "p50_ms": round(statistics.median(ordered), 1),
+            "p95_ms": round(percentile(ordered, 0.95), 1),
+            "max_ms": round(ordered[-1], 1),
+        }
+    return summary
+
+
+@contextmanager
+def trace(run_id: str) -> Iterator[Tracer]:
+    """Activates a tracer for the current thread or asyncio task."""
+    tracer = Tracer(run_id)
+    token = _tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _tracer.reset(token)
+
+
+def active() -> bool:
+    return _tracer.get() is not None
+
+
+def set_step(step: Optional[int]) -> None:
+    """Tags the spans that follow with the iteration they belong to."""
+    tracer = _tracer.get()
+    if tracer is not None:
+        tracer.step = step
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Optional[dict]]:
+    """
+    Times the block as a span. Yields the span dict (None when not tracing),
+    so attributes only known at the end can still be added.
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        yield None
+        return
+    current = tracer._open(name, time.perf_counter(), attrs)
+    token = _parent.set(current)
+    try:
+        yield current
+    finally:
+        _parent.reset(token)
+        tracer._close(current, time.perf_counter())
+
+
+def record(name: str, start: float, end: Optional[float] = None, **attrs) -> None:
+    """Adds a span for an interval that was already timed (perf_counter values)."""
+    tracer = _tracer.get()
+    if tracer is not None:
+        tracer._close(tracer._open(name, start, attrs), end or time.perf_counter())
+
+
+def annotate(**attrs) -> None:
+    """Sets attributes on the innermost open span."""
+    current = _parent.get()
+    if current is not None and _tracer.get() is not None:
+        current.update(attrs)
+
+
+def increment(attr: str, by: int = 1) -> None:
+    """Counts retries and the like on the innermost open span."""
+    current = _parent.get()
+    if current is not None and _tracer.get() is not None:
+        current[attr] = current.get(attr, 0) + by
+
+
+def _load(paths: Iterable[str]) -> Iterator[dict]:
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize JSONL traces of many runs.")
+    parser.add_argument("paths", nargs="+", help="JSONL trace files or globs.")
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern)) or [pattern]]
+    spans = list(_load(paths))
+    runs = len({span["run"] for span in spans})
+    print(f"{runs} runs, {len(spans)} spans")
+    print(f"{'phase':<28} {'count':>7} {'self s':>9} {'total s':>9} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for key, stats in summarize(spans).items():
+        print(
+            f"{key:<28} {stats['count']:>7} {stats['self_ms'] / 1000:>9.2f} {stats['total_ms'] / 1000:>9.2f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['max_ms']:>8.1f}"
+        )
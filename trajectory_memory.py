@@ -0,0 +1,137 @@
+import logging
+import os
+from typing import Any, Dict, List
+
+from observation import count_tokens
+from snapshot_tracker import is_diff_snapshot
+
+logger = logging.getLogger(__name__)
+
+TRAJECTORY_TOKEN_BUDGET = int(os.getenv("TRAJECTORY_TOKEN_BUDGET", 32000))
+
+
+def _shorten(text: Any, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _snapshot_of(observation):
+    try:
+        return observation["new_state"]["snapshot"]
+    except (TypeError, KeyError):
+        return None
+
+
+def _without_snapshot(observation):
+    return {
+        **observation,
+        "new_state": {**observation["new_state"], "snapshot": "truncated"},
+    }
+
+
+def _summarize(idx: int, thought, tool_name, tool_args, observation) -> str:
+    """One line per step: what the agent meant to do, what it did, and where it ended up."""
+    args = ", ".join(f"{key}={_shorten(repr(value), 80)}" for key, value in (tool_args or {}).items())
+    if _snapshot_of(observation) is not None:
+        state = observation["new_state"]
+        outcome = f"{observation.get('result', '')} on {state.get('title')!r} ({state.get('url')})"
+    else:
+        outcome = _shorten(observation, 160)
+    return f"{idx}. {_shorten(thought, 160)} -> {tool_name}({args}) -> {outcome}"
+
+
+class _Step:
+    __slots__ = ("idx", "keys", "values", "is_diff", "base", "summary", "tokens", "tokens_stale", "tokens_summary")
+
+    def __init__(self, idx: int, trajectory: Dict[str, Any], base: int):
+        self.idx = idx
+        self.keys = [f"thought_{idx}", f"tool_name_{idx}", f"tool_args_{idx}", f"observation_{idx}"]
+        self.values = [trajectory.get(key) for key in self.keys]
+        observation = self.values[3]
+        snapshot = _snapshot_of(observation)
+        self.is_diff = is_diff_snapshot(snapshot)
+        # Index of the step holding the full snapshot this step's diff builds on
+        self.base = base
+        self.summary = _summarize(idx, *self.values)
+        rest = count_tokens("\n".join(str(value) for value in self.values[:3]))
+        self.tokens = rest + count_tokens(str(observation))
+        self.tokens_stale = (
+            rest + count_tokens(str(_without_snapshot(observation))) if snapshot is not None else self.tokens
+        )
+        self.tokens_summary = count_tokens(self.summary) + 1
+
+
+class TrajectoryMemory:
+    """
+    Decides what of the trajectory goes into each prompt. The last keep_full
+    steps are shown in full, extended back to the full snapshot their diffs
+    build on; older steps are folded into a one-line-per-step log. The result
+    is kept under a hard token ceiling: the oldest full steps are folded first,
+    then the oldest log lines are dropped.
+
+    Steps are measured and summarized once, when they are first seen, so each
+    prompt costs O(steps) small integer sums instead of re-walking every
+    observation.
+    """
+
+    def __init__(self, keep_full: int = 3, max_tokens: int = TRAJECTORY_TOKEN_BUDGET):
+        self.keep_full = keep_full
+        self.max_tokens = max_tokens
+        self.reset()
+
+    def reset(self) -> None:
+        self.steps: List[_Step] = []
+        self.ceiling = self.max_tokens
+        self._last_full = 0
+
+    def _sync(self, trajectory: Dict[str, Any]) -> None:
+        while f"observation_{len(self.steps)}" in trajectory:
+            idx = len(self.steps)
+            step = _Step(idx, trajectory, self._last_full)
+            snapshot = _snapshot_of(step.values[3])
+            if snapshot not in (None, "truncated") and not step.is_diff:
+                self._last_full = step.base = idx
+            self.steps.append(step)
+
+    def shrink(self) -> None:
+        """Called when the prompt still exceeded the context window."""
+        self.ceiling = max(self.ceiling // 2, 1)
+        logger.warning(f"Context window exceeded, lowering the trajectory ceiling to {self.ceiling} tokens")
+
+    def view(self, trajectory: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the trajectory to format into the prompt."""
+        self._sync(trajectory)
+        steps = self.steps
+        if not steps:
+            return dict(trajectory)
+
+        # Diffs only make sense on top of the snapshot they were taken against
+        first_full = max(0, len(steps) - self.keep_full)
+        first_full = min([first_full] + [step.base for step in steps[first_full:] if step.is_diff])
+
+        def full_tokens(step: _Step) -> int:
+            return step.tokens if step.idx >= self._last_full else step.tokens_stale
+
+        first_log = 0
+        used = sum(step.tokens_summary for step in steps[:first_full])
+        used += sum(full_tokens(step) for step in steps[first_full:])
+        while used > self.ceiling and first_full < len(steps) - 1:
+            used += steps[first_full].tokens_summary - full_tokens(steps[first_full])
+            first_full += 1
+        while used > self.ceiling and first_log < first_full:
+            used -= steps[first_log].tokens_summary
+            first_log += 1
+
+        view: Dict[str, Any] = {}
+        if first_full:
+            log = [step.summary for step in steps[first_log:first_full]]
+            if first_log:
+                log.insert(0, f"({first_log} earlier steps omitted)")
+            view["earlier_steps"] = "\n".join(log)
+        for step in steps[first_full:]:
+            for key, value in zip(step.keys, step.values):
+                view[key] = value
+            # Snapshots taken before the latest full one are stale
+            if step.idx < self._last_full and _snapshot_of(step.values[3]) is not None:
+                view[step.keys[3]] = _without_snapshot(step.values[3])
+        return view
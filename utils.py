@@ -1,32 +1,4 @@
-import os
-import glob
-
-from PIL import Image, ImageDraw, ImageFont
-
-
-def _extract_action_from_filename(filename):
-    """
-    Extracts the action and extra info from the filename, and includes the step id in the prefix.
-    Examples:
-        '001_go_to_www.google.com.png' -> '001: go_to (www.google.com)'
-        '006_submit_input[name=\'query\'].png' -> '006: submit (input[name=\'query\'])'
-        '003_go_back.png' -> '003: go_back'
-    """
-    base = os.path.basename(filename)
-    name, _ = os.path.splitext(base)
-    # Split off the step id (should be 3 digits)
-    parts = name.split("_", 1)
-    if len(parts) == 2:
-        step_id = parts[0]
-        rest = parts[1]
-        # Split at the first underscore to separate action and extra info
-        if "_" in rest:
-            action, extra = rest.split("_", 1)
-            return f"{step_id}: {action} ({extra})"
-        else:
-            return f"{step_id}: {rest}"
-    else:
-        return name
+from PIL import ImageDraw, ImageFont
 
 
 def _get_font(size=24):
@@ -58,29 +30,3 @@ def _add_text_overlay(image, text):
     text_y = padding
     draw.text((text_x, text_y), text, font=font, fill=(255, 255, 255, 255))
     return image
-
-
-def create_gif(run_id: str):
-    frame_dir = f"frames/{run_id}"
-    frame_files = sorted(glob.glob(os.path.join(frame_dir, "*.png")))
-    if frame_files and Image is not None:
-        images = []
-        for f in frame_files:
-            img = Image.open(f).convert("RGBA")
-            action_text = _extract_action_from_filename(f)
-            img_with_text = _add_text_overlay(img, action_text)
-            # Convert back to RGB for GIF compatibility
-            images.append(img_with_text.convert("RGB"))
-        gif_path = os.path.join(frame_dir, "animation.gif")
-        images[0].save(
-            gif_path,
-            save_all=True,
-            append_images=images[1:],
-            duration=2000,
-            loop=0,
-        )
-        print(f"Saved animation gif to {gif_path}")
-    elif not frame_files:
-        print("No frames found to create gif.")
-    elif Image is None:
-        print("Pillow (PIL) is not installed, cannot create gif.")